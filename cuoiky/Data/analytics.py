@@ -0,0 +1,438 @@
+# ==================== analytics.py ====================
+"""
+Phân tích telemetry bằng NumPy (vector hóa, không vòng lặp Python theo dòng).
+
+- ``load_chunks()`` đọc log theo từng khối thành mảng NumPy. Với binlog
+  (``.bin``) mỗi khối là view trên mmap, không copy; với CSV phần tách chuỗi
+  vẫn chạy bằng Python, phần tính toán thì không.
+- Hàm trên mảng: ``rolling_mean_std``, ``dew_point``, ``heat_index``,
+  ``zscore_flags``, ``iqr_flags``.
+- ``DeviceSummary`` cộng dồn thống kê theo thiết bị qua các khối
+  (``np.bincount`` / ``ufunc.at``), kèm histogram để lấy tứ phân vị cho IQR.
+- ``analyze()`` chạy hai lượt: lượt 1 tính thống kê, lượt 2 đếm bất thường.
+
+Dòng lệnh:
+    python analytics.py iot_log.csv
+    python analytics.py iot_log.bin --chunk-rows 1000000 --z 3 --iqr-k 1.5
+    python analytics.py iot_log.bin --rolling 12 --device demo/room1
+"""
+
+import argparse
+import csv
+from typing import List, NamedTuple
+
+import numpy as np
+
+from records import parse_time
+
+CHUNK_ROWS = 1_000_000
+METRICS = ("temp", "hum")
+
+# Histogram cho tứ phân vị (IQR): độ phân giải 0.1 khớp độ phân giải cảm biến
+HIST_MIN = -50.0
+HIST_MAX = 150.0
+HIST_STEP = 0.1
+HIST_BINS = int(round((HIST_MAX - HIST_MIN) / HIST_STEP)) + 1
+
+
+class Chunk(NamedTuple):
+    """Một khối dữ liệu dạng cột. ``device`` là mã, tên nằm trong ``devices``."""
+    ts: np.ndarray       # float64, epoch giây
+    device: np.ndarray   # uint16
+    temp: np.ndarray     # float, NaN khi thiếu
+    hum: np.ndarray
+    devices: List[str]
+
+    def __len__(self):
+        return len(self.ts)
+
+
+# ---------- Đọc log theo khối ----------
+
+def _binlog_chunks(path, chunk_rows):
+    from binlog import DeviceTable, open_memmap
+
+    arr = open_memmap(path)
+    names = DeviceTable(path + ".devices").names or ["unknown"]
+    for start in range(0, len(arr), chunk_rows):
+        part = arr[start:start + chunk_rows]
+        yield Chunk(part["ts_ms"] / 1000.0, part["device"], part["temp"], part["hum"], names)
+
+
+def _to_float_array(values):
+    out = np.empty(len(values), dtype=np.float64)
+    for i, v in enumerate(values):
+        try:
+            out[i] = float(v) if v != "" else np.nan
+        except ValueError:
+            out[i] = np.nan
+    return out
+
+
+def _csv_block(times, codes, temps, hums, names):
+    stamps = np.array(times, dtype="datetime64[s]").astype(np.int64).astype(np.float64)
+    # Thời gian trong CSV là giờ địa phương: đổi sang epoch bằng độ lệch của dòng đầu
+    stamps += parse_time(times[0]) - stamps[0]
+    return Chunk(stamps, np.array(codes, dtype=np.uint16),
+                 _to_float_array(temps), _to_float_array(hums), list(names))
+
+
+def _csv_chunks(path, chunk_rows, device):
+    from segments import iter_log_files, open_text
+
+    # Mã thiết bị theo thứ tự gặp trong cột thứ 6; dòng định dạng cũ không có cột này nhận ``device``
+    codes_by_name = {}
+    names = []
+    times, codes, temps, hums = [], [], [], []
+    for part in iter_log_files(path):
+        with open_text(part) as f:
+            for row in csv.reader(f):
+                # Chỉ nhận dòng có thời gian dạng "YYYY-MM-DD HH:MM:SS" (bỏ header)
+                if len(row) < 3 or len(row[0]) != 19 or row[0][4] != "-":
+                    continue
+                name = row[5] if len(row) > 5 and row[5] else device
+                code = codes_by_name.get(name)
+                if code is None:
+                    code = codes_by_name[name] = len(names)
+                    names.append(name)
+                times.append(row[0])
+                codes.append(code)
+                temps.append(row[1])
+                hums.append(row[2])
+                if len(times) >= chunk_rows:
+                    yield _csv_block(times, codes, temps, hums, names)
+                    times, codes, temps, hums = [], [], [], []
+    if times:
+        yield _csv_block(times, codes, temps, hums, names)
+
+
+def load_chunks(path, chunk_rows=CHUNK_ROWS, device="unknown"):
+    """Sinh các ``Chunk`` tối đa ``chunk_rows`` dòng từ log CSV (mọi đoạn) hoặc binlog."""
+    if path.endswith(".bin"):
+        return _binlog_chunks(path, chunk_rows)
+    return _csv_chunks(path, chunk_rows, device)
+
+
+# ---------- Hàm vector hóa ----------
+
+def rolling_mean_std(values, window, carry=None):
+    """Trung bình và độ lệch chuẩn trượt (bỏ qua NaN) trên ``window`` mẫu.
+
+    Tính bằng tổng tích lũy nên O(n) bất kể ``window``. ``carry`` là
+    ``window - 1`` mẫu cuối của khối trước (để nối các khối liền mạch); hàm
+    trả về ``(mean, std, carry_mới)``. Vị trí chưa đủ mẫu nào cho NaN.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    head = np.empty(0) if carry is None else carry
+    x = np.concatenate([head, values])
+    valid = ~np.isnan(x)
+    filled = np.where(valid, x, 0.0)
+
+    def window_sum(a):
+        c = np.concatenate([[0.0], np.cumsum(a)])
+        lo = np.maximum(np.arange(1, len(a) + 1) - window, 0)
+        return c[1:] - c[lo]
+
+    n = window_sum(valid.astype(np.float64))
+    s = window_sum(filled)
+    ss = window_sum(filled * filled)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = s / n
+        var = np.maximum(ss / n - mean * mean, 0.0)
+    k = len(head)
+    new_carry = x[-(window - 1):] if window > 1 else np.empty(0)
+    return mean[k:], np.sqrt(var)[k:], new_carry
+
+
+def dew_point(temp, hum):
+    """Điểm sương (°C), công thức Magnus (a=17.62, b=243.12)."""
+    t = np.asarray(temp, dtype=np.float64)
+    rh = np.asarray(hum, dtype=np.float64)
+    a, b = 17.62, 243.12
+    with np.errstate(invalid="ignore", divide="ignore"):
+        gamma = np.log(np.where(rh > 0, rh, np.nan) / 100.0) + a * t / (b + t)
+        return b * gamma / (a - gamma)
+
+
+def heat_index(temp, hum):
+    """Chỉ số nóng bức (°C) theo công thức NOAA (hồi quy Rothfusz + hiệu chỉnh)."""
+    t = np.asarray(temp, dtype=np.float64) * 9 / 5 + 32
+    rh = np.asarray(hum, dtype=np.float64)
+    simple = 0.5 * (t + 61.0 + (t - 68.0) * 1.2 + rh * 0.094)
+    full = (-42.379 + 2.04901523 * t + 10.14333127 * rh - 0.22475541 * t * rh
+            - 6.83783e-3 * t * t - 5.481717e-2 * rh * rh + 1.22874e-3 * t * t * rh
+            + 8.5282e-4 * t * rh * rh - 1.99e-6 * t * t * rh * rh)
+    with np.errstate(invalid="ignore"):
+        dry = (rh < 13) & (t >= 80) & (t <= 112)
+        full = np.where(dry, full - (13 - rh) / 4 * np.sqrt(np.clip((17 - np.abs(t - 95)) / 17, 0, None)), full)
+        humid = (rh > 85) & (t >= 80) & (t <= 87)
+        full = np.where(humid, full + (rh - 85) / 10 * (87 - t) / 5, full)
+        hi = np.where((simple + t) / 2 >= 80, full, simple)
+    return (hi - 32) * 5 / 9
+
+
+def _group_stats(values, groups, ngroups):
+    valid = ~np.isnan(values)
+    g = groups[valid]
+    v = values[valid]
+    n = np.bincount(g, minlength=ngroups)
+    s = np.bincount(g, weights=v, minlength=ngroups)
+    ss = np.bincount(g, weights=v * v, minlength=ngroups)
+    return n, s, ss
+
+
+def zscore_flags(values, threshold=3.0, groups=None, mean=None, std=None):
+    """True tại các mẫu có |z| > ``threshold``.
+
+    ``groups`` (mã thiết bị) cho z-score riêng từng nhóm; ``mean``/``std``
+    (theo nhóm) cho phép dùng thống kê tính trước, ví dụ từ ``DeviceSummary``.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if groups is None:
+        groups = np.zeros(len(values), dtype=np.intp)
+    if mean is None or std is None:
+        ngroups = int(groups.max()) + 1 if len(groups) else 1
+        n, s, ss = _group_stats(values, groups, ngroups)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = s / n
+            std = np.sqrt(np.maximum(ss / n - mean * mean, 0.0))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = (values - mean[groups]) / std[groups]
+    return np.abs(z) > threshold
+
+
+def iqr_flags(values, k=1.5, groups=None, q1=None, q3=None, tolerance=0.0):
+    """True tại các mẫu nằm ngoài [Q1 - k*IQR, Q3 + k*IQR] (theo nhóm nếu có).
+
+    ``tolerance`` nới thêm hai biên, dùng khi Q1/Q3 là giá trị ước lượng.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if groups is None:
+        groups = np.zeros(len(values), dtype=np.intp)
+    if q1 is None or q3 is None:
+        ngroups = int(groups.max()) + 1 if len(groups) else 1
+        q1 = np.full(ngroups, np.nan)
+        q3 = np.full(ngroups, np.nan)
+        for g in np.unique(groups):
+            v = values[groups == g]
+            if np.any(~np.isnan(v)):
+                q1[g], q3[g] = np.nanpercentile(v, [25, 75])
+    iqr = q3 - q1
+    lo = (q1 - k * iqr - tolerance)[groups]
+    hi = (q3 + k * iqr + tolerance)[groups]
+    with np.errstate(invalid="ignore"):
+        return (values < lo) | (values > hi)
+
+
+# ---------- Tổng hợp theo thiết bị ----------
+
+class DeviceSummary:
+    """Cộng dồn thống kê theo thiết bị qua nhiều khối.
+
+    Với mỗi chỉ số (temp, hum, dew, heat): count, sum, sum bình phương, min,
+    max; với temp/hum thêm histogram bước ``HIST_STEP`` để ước lượng tứ phân vị.
+    """
+
+    FIELDS = ("temp", "hum", "dew", "heat")
+
+    def __init__(self):
+        self.ngroups = 0
+        self.names = []
+        self.rows = np.zeros(0, dtype=np.int64)
+        self.first_ts = np.zeros(0)
+        self.last_ts = np.zeros(0)
+        self.stats = {f: {"n": np.zeros(0), "s": np.zeros(0), "ss": np.zeros(0),
+                          "min": np.zeros(0), "max": np.zeros(0)} for f in self.FIELDS}
+        self.hist = {m: np.zeros((0, HIST_BINS), dtype=np.int64) for m in METRICS}
+
+    def _grow(self, ngroups):
+        extra = ngroups - self.ngroups
+        if extra <= 0:
+            return
+        pad = np.zeros(extra)
+        self.rows = np.concatenate([self.rows, np.zeros(extra, dtype=np.int64)])
+        self.first_ts = np.concatenate([self.first_ts, np.full(extra, np.inf)])
+        self.last_ts = np.concatenate([self.last_ts, np.full(extra, -np.inf)])
+        for st in self.stats.values():
+            for key in ("n", "s", "ss"):
+                st[key] = np.concatenate([st[key], pad])
+            st["min"] = np.concatenate([st["min"], np.full(extra, np.inf)])
+            st["max"] = np.concatenate([st["max"], np.full(extra, -np.inf)])
+        for m in METRICS:
+            self.hist[m] = np.vstack([self.hist[m], np.zeros((extra, HIST_BINS), dtype=np.int64)])
+        self.ngroups = ngroups
+
+    def update(self, chunk):
+        if not len(chunk):
+            return
+        self.names = chunk.devices
+        groups = chunk.device.astype(np.intp)
+        self._grow(max(len(chunk.devices), int(groups.max()) + 1))
+        self.rows += np.bincount(groups, minlength=self.ngroups)
+        np.minimum.at(self.first_ts, groups, chunk.ts)
+        np.maximum.at(self.last_ts, groups, chunk.ts)
+
+        temp = np.asarray(chunk.temp, dtype=np.float64)
+        hum = np.asarray(chunk.hum, dtype=np.float64)
+        columns = {"temp": temp, "hum": hum,
+                   "dew": dew_point(temp, hum), "heat": heat_index(temp, hum)}
+        for field, values in columns.items():
+            st = self.stats[field]
+            valid = ~np.isnan(values)
+            g, v = groups[valid], values[valid]
+            st["n"] += np.bincount(g, minlength=self.ngroups)
+            st["s"] += np.bincount(g, weights=v, minlength=self.ngroups)
+            st["ss"] += np.bincount(g, weights=v * v, minlength=self.ngroups)
+            np.minimum.at(st["min"], g, v)
+            np.maximum.at(st["max"], g, v)
+            if field in self.hist:
+                bins = np.clip(np.rint((v - HIST_MIN) / HIST_STEP).astype(np.intp), 0, HIST_BINS - 1)
+                flat = np.bincount(g * HIST_BINS + bins, minlength=self.ngroups * HIST_BINS)
+                self.hist[field] += flat.reshape(self.ngroups, HIST_BINS)
+
+    def mean_std(self, field):
+        st = self.stats[field]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = st["s"] / st["n"]
+            std = np.sqrt(np.maximum(st["ss"] / st["n"] - mean * mean, 0.0))
+        return mean, std
+
+    def quartiles(self, metric):
+        """(Q1, Q3) theo thiết bị, ước lượng từ histogram (sai số <= HIST_STEP)."""
+        hist = self.hist[metric]
+        cum = np.cumsum(hist, axis=1)
+        total = cum[:, -1:]
+        centers = HIST_MIN + np.arange(HIST_BINS) * HIST_STEP
+        out = []
+        for q in (0.25, 0.75):
+            idx = np.argmax(cum >= np.maximum(total * q, 1), axis=1)
+            out.append(np.where(total[:, 0] > 0, centers[idx], np.nan))
+        return out[0], out[1]
+
+
+class DeviceReport(NamedTuple):
+    device: str
+    rows: int
+    first_ts: float
+    last_ts: float
+    temp_mean: float
+    temp_min: float
+    temp_max: float
+    hum_mean: float
+    hum_min: float
+    hum_max: float
+    dew_mean: float
+    heat_max: float
+    z_anomalies: int
+    iqr_anomalies: int
+
+
+def analyze(path, chunk_rows=CHUNK_ROWS, z=3.0, iqr_k=1.5, device="unknown"):
+    """Thống kê và số mẫu bất thường (temp hoặc hum) theo thiết bị; hai lượt qua log."""
+    summary = DeviceSummary()
+    for chunk in load_chunks(path, chunk_rows, device):
+        summary.update(chunk)
+    if not summary.ngroups:
+        return []
+
+    stats = {m: summary.mean_std(m) for m in METRICS}
+    quart = {m: summary.quartiles(m) for m in METRICS}
+    z_count = np.zeros(summary.ngroups, dtype=np.int64)
+    iqr_count = np.zeros(summary.ngroups, dtype=np.int64)
+    for chunk in load_chunks(path, chunk_rows, device):
+        groups = chunk.device.astype(np.intp)
+        z_flag = np.zeros(len(chunk), dtype=bool)
+        iqr_flag = np.zeros(len(chunk), dtype=bool)
+        for m in METRICS:
+            values = getattr(chunk, m)
+            z_flag |= zscore_flags(values, z, groups, *stats[m])
+            # Tứ phân vị lấy từ histogram: nới biên nửa bước để bù lượng tử hóa
+            iqr_flag |= iqr_flags(values, iqr_k, groups, *quart[m], tolerance=HIST_STEP / 2)
+        z_count += np.bincount(groups[z_flag], minlength=summary.ngroups)
+        iqr_count += np.bincount(groups[iqr_flag], minlength=summary.ngroups)
+
+    st = summary.stats
+    means = {f: summary.mean_std(f)[0] for f in DeviceSummary.FIELDS}
+    reports = []
+    for g in np.flatnonzero(summary.rows):
+        reports.append(DeviceReport(
+            summary.names[g] if g < len(summary.names) else f"#{g}",
+            int(summary.rows[g]), float(summary.first_ts[g]), float(summary.last_ts[g]),
+            float(means["temp"][g]), float(st["temp"]["min"][g]), float(st["temp"]["max"][g]),
+            float(means["hum"][g]), float(st["hum"]["min"][g]), float(st["hum"]["max"][g]),
+            float(means["dew"][g]), float(st["heat"]["max"][g]),
+            int(z_count[g]), int(iqr_count[g])))
+    return reports
+
+
+def rolling(path, window, device=None, chunk_rows=CHUNK_ROWS, metric="temp"):
+    """(ts, giá trị, mean trượt, std trượt) của một thiết bị, nối liền qua các khối."""
+    parts = []
+    carry = None
+    for chunk in load_chunks(path, chunk_rows):
+        values = np.asarray(getattr(chunk, metric), dtype=np.float64)
+        ts = chunk.ts
+        if device is not None:
+            if device not in chunk.devices:
+                continue
+            mask = chunk.device == chunk.devices.index(device)
+            values, ts = values[mask], ts[mask]
+        mean, std, carry = rolling_mean_std(values, window, carry)
+        parts.append((ts, values, mean, std))
+    if not parts:
+        return tuple(np.empty(0) for _ in range(4))
+    return tuple(np.concatenate(cols) for cols in zip(*parts))
+
+
+def _fmt(value):
+    return "-" if value is None or not np.isfinite(value) else round(value, 2)
+
+
+def main(argv=None):
+    from datetime import datetime
+
+    from prettytable import PrettyTable
+
+    from records import TIME_FORMAT
+
+    parser = argparse.ArgumentParser(description="Phân tích log IoT bằng NumPy")
+    parser.add_argument("log", help="file log (.csv hoặc .bin)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="số dòng mỗi khối")
+    parser.add_argument("--z", type=float, default=3.0, help="ngưỡng |z-score| bất thường")
+    parser.add_argument("--iqr-k", type=float, default=1.5, help="hệ số k của quy tắc IQR")
+    parser.add_argument("--rolling", type=int, metavar="WINDOW",
+                        help="in mean/std trượt của nhiệt độ thay vì bảng tổng hợp")
+    parser.add_argument("--device", help="thiết bị cho --rolling")
+    parser.add_argument("-n", "--rows", type=int, default=10, help="số dòng cuối in với --rolling")
+    args = parser.parse_args(argv)
+
+    if args.rolling:
+        ts, values, mean, std = rolling(args.log, args.rolling, args.device, args.chunk_rows)
+        table = PrettyTable()
+        table.field_names = ["Thời gian", "Nhiệt độ (°C)", f"TB trượt ({args.rolling})", "Độ lệch chuẩn"]
+        for i in range(max(0, len(ts) - args.rows), len(ts)):
+            table.add_row([datetime.fromtimestamp(ts[i]).strftime(TIME_FORMAT),
+                           _fmt(values[i]), _fmt(mean[i]), _fmt(std[i])])
+        print(table)
+        return
+
+    reports = analyze(args.log, args.chunk_rows, args.z, args.iqr_k)
+    if not reports:
+        print("(Không có dữ liệu trong log)")
+        return
+    table = PrettyTable()
+    table.field_names = ["Thiết bị", "Số dòng", "Từ", "Đến", "T TB", "T min", "T max",
+                         "H TB", "H min", "H max", "Điểm sương TB", "Heat index max",
+                         f"BT z>{args.z}", f"BT IQR×{args.iqr_k}"]
+    for r in reports:
+        table.add_row([r.device, r.rows,
+                       datetime.fromtimestamp(r.first_ts).strftime(TIME_FORMAT),
+                       datetime.fromtimestamp(r.last_ts).strftime(TIME_FORMAT),
+                       _fmt(r.temp_mean), _fmt(r.temp_min), _fmt(r.temp_max),
+                       _fmt(r.hum_mean), _fmt(r.hum_min), _fmt(r.hum_max),
+                       _fmt(r.dew_mean), _fmt(r.heat_max), r.z_anomalies, r.iqr_anomalies])
+    print(table)
+
+
+if __name__ == "__main__":
+    main()
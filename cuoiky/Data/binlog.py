@@ -0,0 +1,401 @@
+# ==================== binlog.py ====================
+"""
+Kho telemetry nhị phân kích thước cố định (fixed-width) cho MQTT logger.
+
+Bố cục file ``*.bin``:
+- Header 16 byte: magic ``IOTB``, version (uint16), kích thước bản ghi (uint16),
+  độ trễ tối đa của bản ghi (int64 ms, xem ``records.Lateness``; 0 = tăng dần).
+- Các bản ghi 20 byte, little-endian, nối tiếp nhau:
+  int64 epoch ms | float32 nhiệt độ | float32 độ ẩm | uint16 mã thiết bị |
+  uint8 trạng thái quạt | uint8 trạng thái đèn.
+  Giá trị thiếu được lưu là NaN.
+
+Mã thiết bị tra trong file phụ ``*.bin.devices`` (mỗi dòng một tên, số dòng = mã).
+
+Bản ghi thứ i nằm ở offset ``HEADER_SIZE + i * RECORD_SIZE``, nên đọc N dòng
+cuối hay một dòng bất kỳ không cần quét file. Mẫu trong lô từ thiết bị
+(sensor/batch, backlog sau khi mất kết nối) được ghi với thời điểm đo, nên
+file chỉ gần tăng dần: độ trễ trong header được cập nhật trước khi ghi bản ghi
+trễ, và tìm kiếm theo thời gian nới giới hạn thêm đúng độ trễ đó. Reader dùng ``mmap`` và, nếu có
+NumPy, trả về mảng có cấu trúc trỏ thẳng vào vùng nhớ đó (zero-copy).
+
+Dòng lệnh:
+    python binlog.py import iot_log.csv iot_log.bin
+    python binlog.py export iot_log.bin iot_log_export.csv
+    python binlog.py info iot_log.bin
+"""
+
+import argparse
+import csv
+import math
+import mmap
+import os
+import struct
+
+from csv_sink import WriteBehindSink
+from records import CSV_HEADER, Lateness, Reading, iter_csv_readings
+
+try:
+    import numpy as np
+except ImportError:  # NumPy là tùy chọn; reader vẫn chạy bằng struct
+    np = None
+
+MAGIC = b"IOTB"
+VERSION = 1
+HEADER = struct.Struct("<4sHHq")    # 8 byte cuối: độ trễ tối đa (ms), file cũ ghi 0
+HEADER_SIZE = HEADER.size            # 16
+LATENESS_FIELD = struct.Struct("<q")
+LATENESS_OFFSET = 8
+RECORD = struct.Struct("<qffHBB")
+RECORD_SIZE = RECORD.size            # 20
+TS_FIELD = struct.Struct("<q")       # trường đầu của bản ghi: epoch ms
+
+# Mã trạng thái thiết bị (quạt / đèn)
+STATE_CODES = {"unknown": 0, "off": 1, "on": 2}
+STATE_NAMES = {code: name for name, code in STATE_CODES.items()}
+
+if np is not None:
+    RECORD_DTYPE = np.dtype([
+        ("ts_ms", "<i8"),
+        ("temp", "<f4"),
+        ("hum", "<f4"),
+        ("device", "<u2"),
+        ("fan", "u1"),
+        ("light", "u1"),
+    ])
+    assert RECORD_DTYPE.itemsize == RECORD_SIZE
+
+NAN = float("nan")
+
+
+def _state_code(value):
+    return STATE_CODES.get(str(value).lower(), 0)
+
+
+def _float_or_nan(value):
+    if value is None or value == "":
+        return NAN
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return NAN
+
+
+def _none_if_nan(value):
+    return None if math.isnan(value) else round(value, 2)
+
+
+class DeviceTable:
+    """Ánh xạ tên thiết bị <-> mã uint16, lưu append-only trong file ``*.devices``."""
+
+    def __init__(self, path):
+        self.path = path
+        self.names = []
+        self.codes = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    self._add(line.rstrip("\n"))
+
+    def _add(self, name):
+        self.codes[name] = len(self.names)
+        self.names.append(name)
+
+    def code(self, name):
+        """Mã của thiết bị; thiết bị mới được ghi xuống đĩa trước khi dùng."""
+        code = self.codes.get(name)
+        if code is None:
+            if len(self.names) >= 0x10000:
+                raise ValueError("Quá 65536 thiết bị cho một file binlog")
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(name + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._add(name)
+            code = self.codes[name]
+        return code
+
+    def name(self, code):
+        return self.names[code] if code < len(self.names) else f"#{code}"
+
+
+def _open_for_append(path):
+    """Mở file binlog để ghi nối; tạo header nếu file mới, cắt bản ghi dở nếu crash."""
+    f = open(path, "ab")
+    size = f.seek(0, os.SEEK_END)
+    if size == 0:
+        f.write(HEADER.pack(MAGIC, VERSION, RECORD_SIZE, 0))
+        f.flush()
+    else:
+        with open(path, "rb") as r:
+            _check_header(r.read(HEADER_SIZE), path)
+        partial = (size - HEADER_SIZE) % RECORD_SIZE
+        if partial:
+            f.truncate(size - partial)
+    return f
+
+
+def _check_header(raw, path):
+    """Kiểm tra header; trả về độ trễ tối đa (ms) ghi trong đó."""
+    if len(raw) < HEADER_SIZE:
+        raise ValueError(f"{path}: file binlog thiếu header")
+    magic, version, record_size, lateness = HEADER.unpack(raw[:HEADER_SIZE])
+    if magic != MAGIC or record_size != RECORD_SIZE:
+        raise ValueError(f"{path}: không phải file binlog hợp lệ")
+    if version != VERSION:
+        raise ValueError(f"{path}: binlog version {version} không được hỗ trợ")
+    return lateness
+
+
+def _append_lateness(path):
+    """``Lateness`` (ms) để ghi tiếp vào file binlog đã có.
+
+    Thời gian mới nhất chỉ biết chắc là <= bản ghi cuối + độ trễ: dùng giá trị
+    đó (có thể làm độ trễ sau này lớn hơn thực tế một chút, không bao giờ nhỏ hơn).
+    """
+    with open(path, "rb") as f:
+        lateness = _check_header(f.read(HEADER_SIZE), path)
+        size = f.seek(0, os.SEEK_END)
+        if size < HEADER_SIZE + RECORD_SIZE:
+            return Lateness(None, lateness)
+        f.seek(HEADER_SIZE + ((size - HEADER_SIZE) // RECORD_SIZE - 1) * RECORD_SIZE)
+        last = TS_FIELD.unpack(f.read(TS_FIELD.size))[0]
+    return Lateness(last + lateness, lateness)
+
+
+def _observe_batch(path, late, records):
+    """Cập nhật ``late`` theo các bản ghi sắp ghi; ghi độ trễ mới vào header TRƯỚC khi ghi bản ghi.
+
+    Reader đọc số bản ghi rồi mới đọc header, nên luôn thấy độ trễ đủ lớn cho mọi bản ghi nó thấy.
+    """
+    before = late.lateness
+    for ts_ms in records:
+        late.observe(ts_ms)
+    if late.lateness != before:
+        with open(path, "r+b") as f:
+            f.seek(LATENESS_OFFSET)
+            f.write(LATENESS_FIELD.pack(int(late.lateness)))
+
+
+def pack_reading(reading, devices):
+    return RECORD.pack(int(reading.ts * 1000),
+                       _float_or_nan(reading.temp),
+                       _float_or_nan(reading.hum),
+                       devices.code(reading.device),
+                       _state_code(reading.fan),
+                       _state_code(reading.light))
+
+
+class BinaryLogSink(WriteBehindSink):
+    """Sink write-behind ghi ``Reading`` thành bản ghi nhị phân 20 byte."""
+
+    thread_name = "binlog-flusher"
+
+    def __init__(self, path, **kwargs):
+        self.devices = DeviceTable(path + ".devices")
+        super().__init__(path, **kwargs)
+
+    def _open(self):
+        f = _open_for_append(self.path)
+        self._late = _append_lateness(self.path)
+        return f
+
+    def _write_items(self, items):
+        devices = self.devices
+        data = b"".join(pack_reading(r, devices) for r in items)
+        _observe_batch(self.path, self._late, (int(r.ts * 1000) for r in items))
+        self._file.write(data)
+        self.bytes_written += len(data)
+
+
+class BinaryLogReader:
+    """Đọc file binlog qua mmap; truy cập ngẫu nhiên O(1) theo chỉ số bản ghi."""
+
+    def __init__(self, path):
+        self.path = path
+        self.devices = DeviceTable(path + ".devices")
+        self._file = open(path, "rb")
+        _check_header(self._file.read(HEADER_SIZE), path)
+        self._mm = None
+        self.refresh()
+
+    def refresh(self):
+        """Ánh xạ lại file để thấy các bản ghi mới được ghi thêm."""
+        if self._mm is not None:
+            self._mm.close()
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.count = (len(self._mm) - HEADER_SIZE) // RECORD_SIZE
+        self.devices = DeviceTable(self.path + ".devices")
+
+    def __len__(self):
+        return self.count
+
+    def raw(self, index):
+        """Tuple thô (ts_ms, temp, hum, device_code, fan_code, light_code)."""
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return RECORD.unpack_from(self._mm, HEADER_SIZE + index * RECORD_SIZE)
+
+    def __getitem__(self, index):
+        return self._to_reading(self.raw(index))
+
+    def _to_reading(self, raw):
+        ts_ms, temp, hum, device, fan, light = raw
+        return Reading(ts_ms / 1000.0, self.devices.name(device),
+                       _none_if_nan(temp), _none_if_nan(hum),
+                       STATE_NAMES.get(fan, "unknown"), STATE_NAMES.get(light, "unknown"))
+
+    def iter_readings(self, start=0, stop=None):
+        stop = self.count if stop is None else min(stop, self.count)
+        offset = HEADER_SIZE + start * RECORD_SIZE
+        end = HEADER_SIZE + stop * RECORD_SIZE
+        view = memoryview(self._mm)[offset:end]
+        try:
+            for raw in RECORD.iter_unpack(view):
+                yield self._to_reading(raw)
+        finally:
+            view.release()
+
+    @property
+    def lateness_ms(self):
+        """Độ trễ tối đa (ms) trong header; đọc lại mỗi lần vì sink cập nhật nó trước khi ghi."""
+        return LATENESS_FIELD.unpack_from(self._mm, LATENESS_OFFSET)[0]
+
+    def _bisect(self, target_ms):
+        lo, hi = 0, self.count
+        mm = self._mm
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if TS_FIELD.unpack_from(mm, HEADER_SIZE + mid * RECORD_SIZE)[0] < target_ms:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def search(self, ts):
+        """Chỉ số bản ghi an toàn để bắt đầu đọc các bản ghi có thời gian >= ``ts`` (epoch giây).
+
+        Bản ghi có kích thước cố định nên bản thân file là chỉ mục: tìm nhị
+        phân trực tiếp trên mmap, O(log n) lần đọc. Với log tăng dần (độ trễ 0)
+        đó đúng là bản ghi đầu tiên >= ``ts``; với độ trễ L, mọi bản ghi trước
+        chỉ số trả về đều < ``ts`` (bản ghi < ``ts - L`` thì mọi bản ghi trước nó < ``ts``).
+        """
+        return self._bisect(int(ts * 1000) - self.lateness_ms)
+
+    def iter_range(self, start=None, end=None):
+        """Các Reading có ``start <= ts < end`` (epoch giây; None = không giới hạn)."""
+        lateness = self.lateness_ms
+        first = 0 if start is None else self.search(start)
+        # Bản ghi >= end + L thì mọi bản ghi sau nó đều >= end
+        last = self.count if end is None else self._bisect(int(end * 1000) + lateness)
+        readings = self.iter_readings(first, last)
+        if not lateness:
+            return readings
+        return (r for r in readings
+                if (start is None or r.ts >= start) and (end is None or r.ts < end))
+
+    def tail(self, n):
+        """N bản ghi cuối, không phụ thuộc kích thước file."""
+        return list(self.iter_readings(max(0, self.count - n)))
+
+    def array(self):
+        """Mảng NumPy có cấu trúc (RECORD_DTYPE) trỏ thẳng vào mmap, không copy."""
+        if np is None:
+            raise RuntimeError("Cần cài numpy để dùng BinaryLogReader.array()")
+        return np.frombuffer(self._mm, dtype=RECORD_DTYPE, count=self.count, offset=HEADER_SIZE)
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def open_memmap(path):
+    """``numpy.memmap`` chỉ đọc trên phần bản ghi của file binlog."""
+    if np is None:
+        raise RuntimeError("Cần cài numpy để dùng open_memmap()")
+    with open(path, "rb") as f:
+        _check_header(f.read(HEADER_SIZE), path)
+    count = (os.path.getsize(path) - HEADER_SIZE) // RECORD_SIZE
+    return np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER_SIZE, shape=(count,))
+
+
+# ---------- Chuyển đổi CSV <-> binlog ----------
+
+def import_csv(csv_path, bin_path, device="unknown"):
+    """Nhập iot_log.csv (Time, Temp, Hum, Fan, Light[, Device]) vào binlog; trả về số dòng đã nhập."""
+    devices = DeviceTable(bin_path + ".devices")
+    count = 0
+    with _open_for_append(bin_path) as dst:
+        late = _append_lateness(bin_path)
+        chunk, stamps = [], []
+        for reading in iter_csv_readings(csv_path, device):
+            chunk.append(pack_reading(reading, devices))
+            stamps.append(int(reading.ts * 1000))
+            if len(chunk) >= 4096:
+                _observe_batch(bin_path, late, stamps)
+                dst.write(b"".join(chunk))
+                count += len(chunk)
+                chunk, stamps = [], []
+        _observe_batch(bin_path, late, stamps)
+        dst.write(b"".join(chunk))
+        count += len(chunk)
+    return count
+
+
+def export_csv(bin_path, csv_path):
+    """Xuất binlog ra CSV UTF-8 theo định dạng iot_log.csv (nhập lại được); trả về số dòng đã xuất."""
+    count = 0
+    with BinaryLogReader(bin_path) as reader, \
+            open(csv_path, "w", encoding="utf-8", newline="") as dst:
+        writer = csv.writer(dst)
+        writer.writerow(CSV_HEADER)
+        for r in reader.iter_readings():
+            writer.writerow(r.to_csv_row())
+            count += 1
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Công cụ cho file telemetry nhị phân (binlog)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_import = sub.add_parser("import", help="nhập CSV vào binlog")
+    p_import.add_argument("csv")
+    p_import.add_argument("bin")
+    p_import.add_argument("--device", default="unknown", help="tên thiết bị gán cho các dòng CSV không có cột thiết bị")
+
+    p_export = sub.add_parser("export", help="xuất binlog ra CSV")
+    p_export.add_argument("bin")
+    p_export.add_argument("csv")
+
+    p_info = sub.add_parser("info", help="thông tin tóm tắt của binlog")
+    p_info.add_argument("bin")
+
+    args = parser.parse_args(argv)
+    if args.command == "import":
+        n = import_csv(args.csv, args.bin, args.device)
+        print(f"✅ Đã nhập {n} dòng vào {args.bin}")
+    elif args.command == "export":
+        n = export_csv(args.bin, args.csv)
+        print(f"✅ Đã xuất {n} dòng ra {args.csv}")
+    else:
+        with BinaryLogReader(args.bin) as reader:
+            print(f"📦 {args.bin}: {len(reader)} bản ghi × {RECORD_SIZE} byte, "
+                  f"{len(reader.devices.names)} thiết bị, độ trễ tối đa {reader.lateness_ms / 1000:g}s")
+            if len(reader):
+                print(f"   Từ  {reader[0].time_str()}")
+                print(f"   Đến {reader[-1].time_str()}")
+
+
+if __name__ == "__main__":
+    main()
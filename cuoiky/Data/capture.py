@@ -0,0 +1,410 @@
+# ==================== capture.py ====================
+"""
+Ghi lại và phát lại lưu lượng MQTT thô để thử tải logger offline.
+
+``record`` đăng ký các topic và ghi mỗi message (thời điểm nhận, topic,
+payload bytes, QoS, cờ retain) vào một file nhị phân chỉ ghi nối. Topic được
+ghi đầy đủ ở lần xuất hiện đầu tiên, các lần sau chỉ còn mã số 2 byte:
+
+    header : "IOTC" | version u16 | kích thước header bản ghi u16
+    bản ghi: ts f64 | cờ u8 | mã topic u16 | độ dài payload u32
+             [độ dài topic u16 | topic UTF-8]   (chỉ khi cờ NEW_TOPIC)
+             payload
+
+``replay`` đưa file ghi lại vào logger (server.py), theo thời gian thực
+(``--speed 1``), nhanh gấp N lần (``--speed N``) hoặc nhanh nhất có thể
+(``--speed 0``), rồi in thông lượng logger theo kịp:
+
+- ``--target inprocess`` (mặc định): gọi thẳng ``server.pipeline.submit()``,
+  không qua broker; các tham số sau ``--`` được chuyển cho server.py. Mỗi
+  message mang thời điểm nhận đã ghi lại, dời về lúc bắt đầu phát lại: các
+  mẫu giữ đúng khoảng cách như capture dù phát với tốc độ nào.
+- ``--target broker``: publish lại lên broker (tcp hoặc loopback). Với
+  loopback, logger chạy trong cùng process; với tcp, thông lượng được đọc
+  từ ``/metrics`` của logger (``--metrics-url``). Logger tự ghi thời điểm
+  nhận (MQTT 3.1.1 không có chỗ mang thời điểm gốc), nên chỉ ``--speed 1``
+  giữ được khoảng cách thời gian của capture.
+
+Dòng lệnh:
+    python capture.py record traffic.iotcap --broker localhost --duration 600
+    python capture.py info traffic.iotcap
+    python capture.py replay traffic.iotcap --speed 0 -- --sink bin --bin-file /tmp/replay.bin
+"""
+
+import argparse
+import os
+import struct
+import sys
+import threading
+import time
+import urllib.request
+from typing import NamedTuple
+
+from csv_sink import WriteBehindSink
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.transport import TRANSPORT_LOOPBACK, add_transport_args, create_client  # noqa: E402
+
+MAGIC = b"IOTC"
+VERSION = 1
+FILE_HEADER = struct.Struct("<4sHH")
+RECORD = struct.Struct("<dBHI")
+TOPIC_LEN = struct.Struct("<H")
+
+# Cờ của bản ghi
+RETAIN = 0x01
+QOS_SHIFT = 1          # bit 1-2: QoS
+NEW_TOPIC = 0x80       # topic đầy đủ đi kèm bản ghi này
+INLINE_TOPIC = 0xFFFF  # bảng topic đã đầy: topic luôn ghi kèm, không cấp mã
+
+BROKER = 'broker.hivemq.com'
+PORT = 1883
+RECORD_TOPICS = ['+/+/sensor/#', '+/+/device/state/#', '+/+/sys/online']
+METRICS_URL = 'http://127.0.0.1:9108/metrics'
+
+
+class CapturedMessage(NamedTuple):
+    ts: float          # thời điểm nhận (epoch giây)
+    topic: str
+    payload: bytes
+    qos: int = 0
+    retain: bool = False
+
+
+def _iter_records(f):
+    """(vị trí cuối bản ghi, CapturedMessage) cho từng bản ghi đầy đủ; dừng ở bản ghi ghi dở."""
+    head = f.read(FILE_HEADER.size)
+    if len(head) < FILE_HEADER.size:
+        return
+    magic, version, rec_size = FILE_HEADER.unpack(head)
+    if magic != MAGIC or version != VERSION or rec_size != RECORD.size:
+        raise ValueError(f"{f.name}: không phải file capture v{VERSION}")
+    topics = []
+    pos = FILE_HEADER.size
+    while True:
+        head = f.read(RECORD.size)
+        if len(head) < RECORD.size:
+            return
+        ts, flags, topic_id, length = RECORD.unpack(head)
+        pos += RECORD.size
+        if flags & NEW_TOPIC:
+            raw = f.read(TOPIC_LEN.size)
+            if len(raw) < TOPIC_LEN.size:
+                return
+            n = TOPIC_LEN.unpack(raw)[0]
+            name = f.read(n)
+            if len(name) < n:
+                return
+            topic = name.decode("utf-8")
+            pos += TOPIC_LEN.size + n
+        elif topic_id < len(topics):
+            topic = topics[topic_id]
+        else:
+            raise ValueError(f"{f.name}: mã topic {topic_id} chưa được khai báo (offset {pos})")
+        payload = f.read(length)
+        if len(payload) < length:
+            return
+        pos += length
+        if flags & NEW_TOPIC and topic_id != INLINE_TOPIC:
+            topics.append(topic)
+        yield pos, CapturedMessage(ts, topic, payload, (flags >> QOS_SHIFT) & 0x3, bool(flags & RETAIN))
+
+
+def iter_capture(path):
+    """Các ``CapturedMessage`` trong file theo thứ tự ghi."""
+    with open(path, "rb") as f:
+        for _, msg in _iter_records(f):
+            yield msg
+
+
+class CaptureSink(WriteBehindSink):
+    """Sink write-behind ghi ``CapturedMessage`` vào file capture (ghi nối, mở lại được)."""
+
+    thread_name = "capture-flusher"
+
+    def __init__(self, path, **kwargs):
+        self._topics = {}  # topic -> mã
+        super().__init__(path, **kwargs)
+
+    def _open(self):
+        end = 0
+        if os.path.exists(self.path) and os.path.getsize(self.path):
+            # Mở lại: dựng lại bảng topic, cắt bản ghi ghi dở cuối file (crash)
+            with open(self.path, "rb") as f:
+                end = FILE_HEADER.size
+                for end, msg in _iter_records(f):
+                    if msg.topic not in self._topics and len(self._topics) < INLINE_TOPIC:
+                        self._topics[msg.topic] = len(self._topics)
+            with open(self.path, "r+b") as f:
+                f.truncate(end)
+        f = open(self.path, "ab")
+        if f.tell() == 0:
+            f.write(FILE_HEADER.pack(MAGIC, VERSION, RECORD.size))
+        return f
+
+    def _write_items(self, items):
+        parts = []
+        topics = self._topics
+        for msg in items:
+            flags = (RETAIN if msg.retain else 0) | ((msg.qos & 0x3) << QOS_SHIFT)
+            topic_id = topics.get(msg.topic)
+            if topic_id is None:
+                flags |= NEW_TOPIC
+                topic_id = len(topics) if len(topics) < INLINE_TOPIC else INLINE_TOPIC
+                if topic_id != INLINE_TOPIC:
+                    topics[msg.topic] = topic_id
+                name = msg.topic.encode("utf-8")
+                parts.append(RECORD.pack(msg.ts, flags, topic_id, len(msg.payload)))
+                parts.append(TOPIC_LEN.pack(len(name)))
+                parts.append(name)
+            else:
+                parts.append(RECORD.pack(msg.ts, flags, topic_id, len(msg.payload)))
+            parts.append(msg.payload)
+        data = b"".join(parts)
+        self._file.write(data)
+        self.bytes_written += len(data)
+
+    def record(self, topic, payload, qos=0, retain=False, ts=None):
+        self.write(CapturedMessage(time.time() if ts is None else ts, topic, bytes(payload), qos, bool(retain)))
+
+
+# ---------- Ghi ----------
+
+def record(path, transport, broker, port, topics=RECORD_TOPICS, qos=1, duration=None):
+    """Ghi lưu lượng của ``topics`` vào ``path`` tới khi hết ``duration`` giây hoặc Ctrl+C."""
+    sink = CaptureSink(path, flush_rows=2000, flush_interval=1.0)
+    client = create_client(f"iot_capture_{os.getpid()}", transport)
+
+    def on_connect(client, userdata, flags, rc, properties=None):
+        if rc == 0:
+            client.subscribe([(t, qos) for t in topics])
+            print("🎙️ Đang ghi: " + ", ".join(topics))
+        else:
+            print("❌ Kết nối thất bại, mã lỗi:", rc)
+
+    def on_message(client, userdata, msg):
+        sink.record(msg.topic, msg.payload, msg.qos, msg.retain)
+
+    client.on_connect = on_connect
+    client.on_message = on_message
+    start = time.monotonic()
+    try:
+        client.connect(broker, port)
+        client.loop_start()
+        while duration is None or time.monotonic() - start < duration:
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.loop_stop()
+        client.disconnect()
+        sink.close()
+    print(f"💾 Đã ghi {sink.rows_written} message ({sink.bytes_written:,} byte) vào {path}.")
+    return sink.rows_written
+
+
+# ---------- Phát lại ----------
+
+def paced(messages, speed):
+    """Phát các message theo nhịp thời gian gốc chia cho ``speed`` (0 = không chờ)."""
+    first = None
+    start = time.perf_counter()
+    for msg in messages:
+        if speed > 0:
+            if first is None:
+                first = msg.ts
+            delay = (msg.ts - first) / speed - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+        yield msg
+
+
+class ReplayResult(NamedTuple):
+    messages: int
+    send_seconds: float      # thời gian đưa hết message vào logger/broker
+    drain_seconds: float     # từ message đầu tới khi logger xử lý xong
+    rows: int                # dòng logger đã ghi (-1 nếu không biết)
+    dropped: int             # message logger bỏ do hàng đợi đầy (-1 nếu không biết)
+
+    @property
+    def throughput(self):
+        return self.messages / self.drain_seconds if self.drain_seconds else 0.0
+
+
+def replay_inprocess(path, speed=0.0, logger_argv=(), limit=None):
+    """Đưa capture thẳng vào hàng đợi của server.py trong process này."""
+    import server
+
+    args = server.parse_args(["--metrics-port", "0", *logger_argv])
+    server.start(args)
+    n = 0
+    start = time.perf_counter()
+    shift = None
+    try:
+        for msg in paced(iter_capture(path), speed):
+            if limit is not None and n >= limit:
+                break
+            if shift is None:
+                shift = time.time() - msg.ts
+            server.pipeline.submit(msg.topic, msg.payload, msg.ts + shift)
+            n += 1
+        sent = time.perf_counter() - start
+        server.pipeline.close()
+        drained = time.perf_counter() - start
+    finally:
+        server.shutdown(args)
+    stats = server.pipeline.stats()
+    return ReplayResult(n, sent, drained, server.sink.rows_written, stats["dropped"])
+
+
+def scrape_received(url):
+    """Tổng ``iot_messages_received_total`` từ /metrics của logger."""
+    with urllib.request.urlopen(url, timeout=5) as resp:
+        text = resp.read().decode("utf-8")
+    return sum(float(line.rsplit(" ", 1)[1]) for line in text.splitlines()
+               if line.startswith("iot_messages_received_total"))
+
+
+def replay_broker(path, transport, broker, port, speed=0.0, limit=None,
+                  metrics_url=METRICS_URL, logger_argv=(), idle_timeout=5.0):
+    """Publish lại capture lên broker; đo thông lượng logger theo kịp.
+
+    Với loopback, logger (server.py) chạy trên một luồng trong process này.
+    Thời gian của mẫu là lúc logger nhận lại message, nên khác capture khi ``speed != 1``.
+    """
+    server = logger_thread = None
+    if transport == TRANSPORT_LOOPBACK:
+        import server
+        logger_thread = threading.Thread(
+            target=server.main, args=(["--transport", TRANSPORT_LOOPBACK, "--metrics-port", "0",
+                                       *logger_argv],),
+            name="replay-logger", daemon=True)
+        logger_thread.start()
+        deadline = time.monotonic() + 5
+        while not (server.client is not None and server.client.is_connected()) and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        def received():
+            return server.pipeline.processed + len(server.pipeline.queue)
+    else:
+        def received():
+            try:
+                return scrape_received(metrics_url)
+            except OSError:
+                return None
+
+    before = received() or 0
+    client = create_client(f"iot_replay_{os.getpid()}", transport)
+    client.connect(broker, port)
+    client.loop_start()
+    n = 0
+    start = time.perf_counter()
+    try:
+        for msg in paced(iter_capture(path), speed):
+            if limit is not None and n >= limit:
+                break
+            client.publish(msg.topic, msg.payload, qos=msg.qos, retain=msg.retain)
+            n += 1
+        sent = time.perf_counter() - start
+
+        # Chờ logger nhận hết (hoặc ngừng tiến triển quá idle_timeout giây)
+        last, last_change = before, time.perf_counter()
+        while True:
+            now_count = received()
+            if now_count is None:
+                break
+            if now_count - before >= n:
+                break
+            if now_count != last:
+                last, last_change = now_count, time.perf_counter()
+            elif time.perf_counter() - last_change > idle_timeout:
+                break
+            time.sleep(0.05)
+        if server is not None:
+            server.pipeline.close()
+        drained = time.perf_counter() - start
+    finally:
+        client.loop_stop()
+        client.disconnect()
+        if server is not None:
+            server.stop()
+            logger_thread.join(10)
+
+    if server is not None:
+        return ReplayResult(n, sent, drained, server.sink.rows_written, server.pipeline.stats()["dropped"])
+    return ReplayResult(n, sent, drained, -1, -1)
+
+
+def capture_info(path):
+    count = size = 0
+    topics = set()
+    first = last = None
+    for msg in iter_capture(path):
+        count += 1
+        size += len(msg.payload)
+        topics.add(msg.topic)
+        first = msg.ts if first is None else first
+        last = msg.ts
+    return count, len(topics), size, first, last
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ghi lại / phát lại lưu lượng MQTT thô cho logger")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_rec = sub.add_parser("record", help="ghi lưu lượng MQTT vào file capture")
+    p_rec.add_argument("file")
+    add_transport_args(p_rec, BROKER, PORT)
+    p_rec.add_argument("--topic", action="append", dest="topics",
+                       help=f"topic cần ghi, lặp lại được (mặc định: {', '.join(RECORD_TOPICS)})")
+    p_rec.add_argument("--qos", type=int, choices=(0, 1, 2), default=1)
+    p_rec.add_argument("--duration", type=float, default=None, help="dừng sau số giây này")
+
+    p_info = sub.add_parser("info", help="thống kê file capture")
+    p_info.add_argument("file")
+
+    p_play = sub.add_parser("replay", help="phát lại file capture vào logger")
+    p_play.add_argument("file")
+    add_transport_args(p_play, BROKER, PORT)
+    p_play.add_argument("--target", choices=("inprocess", "broker"), default="inprocess",
+                        help="inprocess: gọi thẳng hàng đợi của server.py; broker: publish lại lên broker")
+    p_play.add_argument("--speed", type=float, default=0.0,
+                        help="1 = thời gian thực, N = nhanh gấp N lần, 0 = nhanh nhất có thể")
+    p_play.add_argument("--limit", type=int, default=None, help="chỉ phát N message đầu")
+    p_play.add_argument("--metrics-url", default=METRICS_URL,
+                        help="/metrics của logger chạy riêng (--target broker với tcp)")
+    p_play.epilog = "Các tham số sau '--' được chuyển cho server.py (ví dụ: -- --sink bin --bin-file x.bin)."
+
+    argv = list(sys.argv[1:] if argv is None else argv)
+    logger_args = []
+    if "--" in argv:
+        cut = argv.index("--")
+        argv, logger_args = argv[:cut], argv[cut + 1:]
+    args = parser.parse_args(argv)
+    if args.command == "record":
+        record(args.file, args.transport, args.broker, args.port,
+               args.topics or RECORD_TOPICS, args.qos, args.duration)
+        return
+    if args.command == "info":
+        count, n_topics, size, first, last = capture_info(args.file)
+        span = (last - first) if count else 0.0
+        print(f"📼 {args.file}: {count:,} message, {n_topics} topic, {size:,} byte payload, "
+              f"{span:.1f}s ({count / span if span else 0:.0f} msg/s khi ghi), "
+              f"file {os.path.getsize(args.file):,} byte")
+        return
+
+    if args.target == "broker" and args.speed != 1:
+        print("⚠️ --target broker: logger tự ghi thời điểm nhận, chỉ --speed 1 giữ khoảng cách thời gian của capture.")
+    if args.target == "inprocess":
+        result = replay_inprocess(args.file, args.speed, logger_args, args.limit)
+    else:
+        result = replay_broker(args.file, args.transport, args.broker, args.port, args.speed,
+                               args.limit, args.metrics_url, logger_args)
+    print(f"▶️ Đã phát {result.messages:,} message trong {result.send_seconds:.2f}s "
+          f"(tốc độ {'tối đa' if args.speed <= 0 else f'x{args.speed:g}'}).")
+    print(f"📈 Logger xử lý xong sau {result.drain_seconds:.2f}s: {result.throughput:,.0f} message/s"
+          + (f", {result.rows:,} dòng, {result.dropped} bị bỏ." if result.rows >= 0 else "."))
+
+
+if __name__ == "__main__":
+    main()
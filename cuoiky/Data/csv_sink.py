@@ -0,0 +1,328 @@
+# ==================== csv_sink.py ====================
+"""
+Write-behind CSV sink cho MQTT logger.
+
+Giữ file log mở suốt vòng đời logger, gom các dòng vào bộ đệm trong RAM và
+để một luồng nền ghi xuống đĩa khi đủ số dòng hoặc hết thời gian chờ.
+Callback của paho chỉ còn thao tác append vào list, không đụng tới đĩa.
+
+``WriteBehindSink`` là phần khung dùng chung; các định dạng lưu trữ khác
+(binlog.py, ...) chỉ cần cài đặt cách mở file và ghi một lô.
+"""
+
+import csv
+import os
+import threading
+import time
+
+# Chính sách độ bền dữ liệu (durability)
+DURABILITY_NONE = "none"          # chỉ flush vào OS, không fsync
+DURABILITY_FLUSH = "flush"        # fsync sau mỗi lần flush
+DURABILITY_INTERVAL = "interval"  # fsync tối đa mỗi FSYNC_INTERVAL giây
+DURABILITY_POLICIES = (DURABILITY_NONE, DURABILITY_FLUSH, DURABILITY_INTERVAL)
+
+# Số dòng tối đa trong bộ đệm; đầy thì producer phải chờ (đĩa đầy, lỗi I/O, ...)
+MAX_BUFFER_ROWS = 100_000
+
+
+class WriteBehindSink:
+    """Khung chung cho sink ghi trễ (write-behind) với luồng flush nền.
+
+    Lớp con mở ``self._file`` trong ``_open()`` và ghi một lô bản ghi
+    trong ``_write_items(items)``; phần bộ đệm, luồng nền và fsync nằm ở đây.
+    Sink ghi nhiều file (partitions.py) thay ``_flush_files``, ``_sync_files``
+    và ``_close_files``.
+
+    - ``flush_rows``: flush ngay khi bộ đệm đạt số dòng này.
+    - ``flush_interval``: thời gian tối đa (giây) một dòng nằm trong bộ đệm.
+    - ``durability``: một trong ``DURABILITY_POLICIES``.
+    - ``fsync_interval``: chu kỳ fsync khi dùng ``DURABILITY_INTERVAL``.
+    - ``max_buffer_rows``: giới hạn bộ đệm; khi đầy (đĩa chậm hoặc lỗi) ``write()``
+      chờ luồng flush, để hàng đợi nạp (ingest.py) áp dụng chính sách tràn của nó.
+
+    Lỗi ghi (ENOSPC, EIO, ...) không làm chết luồng flush: lô bị trả lại bộ
+    đệm, được đếm trong ``write_errors`` và ghi lại sau ``flush_interval``.
+    Chỉ các lỗi trong ``retry_errors`` được thử lại; lỗi khác (dữ liệu không
+    ghi được, ví dụ quá số thiết bị của binlog) không tự hết, nên lô được ghi
+    lại từng dòng và các dòng vẫn lỗi bị bỏ, đếm trong ``rows_rejected``.
+    """
+
+    thread_name = "sink-flusher"
+    retry_errors = (OSError,)  # lỗi I/O tạm thời: giữ lô để ghi lại
+
+    def __init__(self, path, flush_rows=500, flush_interval=1.0,
+                 durability=DURABILITY_NONE, fsync_interval=5.0, max_buffer_rows=MAX_BUFFER_ROWS):
+        if durability not in DURABILITY_POLICIES:
+            raise ValueError(f"durability không hợp lệ: {durability!r}")
+        if flush_rows < 1:
+            raise ValueError("flush_rows phải >= 1")
+        if max_buffer_rows < flush_rows:
+            raise ValueError("max_buffer_rows phải >= flush_rows")
+
+        self.path = path
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.durability = durability
+        self.fsync_interval = fsync_interval
+        self.max_buffer_rows = max_buffer_rows
+
+        self._file = self._open()
+
+        self._buffer = []
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._closed = False
+        self._dirty = False          # đã ghi nhưng chưa fsync
+        self._last_fsync = time.monotonic()
+
+        # Bộ đếm thống kê
+        self.rows_written = 0
+        self.bytes_written = 0        # lớp con cộng trong _write_items
+        self.flush_count = 0
+        self.fsync_count = 0
+        self.last_flush_seconds = 0.0  # thời gian ghi + flush của lô gần nhất
+        self.fsync_seconds = 0.0      # tổng thời gian trong fsync
+        self.write_errors = 0         # lần ghi/fsync thất bại
+        self.blocked = 0              # số lần producer phải chờ vì bộ đệm đầy
+        self.rows_rejected = 0        # dòng bị bỏ vì lỗi không phải I/O
+        self.last_error = None
+
+        self._flush_listeners = []
+
+        self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+        self._thread.start()
+
+    # ---------- Lớp con cài đặt ----------
+
+    def _open(self):
+        raise NotImplementedError
+
+    def _write_items(self, items):
+        raise NotImplementedError
+
+    def _reading_item(self, reading):
+        """Phần tử đưa vào bộ đệm cho một ``records.Reading`` (mặc định: chính nó)."""
+        return reading
+
+    def write_reading(self, reading):
+        """Ghi một ``records.Reading`` theo định dạng của sink."""
+        self.write(self._reading_item(reading))
+
+    def write_readings(self, readings):
+        """Ghi cả lô ``Reading`` trong một lần khóa bộ đệm."""
+        item = self._reading_item
+        self.write_rows([item(r) for r in readings])
+
+    def _flush_files(self):
+        self._file.flush()
+
+    def _sync_files(self):
+        os.fsync(self._file.fileno())
+
+    def _close_files(self):
+        self._file.close()
+
+    # ---------- API cho producer ----------
+
+    def write(self, row):
+        """Đưa một dòng vào bộ đệm (không chặn trên I/O đĩa)."""
+        with self._cond:
+            self._wait_for_room()
+            self._buffer.append(row)
+            if len(self._buffer) >= self.flush_rows:
+                self._cond.notify()
+
+    def write_rows(self, rows):
+        """Đưa nhiều dòng vào bộ đệm trong một lần khóa."""
+        with self._cond:
+            self._wait_for_room()
+            self._buffer.extend(rows)
+            if len(self._buffer) >= self.flush_rows:
+                self._cond.notify()
+
+    def add_flush_listener(self, callback):
+        """Gọi ``callback()`` sau mỗi lần một lô đã được flush vào file.
+
+        Dùng cho các cấu trúc dẫn xuất từ file log (ví dụ chỉ mục thời gian
+        trong tsindex.py); callback chạy trên luồng flush, giữ khóa I/O.
+        """
+        self._flush_listeners.append(callback)
+
+    def pending(self):
+        """Số dòng đang nằm trong bộ đệm."""
+        with self._cond:
+            return len(self._buffer)
+
+    def flush(self):
+        """Ghi toàn bộ bộ đệm xuống file ngay (đồng bộ).
+
+        Khi ghi lỗi I/O, phần chưa ghi được trả lại bộ đệm rồi ngoại lệ được ném tiếp.
+        """
+        with self._cond:
+            batch = self._take_buffer()
+        self._write_or_requeue(batch)
+
+    def close(self):
+        """Flush phần còn lại, fsync (nếu cần) và đóng file. Gọi nhiều lần vẫn an toàn."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+        with self._cond:
+            batch = self._take_buffer()
+        try:
+            self._write_or_requeue(batch)
+        except self.retry_errors:
+            print(f"❌ {self.path}: {len(self._buffer)} dòng chưa ghi được khi đóng sink")
+        with self._io_lock:
+            if self.durability != DURABILITY_NONE and self._dirty:
+                self._fsync()
+            self._close_files()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # ---------- Nội bộ ----------
+
+    def _take_buffer(self):
+        batch = self._buffer
+        self._buffer = []
+        return batch
+
+    def _wait_for_room(self):
+        # Gọi khi giữ self._cond
+        if not self._closed and len(self._buffer) >= self.max_buffer_rows:
+            self.blocked += 1
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: self._closed or len(self._buffer) < self.max_buffer_rows)
+        if self._closed:
+            raise ValueError("Sink đã đóng")
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._buffer) < self.flush_rows:
+                    self._cond.wait(timeout=self.flush_interval)
+                if self._closed:
+                    return
+                batch = self._take_buffer()
+                self._cond.notify_all()  # producer đang chờ chỗ trống
+            try:
+                self._write_or_requeue(batch)
+            except self.retry_errors:
+                # Chờ rồi thử lại; close() vẫn đánh thức được luồng
+                with self._cond:
+                    self._cond.wait_for(lambda: self._closed, timeout=self.flush_interval)
+                continue
+            if self.durability == DURABILITY_INTERVAL:
+                with self._io_lock:
+                    self._maybe_fsync()
+
+    def _write_or_requeue(self, batch):
+        """Ghi một lô; lỗi I/O: trả phần chưa ghi về bộ đệm rồi ném tiếp.
+
+        Lỗi khác: ghi lại từng dòng để chỉ bỏ (và đếm) những dòng vẫn lỗi.
+        """
+        try:
+            self._write_batch(batch)
+            return
+        except self.retry_errors as e:
+            self._write_failed(batch, e)
+            raise
+        except Exception as e:
+            print(f"⚠️ Lỗi ghi {self.path} ({e!r}), ghi lại từng dòng của lô {len(batch)} dòng")
+        for i, row in enumerate(batch):
+            try:
+                self._write_batch([row])
+            except self.retry_errors as e:
+                self._write_failed(batch[i:], e)
+                raise
+            except Exception as e:
+                with self._cond:
+                    self.rows_rejected += 1
+                    self.last_error = e
+                print(f"❌ Bỏ dòng không ghi được vào {self.path} ({e}): {row!r}")
+
+    def _write_failed(self, batch, error):
+        # Trả lô về đầu bộ đệm để lần flush sau ghi lại, giữ nguyên thứ tự. Lỗi
+        # giữa chừng _write_items có thể làm vài dòng đầu lô được ghi hai lần.
+        with self._cond:
+            self._buffer[:0] = batch
+            self.write_errors += 1
+            self.last_error = error
+        print(f"⚠️ Lỗi ghi {self.path} ({error}), giữ {len(batch)} dòng để thử lại")
+
+    def _write_batch(self, batch):
+        if not batch:
+            return
+        with self._io_lock:
+            start = time.perf_counter()
+            self._write_items(batch)
+            self._flush_files()
+            self.last_flush_seconds = time.perf_counter() - start
+            self._dirty = True
+            self.rows_written += len(batch)
+            self.flush_count += 1
+            if self.durability == DURABILITY_FLUSH:
+                self._fsync()
+            elif self.durability == DURABILITY_INTERVAL:
+                self._maybe_fsync()
+            for callback in self._flush_listeners:
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"⚠️ Lỗi trong flush listener {callback!r}: {e}")
+
+    def _maybe_fsync(self):
+        if self._dirty and time.monotonic() - self._last_fsync >= self.fsync_interval:
+            self._fsync()
+
+    def _fsync(self):
+        start = time.perf_counter()
+        try:
+            self._sync_files()
+        except OSError as e:
+            # Lô đã nằm trong file (page cache) nên không ghi lại; _dirty còn
+            # nguyên để lần sau fsync lại
+            self.write_errors += 1
+            self.last_error = e
+            print(f"⚠️ fsync {self.path} thất bại: {e}")
+            return
+        finally:
+            self.fsync_seconds += time.perf_counter() - start
+        self._dirty = False
+        self._last_fsync = time.monotonic()
+        self.fsync_count += 1
+
+
+class WriteBehindCSVSink(WriteBehindSink):
+    """Sink CSV: giữ file mở, mỗi lần flush ghi cả lô bằng một csv.writer."""
+
+    thread_name = "csv-sink-flusher"
+
+    def __init__(self, path, header=None, encoding='utf-8', **kwargs):
+        self.header = header
+        self.encoding = encoding
+        super().__init__(path, **kwargs)
+
+    def _open(self):
+        f = open(self.path, mode='a', newline='', encoding=self.encoding)
+        self._writer = csv.writer(f)
+        if self.header and f.tell() == 0:
+            self._writer.writerow(self.header)
+            f.flush()
+        return f
+
+    def _write_items(self, items):
+        before = self._file.tell()
+        self._writer.writerows(items)
+        self.bytes_written += self._file.tell() - before
+
+    def _reading_item(self, reading):
+        return reading.to_csv_row()
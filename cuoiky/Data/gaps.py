@@ -0,0 +1,192 @@
+# ==================== gaps.py ====================
+"""
+Phân loại khoảng trống giữa các mẫu của thiết bị báo cáo theo ngoại lệ.
+
+Thiết bị chạy chế độ report-by-exception (deadband) chỉ gửi mẫu khi giá trị
+ra khỏi dải hoặc khi hết ``max_silence`` giây; chính sách này được công bố
+trong ``device/state``::
+
+    "report": {"deadband": {"temp": 0.2, "hum": 1.0}, "max_silence": 60, "interval": 3}
+
+Với chính sách đó, khoảng cách giữa hai mẫu liên tiếp của cùng thiết bị là:
+
+- bình thường: không quá ``interval`` × ``GRACE`` (không ghi lại);
+- ``unchanged``: dài hơn nhưng không quá ``max_silence`` × ``GRACE``, giá trị
+  nằm trong deadband của mẫu trước nên coi như không đổi;
+- ``missing``: dài hơn cả ``max_silence`` × ``GRACE``, tức đã mất ít nhất một
+  lần báo cáo bắt buộc (mất kết nối, mất gói, thiết bị treo).
+
+Logger (server.py) ghi các khoảng trống vào file cạnh log gốc
+(``iot_log.csv`` -> ``iot_log.gaps.csv``). Với log cũ, ``scan`` phân loại
+lại từ log gốc theo chính sách truyền qua dòng lệnh:
+
+    python gaps.py scan iot_log.csv --interval 3 --max-silence 60
+    python gaps.py show iot_log.gaps.csv --kind missing
+"""
+
+import argparse
+import csv
+import os
+import threading
+from datetime import datetime
+from typing import NamedTuple
+
+from csv_sink import WriteBehindCSVSink
+from records import TIME_FORMAT
+
+GAP_UNCHANGED = "unchanged"
+GAP_MISSING = "missing"
+GAP_KINDS = (GAP_UNCHANGED, GAP_MISSING)
+GRACE = 1.5  # hệ số dung sai cho jitter lịch gửi và độ trễ mạng
+
+GAPS_HEADER = ["Bắt đầu", "Kết thúc", "Thiết bị", "Loại", "Số giây"]
+
+
+class Gap(NamedTuple):
+    """Khoảng ``start``..``end`` (epoch giây) không có mẫu của ``device``."""
+    device: str
+    start: float
+    end: float
+    kind: str
+
+    @property
+    def seconds(self):
+        return self.end - self.start
+
+    def to_csv_row(self):
+        fmt = lambda ts: datetime.fromtimestamp(ts).strftime(TIME_FORMAT)  # noqa: E731
+        return [fmt(self.start), fmt(self.end), self.device, self.kind, round(self.seconds, 3)]
+
+
+def gaps_path(log_path):
+    """File khoảng trống nằm cạnh log gốc: ``iot_log.csv`` -> ``iot_log.gaps.csv``."""
+    return f"{os.path.splitext(log_path)[0]}.gaps.csv"
+
+
+def classify(seconds, policy, grace=GRACE):
+    """Loại khoảng trống dài ``seconds`` theo chính sách ``report``; None nếu là nhịp bình thường."""
+    interval = policy.get("interval") or 0
+    if seconds <= interval * grace:
+        return None
+    max_silence = policy.get("max_silence") or 0
+    if max_silence and seconds <= max_silence * grace:
+        return GAP_UNCHANGED
+    return GAP_MISSING
+
+
+class GapTracker:
+    """Theo dõi mẫu cuối của từng thiết bị, sinh ``Gap`` khi hai mẫu cách xa nhau.
+
+    ``path``: nếu có, mỗi khoảng trống được ghi thêm vào file CSV đó (write-behind).
+    """
+
+    def __init__(self, path=None, grace=GRACE, **sink_options):
+        self.grace = grace
+        self.counts = dict.fromkeys(GAP_KINDS, 0)
+        self.seconds = dict.fromkeys(GAP_KINDS, 0.0)
+        self._last = {}
+        self._lock = threading.Lock()  # logger có thể chạy nhiều worker
+        self.path = path
+        self._sink = WriteBehindCSVSink(path, header=GAPS_HEADER, **sink_options) if path else None
+
+    def observe(self, device, ts, policy):
+        """Ghi nhận một mẫu; trả về ``Gap`` kết thúc tại mẫu này hoặc None."""
+        last = self._last.get(device)
+        if last is not None and ts <= last:
+            return None  # mẫu đến trễ (lệch thứ tự giữa các lô): không làm lùi mốc
+        self._last[device] = ts
+        if last is None or not policy:
+            return None
+        kind = classify(ts - last, policy, self.grace)
+        if kind is None:
+            return None
+        gap = Gap(device, last, ts, kind)
+        self.counts[kind] += 1
+        self.seconds[kind] += gap.seconds
+        if self._sink is not None:
+            self._sink.write(gap.to_csv_row())
+        return gap
+
+    def observe_many(self, samples, policy_for):
+        """``samples``: các cặp (thiết bị, ts) đã sắp theo thời gian; ``policy_for(thiết bị)`` trả về chính sách hoặc None."""
+        gaps = []
+        with self._lock:
+            for device, ts in samples:
+                gap = self.observe(device, ts, policy_for(device))
+                if gap is not None:
+                    gaps.append(gap)
+        return gaps
+
+    def close(self):
+        if self._sink is not None:
+            self._sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def scan(log_path, policy, device="unknown", grace=GRACE):
+    """Phân loại lại khoảng trống từ log gốc (mọi thiết bị dùng chung ``policy``)."""
+    from rollup import iter_log_readings
+
+    tracker = GapTracker(grace=grace)
+    for reading in iter_log_readings(log_path, device):
+        gap = tracker.observe(reading.device, reading.ts, policy)
+        if gap is not None:
+            yield gap
+
+
+def read_gaps(path):
+    """Đọc lại file khoảng trống thành các dòng CSV (bỏ header)."""
+    with open(path, encoding="utf-8", newline="") as f:
+        rows = csv.reader(f)
+        next(rows, None)
+        return list(rows)
+
+
+def print_gaps(rows):
+    from prettytable import PrettyTable
+
+    table = PrettyTable()
+    table.field_names = GAPS_HEADER
+    for row in rows:
+        table.add_row(row)
+    print(table)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Khoảng trống giữa các mẫu: unchanged hay missing")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_scan = sub.add_parser("scan", help="phân loại khoảng trống từ log gốc (CSV, .bin, .db)")
+    p_scan.add_argument("log")
+    p_scan.add_argument("--interval", type=float, required=True, help="chu kỳ lấy mẫu của thiết bị (giây)")
+    p_scan.add_argument("--max-silence", type=float, default=0.0,
+                        help="max_silence của chế độ report-by-exception (0 = thiết bị gửi mọi mẫu)")
+    p_scan.add_argument("--grace", type=float, default=GRACE, help="hệ số dung sai")
+    p_scan.add_argument("--device", default="unknown", help="tên thiết bị gán cho các dòng CSV không có cột thiết bị")
+    p_scan.add_argument("--kind", choices=GAP_KINDS, help="chỉ in loại này")
+
+    p_show = sub.add_parser("show", help="in file khoảng trống do logger ghi")
+    p_show.add_argument("file")
+    p_show.add_argument("--kind", choices=GAP_KINDS, help="chỉ in loại này")
+
+    args = parser.parse_args(argv)
+    if args.command == "scan":
+        policy = {"interval": args.interval, "max_silence": args.max_silence}
+        gaps = list(scan(args.log, policy, args.device, args.grace))
+        rows = [g.to_csv_row() for g in gaps if args.kind in (None, g.kind)]
+    else:
+        rows = [r for r in read_gaps(args.file) if args.kind in (None, r[3])]
+    print_gaps(rows)
+    for kind in GAP_KINDS:
+        selected = [float(r[4]) for r in rows if r[3] == kind]
+        if selected:
+            print(f"{kind}: {len(selected)} khoảng, tổng {sum(selected):.0f} giây")
+
+
+if __name__ == "__main__":
+    main()
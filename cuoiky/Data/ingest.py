@@ -0,0 +1,162 @@
+# ==================== ingest.py ====================
+"""
+Hàng đợi nạp dữ liệu có giới hạn + nhóm worker cho MQTT logger.
+
+Callback ``on_message`` của paho chỉ đặt message thô vào ``IngestQueue``;
+các worker của ``IngestPipeline`` lấy từng lô, giải mã và ghi ra sink. Nhờ
+vậy vòng lặp mạng MQTT không bao giờ chờ đĩa hay JSON.
+
+Khi hàng đợi đầy, hành vi theo ``policy``:
+- ``block``: chặn callback tới khi có chỗ (áp lực ngược về broker qua TCP).
+- ``drop-oldest``: bỏ message cũ nhất trong hàng đợi.
+- ``drop-newest``: bỏ message vừa tới.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import NamedTuple
+
+POLICY_BLOCK = "block"
+POLICY_DROP_OLDEST = "drop-oldest"
+POLICY_DROP_NEWEST = "drop-newest"
+OVERFLOW_POLICIES = (POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_DROP_NEWEST)
+
+
+class RawMessage(NamedTuple):
+    """Message MQTT chưa giải mã, kèm thời điểm nhận (epoch giây)."""
+    topic: str
+    payload: bytes
+    received: float
+
+
+class IngestQueue:
+    """Hàng đợi FIFO giới hạn ``maxsize`` phần tử với chính sách tràn và bộ đếm."""
+
+    def __init__(self, maxsize=10000, policy=POLICY_BLOCK):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"policy không hợp lệ: {policy!r}")
+        if maxsize < 1:
+            raise ValueError("maxsize phải >= 1")
+        self.maxsize = maxsize
+        self.policy = policy
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+        # Bộ đếm thống kê
+        self.enqueued = 0
+        self.dropped = 0
+        self.blocked = 0          # số lần put() phải chờ
+        self.high_watermark = 0
+
+    def put(self, item):
+        """Thêm một phần tử; trả về False nếu phần tử bị bỏ (drop-newest hoặc đã đóng)."""
+        with self._cond:
+            if self._closed:
+                return False
+            if len(self._items) >= self.maxsize:
+                if self.policy == POLICY_DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                if self.policy == POLICY_DROP_OLDEST:
+                    self._items.popleft()
+                    self.dropped += 1
+                else:
+                    self.blocked += 1
+                    while len(self._items) >= self.maxsize and not self._closed:
+                        self._cond.wait()
+                    if self._closed:
+                        return False
+            self._items.append(item)
+            self.enqueued += 1
+            if len(self._items) > self.high_watermark:
+                self.high_watermark = len(self._items)
+            self._cond.notify_all()
+            return True
+
+    def get_batch(self, max_items, timeout=None):
+        """Lấy tối đa ``max_items`` phần tử; chờ tối đa ``timeout`` giây nếu rỗng.
+
+        Trả về list rỗng khi hết giờ, hoặc khi hàng đợi đã đóng và rỗng.
+        """
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            n = min(max_items, len(self._items))
+            batch = [self._items.popleft() for _ in range(n)]
+            if batch:
+                self._cond.notify_all()  # đánh thức put() đang chặn
+            return batch
+
+    def close(self):
+        """Ngừng nhận phần tử mới; worker vẫn lấy nốt phần còn lại."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+
+class IngestPipeline:
+    """Nhóm ``workers`` luồng, mỗi luồng lấy lô từ hàng đợi và gọi ``handler(batch)``."""
+
+    def __init__(self, handler, workers=1, maxsize=10000, policy=POLICY_BLOCK,
+                 batch_size=500, poll_interval=0.5):
+        if workers < 1:
+            raise ValueError("workers phải >= 1")
+        self.handler = handler
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.queue = IngestQueue(maxsize, policy)
+        self.processed = 0
+        self.batches = 0
+        self.errors = 0
+        self._stats_lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._run, name=f"ingest-worker-{i}", daemon=True)
+                         for i in range(workers)]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, topic, payload, received=None):
+        """Gọi từ callback MQTT: chỉ đặt message thô vào hàng đợi.
+
+        ``received`` (epoch giây) mặc định là lúc gọi; capture.py truyền thời điểm đã ghi lại.
+        """
+        return self.queue.put(RawMessage(topic, payload, time.time() if received is None else received))
+
+    def _run(self):
+        q = self.queue
+        while True:
+            batch = q.get_batch(self.batch_size, self.poll_interval)
+            if not batch:
+                if q.closed and not len(q):
+                    return
+                continue
+            try:
+                self.handler(batch)
+            except Exception as e:
+                with self._stats_lock:
+                    self.errors += 1
+                print(f"⚠️ Lỗi khi xử lý lô {len(batch)} message: {e}")
+            with self._stats_lock:
+                self.processed += len(batch)
+                self.batches += 1
+
+    def close(self, timeout=None):
+        """Đóng hàng đợi, chờ worker xử lý hết phần còn lại."""
+        self.queue.close()
+        for t in self._threads:
+            t.join(timeout)
+
+    def stats(self):
+        q = self.queue
+        return {"queued": len(q), "enqueued": q.enqueued, "dropped": q.dropped,
+                "blocked": q.blocked, "high_watermark": q.high_watermark,
+                "processed": self.processed, "batches": self.batches, "errors": self.errors}
@@ -0,0 +1,200 @@
+# ==================== partitions.py ====================
+"""
+Lưu trữ phân vùng theo thiết bị và ngày cho MQTT logger.
+
+Mỗi thiết bị (namespace của topic, ví dụ ``luong_iot/room1``) có thư mục
+riêng, mỗi ngày (giờ địa phương) một file CSV định dạng cũ:
+
+    iot_data/luong_iot/room1/2025-10-30.csv
+    iot_data/demo/room1/2025-10-30.csv
+
+Đọc dữ liệu một thiết bị chỉ mở các file của thiết bị đó trong khoảng ngày
+cần thiết. ``PartitionedSink`` dùng chung một bộ đệm và một luồng flush cho
+mọi phân vùng, giữ tối đa ``max_open_files`` file mở (LRU), nên một process
+ghi được cho hàng trăm phòng.
+
+Dòng lệnh:
+    python partitions.py list iot_data
+    python partitions.py read iot_data luong_iot/room1 --from "2025-10-30 20:00:00" -n 20
+"""
+
+import argparse
+import csv
+import os
+import re
+import time
+from collections import OrderedDict
+
+from csv_sink import DURABILITY_NONE, WriteBehindSink
+from records import TIME_FORMAT, parse_time, reading_from_csv_row
+
+DATA_DIR = "iot_data"
+DAY_FORMAT = "%Y-%m-%d"
+PARTITION_HEADER = ["Time", "Temperature (°C)", "Humidity (%)", "Fan", "Light"]
+MAX_OPEN_FILES = 256
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9_.\-]")
+
+
+def device_dir(root, device):
+    """Thư mục của thiết bị; mỗi cấp của namespace là một thư mục con."""
+    parts = [_UNSAFE.sub("_", p) for p in str(device).split("/") if p not in ("", ".", "..")]
+    return os.path.join(root, *(parts or ["unknown"]))
+
+
+def partition_path(root, device, ts):
+    return os.path.join(device_dir(root, device), time.strftime(DAY_FORMAT, time.localtime(ts)) + ".csv")
+
+
+class PartitionedSink(WriteBehindSink):
+    """Sink write-behind ghi mỗi ``Reading`` vào file (thiết bị, ngày) của nó."""
+
+    thread_name = "partition-flusher"
+
+    def __init__(self, root=DATA_DIR, max_open_files=MAX_OPEN_FILES, **kwargs):
+        self.max_open_files = max_open_files
+        self._files = OrderedDict()  # đường dẫn -> (file, csv.writer), thứ tự LRU
+        self._unsynced = set()       # file đã ghi nhưng chưa fsync
+        self.partitions_opened = 0
+        super().__init__(root, **kwargs)
+
+    def _open(self):
+        os.makedirs(self.path, exist_ok=True)
+        return None
+
+    def _writer(self, path):
+        entry = self._files.get(path)
+        if entry is not None:
+            self._files.move_to_end(path)
+            return entry[1]
+        while len(self._files) >= self.max_open_files:
+            old_path, (old_file, _) = self._files.popitem(last=False)
+            old_file.flush()
+            if old_path in self._unsynced:
+                os.fsync(old_file.fileno())
+                self._unsynced.discard(old_path)
+            old_file.close()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        f = open(path, mode="a", newline="", encoding="utf-8")
+        writer = csv.writer(f)
+        if f.tell() == 0:
+            writer.writerow(PARTITION_HEADER)
+        self._files[path] = (f, writer)
+        self.partitions_opened += 1
+        return writer
+
+    def _write_items(self, items):
+        # Gom theo phân vùng để mỗi file chỉ nhận một lần writerows
+        groups = {}
+        day_cache = {}
+        for r in items:
+            # Ngày chỉ đổi ở ranh giới 15 phút (mọi múi giờ): tính localtime một lần mỗi khung
+            key = (r.device, int(r.ts // 900))
+            if key not in day_cache:
+                day_cache[key] = partition_path(self.path, r.device, r.ts)
+            groups.setdefault(day_cache[key], []).append(r.to_csv_row(with_device=False))
+        for path, rows in groups.items():
+            writer = self._writer(path)
+            f = self._files[path][0]
+            before = f.tell()
+            writer.writerows(rows)
+            self.bytes_written += f.tell() - before
+            if self.durability != DURABILITY_NONE:
+                self._unsynced.add(path)
+
+    def _flush_files(self):
+        for f, _ in self._files.values():
+            f.flush()
+
+    def _sync_files(self):
+        for path in list(self._unsynced):
+            entry = self._files.get(path)
+            if entry is not None:
+                os.fsync(entry[0].fileno())
+        self._unsynced.clear()
+
+    def _close_files(self):
+        for f, _ in self._files.values():
+            f.close()
+        self._files.clear()
+
+
+# ---------- Đọc ----------
+
+def list_devices(root=DATA_DIR):
+    """Tên các thiết bị có dữ liệu (đường dẫn tương đối dạng ``a/b``)."""
+    devices = []
+    for dirpath, _, filenames in os.walk(root):
+        if any(f.endswith(".csv") for f in filenames):
+            devices.append(os.path.relpath(dirpath, root).replace(os.sep, "/"))
+    return sorted(devices)
+
+
+def device_days(root, device):
+    """Các file ngày của một thiết bị, sắp theo thời gian."""
+    directory = device_dir(root, device)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".csv"))
+
+
+def iter_device(root, device, start=None, end=None):
+    """Các Reading của một thiết bị có ``start <= ts < end``; chỉ mở các ngày liên quan.
+
+    Trong một file ngày, mẫu backlog (gửi lại sau khi mất kết nối) nằm sau các mẫu
+    mới hơn, nên mỗi file ngày được đọc hết thay vì dừng ở dòng đầu tiên >= ``end``.
+    """
+    first_day = time.strftime(DAY_FORMAT, time.localtime(start)) if start is not None else None
+    last_day = time.strftime(DAY_FORMAT, time.localtime(end)) if end is not None else None
+    for path in device_days(root, device):
+        day = os.path.basename(path)[:-4]
+        if (first_day and day < first_day) or (last_day and day > last_day):
+            continue
+        with open(path, encoding="utf-8", errors="replace", newline="") as f:
+            for row in csv.reader(f):
+                reading = reading_from_csv_row(row, device)
+                if reading is None or (start is not None and reading.ts < start):
+                    continue
+                if end is not None and reading.ts >= end:
+                    continue
+                yield reading
+
+
+def main(argv=None):
+    from prettytable import PrettyTable
+
+    parser = argparse.ArgumentParser(description="Dữ liệu IoT phân vùng theo thiết bị/ngày")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_list = sub.add_parser("list", help="liệt kê thiết bị và số ngày dữ liệu")
+    p_list.add_argument("root", nargs="?", default=DATA_DIR)
+    p_read = sub.add_parser("read", help="đọc dữ liệu một thiết bị")
+    p_read.add_argument("root")
+    p_read.add_argument("device")
+    p_read.add_argument("--from", dest="start", help=f"thời điểm bắt đầu ({TIME_FORMAT.replace('%', '%%')})")
+    p_read.add_argument("--to", dest="end", help=f"thời điểm kết thúc, không tính ({TIME_FORMAT.replace('%', '%%')})")
+    p_read.add_argument("-n", "--rows", type=int, default=20, help="chỉ in N dòng cuối")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        table = PrettyTable()
+        table.field_names = ["Thiết bị", "Số ngày", "Ngày đầu", "Ngày cuối", "Kích thước"]
+        for device in list_devices(args.root):
+            days = device_days(args.root, device)
+            size = sum(os.path.getsize(p) for p in days)
+            table.add_row([device, len(days), os.path.basename(days[0])[:-4],
+                           os.path.basename(days[-1])[:-4], f"{size:,} B"])
+        print(table)
+        return
+
+    start = parse_time(args.start) if args.start else None
+    end = parse_time(args.end) if args.end else None
+    rows = list(iter_device(args.root, args.device, start, end))[-args.rows:]
+    table = PrettyTable()
+    table.field_names = ["Thời gian", "Nhiệt độ (°C)", "Độ ẩm (%)", "Quạt", "Đèn"]
+    for r in rows:
+        table.add_row([r.time_str(), r.temp, r.hum, r.fan, r.light])
+    print(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,58 +1,234 @@
 # ==================== read_log.py ====================
+import argparse
 import csv
 import os
+import time
 from prettytable import PrettyTable
-from collections import deque
+
+from records import TIME_FORMAT, parse_time
+from sqlite_sink import is_sqlite_path, iter_range as iter_sqlite_range, tail as tail_sqlite
 
 LOG_FILE = "iot_log.csv"
 MAX_ROWS = 5  # số dòng mới nhất muốn xem
+BLOCK_SIZE = 8192  # kích thước khối khi đọc ngược từ cuối file
+POLL_INTERVAL = 0.5  # chu kỳ kiểm tra file khi --follow (giây)
+
+TABLE_HEADER = ["Thời gian", "Nhiệt độ (°C)", "Độ ẩm (%)", "Quạt", "Đèn", "Thiết bị"]
+
+
+def read_header(path):
+    """Dòng header của file CSV (danh sách tên cột)."""
+    with open(path, 'r', encoding='utf-8', errors='ignore', newline='') as f:
+        return next(csv.reader(f), [])
+
+
+def tail_lines(path, n, block_size=BLOCK_SIZE):
+    """N dòng cuối của file, đọc từng khối ngược từ cuối.
+
+    Chi phí tỉ lệ với N (và độ dài dòng), không phụ thuộc kích thước file.
+    Dòng đầu tiên (header) không bao giờ được trả về.
+    """
+    if n <= 0:
+        return []
+    with open(path, 'rb') as f:
+        end = f.seek(0, os.SEEK_END)
+        pos = end
+        data = b""
+        # Cần n+1 ký tự xuống dòng để chắc chắn có đủ n dòng trọn vẹn
+        while pos > 0 and data.count(b"\n") <= n:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+
+    lines = data.splitlines()
+    if pos == 0 and lines:
+        lines = lines[1:]  # bỏ header
+    return [line.decode('utf-8', errors='ignore') for line in lines[-n:] if line.strip()]
+
+
+def make_column_finder(headers):
+    def find_col(*options):
+        for opt in options:
+            for i, h in enumerate(headers):
+                if opt.lower() in h.lower():
+                    return i
+        return None
+
+    cols = [
+        find_col("time", "timestamp", "date"),
+        find_col("temp", "temperature", "temp_c"),
+        find_col("hum", "humidity", "hum_pct"),
+        find_col("fan", "device", "motor"),
+        find_col("light", "status", "led"),
+    ]
+    # Header không nhận ra (ví dụ header tiếng Việt do server.py ghi): dùng thứ tự cột mặc định
+    if all(c is None for c in cols):
+        cols = [0, 1, 2, 3, 4]
 
-def read_log():
-    if not os.path.exists(LOG_FILE):
-        print("Không tìm thấy file iot_log.csv. Hãy chạy server trước để tạo log.")
+    def pick(row):
+        # Thiết bị luôn là cột thứ 6 (như records.reading_from_csv_row), không tìm theo tên:
+        # header cũ "Time,Temperature,Humidity,Device,Status" dùng "Device" cho quạt
+        return ([row[c] if c is not None and c < len(row) else "" for c in cols]
+                + [row[5] if len(row) > 5 else ""])
+
+    return pick
+
+
+def read_binlog_rows(path, n):
+    """N bản ghi cuối của file binlog (binlog.py) dưới dạng các dòng bảng."""
+    from binlog import BinaryLogReader
+
+    with BinaryLogReader(path) as reader:
+        return [[r.time_str(), r.temp, r.hum, r.fan, r.light, r.device] for r in reader.tail(n)]
+
+
+def read_sqlite_rows(path, n, device=None, start=None, end=None):
+    """Các dòng bảng từ cơ sở dữ liệu SQLite (sqlite_sink.py).
+
+    Không có khoảng thời gian: N mẫu mới nhất (``ORDER BY ts DESC LIMIT N``).
+    Có ``start``/``end``: mọi mẫu trong khoảng. Cả hai dùng chỉ mục ``ts``
+    hoặc ``(device, ts)`` nên không quét toàn bảng.
+    """
+    if start is None and end is None:
+        readings = tail_sqlite(path, n, device)
+    else:
+        readings = iter_sqlite_range(path, start, end, device)
+    return [[r.time_str(), r.temp, r.hum, r.fan, r.light, r.device] for r in readings]
+
+
+def read_log(path=LOG_FILE, max_rows=MAX_ROWS, device=None, start=None, end=None):
+    if not os.path.exists(path):
+        print(f"Không tìm thấy file {path}. Hãy chạy server trước để tạo log.")
         return
 
     print("=== DỮ LIỆU LOG IOT (mới nhất) ===")
 
     try:
-        with open(LOG_FILE, 'r', encoding='utf-8', errors='ignore', newline='') as f:
-            reader = csv.DictReader(f)
-            rows = deque(reader, maxlen=MAX_ROWS)
-            headers = reader.fieldnames or []
+        if is_sqlite_path(path):
+            rows = read_sqlite_rows(path, max_rows, device, start, end)
+        elif device is not None or start is not None or end is not None:
+            print("--device/--from/--to chỉ hỗ trợ cơ sở dữ liệu SQLite (.db).")
+            return
+        elif path.endswith(".bin"):
+            rows = read_binlog_rows(path, max_rows)
+        else:
+            pick = make_column_finder(read_header(path))
+            rows = list(csv.reader(tail_lines(path, max_rows)))
+            if len(rows) < max_rows:
+                # File hoạt động vừa xoay vòng: lấy thêm từ các đoạn đã đóng (segments.py)
+                from segments import tail_segment_rows
+
+                rows = tail_segment_rows(path, max_rows - len(rows)) + rows
+            rows = [pick(row) for row in rows]
 
         if not rows:
             print("(Không có dữ liệu trong log)")
             return
 
-        def find_col(*options):
-            for opt in options:
-                for h in headers:
-                    if opt.lower() in h.lower():
-                        return h
-            return ""
-
-        col_time = find_col("time", "timestamp", "date")
-        col_temp = find_col("temp", "temperature", "temp_c")
-        col_hum = find_col("hum", "humidity", "hum_pct")
-        col_fan = find_col("fan", "device", "motor")
-        col_light = find_col("light", "status", "led")
-
         table = PrettyTable()
-        table.field_names = ["Thời gian", "Nhiệt độ (°C)", "Độ ẩm (%)", "Quạt", "Đèn"]
-
+        table.field_names = TABLE_HEADER
         for row in rows:
-            table.add_row([
-                row.get(col_time, ""),
-                row.get(col_temp, ""),
-                row.get(col_hum, ""),
-                row.get(col_fan, ""),
-                row.get(col_light, "")
-            ])
+            table.add_row(row)
 
         print(table)
 
     except Exception as e:
         print(f"Lỗi khi đọc log: {e}")
 
+
+def _split_lines(data):
+    """(các dòng đầy đủ đã giải mã, phần dở cuối cùng) của một khối byte."""
+    lines = data.split(b"\n")
+    partial = lines.pop()
+    return [line.rstrip(b"\r").decode('utf-8', errors='ignore') for line in lines if line.strip()], partial
+
+
+def follow_lines(path, poll_interval=POLL_INTERVAL):
+    """Sinh các dòng mới được ghi thêm vào file (giống ``tail -F``).
+
+    Kiểm tra bằng stat định kỳ; khi file bị xoay vòng (inode đổi) hoặc bị cắt
+    ngắn, đọc nốt file cũ tới EOF (kể cả dòng dở cuối cùng) rồi mở lại và đọc
+    file mới từ đầu.
+    """
+    f = None
+    partial = b""
+    try:
+        while True:
+            if f is None:
+                try:
+                    f = open(path, 'rb')
+                except FileNotFoundError:
+                    time.sleep(poll_interval)
+                    continue
+                if partial is None:
+                    # File mới sau khi xoay vòng: bỏ header
+                    f.readline()
+                else:
+                    f.seek(0, os.SEEK_END)
+                partial = b""
+
+            chunk = f.read()
+            if chunk:
+                lines, partial = _split_lines(partial + chunk)
+                yield from lines
+                continue
+
+            time.sleep(poll_interval)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if st.st_ino != os.fstat(f.fileno()).st_ino or st.st_size < f.tell():
+                # Các dòng ghi thêm giữa lần đọc cuối và lúc xoay vòng vẫn nằm
+                # trong file cũ: đọc nốt trước khi chuyển sang file mới
+                lines, partial = _split_lines(partial + f.read())
+                yield from lines
+                yield from _split_lines(partial + b"\n")[0]
+                f.close()
+                f = None
+                partial = None  # đánh dấu: đọc file mới từ đầu
+    finally:
+        if f is not None:
+            f.close()
+
+
+def follow_log(path=LOG_FILE, max_rows=MAX_ROWS, poll_interval=POLL_INTERVAL):
+    """In N dòng cuối rồi theo dõi các dòng mới cho tới khi Ctrl+C."""
+    read_log(path, max_rows)
+    if path.endswith(".bin") or is_sqlite_path(path):
+        print("--follow chỉ hỗ trợ file CSV.")
+        return
+    print(f"👀 Đang theo dõi {path} (Ctrl+C để dừng)...")
+    pick = make_column_finder(read_header(path)) if os.path.exists(path) else make_column_finder([])
+    try:
+        for line in follow_lines(path, poll_interval):
+            row = next(csv.reader([line]), [])
+            print(" | ".join(str(v) for v in pick(row)))
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Xem các dòng mới nhất của log IoT")
+    parser.add_argument("--file", default=LOG_FILE, help="file log (.csv, .bin hoặc SQLite .db)")
+    parser.add_argument("-n", "--rows", type=int, default=MAX_ROWS, help="số dòng mới nhất muốn xem")
+    parser.add_argument("--device", help="chỉ xem thiết bị này (SQLite)")
+    parser.add_argument("--from", dest="start", help=f"xem từ thời điểm này, {TIME_FORMAT.replace('%', '%%')} (SQLite)")
+    parser.add_argument("--to", dest="end", help="xem tới thời điểm này, không tính (SQLite)")
+    parser.add_argument("-f", "--follow", action="store_true",
+                        help="tiếp tục in các dòng mới được ghi thêm (xử lý cả xoay vòng log)")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL,
+                        help="chu kỳ kiểm tra file khi --follow (giây)")
+    args = parser.parse_args(argv)
+
+    if args.follow:
+        follow_log(args.file, args.rows, args.interval)
+    else:
+        start = parse_time(args.start) if args.start else None
+        end = parse_time(args.end) if args.end else None
+        read_log(args.file, args.rows, args.device, start, end)
+
+
 if __name__ == "__main__":
-    read_log()
+    main()
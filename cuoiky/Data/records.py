@@ -0,0 +1,129 @@
+# ==================== records.py ====================
+"""
+Kiểu bản ghi dùng chung giữa logger và các backend lưu trữ.
+"""
+
+import csv
+import time
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Header của iot_log.csv, theo thứ tự Reading.to_csv_row(). Cột thiết bị (namespace) ở cuối:
+# một iot_log.csv nhận mọi phòng của wildcard +/+/sensor/#
+CSV_HEADER = ["Thời gian", "Nhiệt độ (°C)", "Độ ẩm (%)", "Trạng thái Quạt", "Trạng thái Đèn", "Thiết bị"]
+
+# Nhánh topic sau namespace thiết bị: <owner>/<room>/{sensor,device,sys}/...
+TOPIC_CHANNELS = ("sensor", "device", "sys")
+
+
+class Reading(NamedTuple):
+    """Một mẫu cảm biến đã giải mã.
+
+    ``ts`` là epoch (giây, float); ``temp``/``hum`` là None khi thiết bị không gửi.
+    """
+    ts: float
+    device: str
+    temp: Optional[float]
+    hum: Optional[float]
+    fan: str = "unknown"
+    light: str = "unknown"
+
+    def time_str(self):
+        return datetime.fromtimestamp(self.ts).strftime(TIME_FORMAT)
+
+    def to_csv_row(self, with_device=True):
+        """Dòng CSV của iot_log.csv: Time, Temp, Hum, Fan, Light, Device.
+
+        Cột thiết bị nằm cuối nên công cụ đọc định dạng cũ (5 cột) vẫn dùng
+        được; ``with_device=False`` cho file đã tách theo thiết bị (partitions.py).
+        """
+        row = [self.time_str(), self.temp, self.hum, self.fan, self.light]
+        if with_device:
+            row.append(self.device)
+        return row
+
+
+class Lateness:
+    """Độ trễ tối đa của một chuỗi thời gian gần như tăng dần (thứ tự ghi log).
+
+    Mẫu trong lô của thiết bị (sensor/batch, backlog store-and-forward) mang
+    thời điểm đo, nên log không còn tăng dần tuyệt đối. ``lateness`` là khoảng
+    lớn nhất một dòng đứng sau thời gian mới nhất trước nó. Mọi dòng phía sau
+    một dòng có thời gian ``t`` đều có thời gian ``>= t - lateness``, và mọi dòng
+    phía trước đều ``<= t + lateness``. Nhờ vậy vẫn tìm nhị phân và dừng quét
+    sớm được, chỉ cần nới giới hạn thêm ``lateness``.
+    """
+
+    def __init__(self, latest=None, lateness=0.0):
+        self.latest = latest
+        self.lateness = lateness
+
+    def observe(self, ts):
+        if self.latest is None or ts >= self.latest:
+            self.latest = ts
+        elif self.latest - ts > self.lateness:
+            self.lateness = self.latest - ts
+
+
+class TopicInfo(NamedTuple):
+    """Các phần của topic ``<namespace>/<channel>``, ví dụ ``luong_iot/room1`` + ``sensor/data``."""
+    namespace: str
+    room: str
+    channel: str
+
+
+def parse_topic(topic):
+    """Tách namespace thiết bị, phòng và kênh từ topic; None nếu không đúng cấu trúc."""
+    parts = topic.split("/")
+    for i in range(1, len(parts)):
+        if parts[i] in TOPIC_CHANNELS:
+            return TopicInfo("/".join(parts[:i]), parts[i - 1], "/".join(parts[i:]))
+    return None
+
+
+def parse_time(text):
+    """Chuỗi thời gian theo TIME_FORMAT (giờ địa phương) -> epoch giây."""
+    return time.mktime(datetime.strptime(text.strip(), TIME_FORMAT).timetuple())
+
+
+def _to_float(value):
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def reading_from_csv_row(row, device="unknown"):
+    """Một dòng CSV -> Reading; None nếu dòng hỏng (hoặc là header).
+
+    Thiết bị lấy từ cột thứ 6; ``device`` chỉ dùng cho dòng định dạng cũ không có cột này.
+    """
+    if len(row) < 3:
+        return None
+    try:
+        ts = parse_time(row[0])
+    except ValueError:
+        return None
+    if len(row) > 5 and row[5]:
+        device = row[5]
+    return Reading(ts, device, _to_float(row[1]), _to_float(row[2]),
+                   row[3] if len(row) > 3 else "unknown",
+                   row[4] if len(row) > 4 else "unknown")
+
+
+def iter_csv_readings(path, device="unknown"):
+    """Đọc iot_log.csv (Time, Temp, Hum, Fan, Light[, Device]) thành các Reading.
+
+    Bỏ qua header và các dòng hỏng; ``device`` gán cho dòng không có cột thiết bị.
+    """
+    with open(path, encoding="utf-8", errors="replace", newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            reading = reading_from_csv_row(row, device)
+            if reading is not None:
+                yield reading
@@ -0,0 +1,299 @@
+# ==================== rollup.py ====================
+"""
+Tổng hợp chuỗi thời gian tăng dần (rollup) cho MQTT logger.
+
+Mỗi mẫu ``Reading`` cập nhật các bucket (count, sum, min, max, last) của nhiệt
+độ và độ ẩm theo từng thiết bị, ở nhiều độ phân giải (mặc định 1 phút, 1 giờ,
+1 ngày). Bucket được căn theo giờ địa phương, nên bucket "1d" là một ngày lịch.
+
+Bucket đang mở nằm trong RAM; khi có mẫu thuộc bucket mới (hoặc khi logger
+dừng) bucket cũ được ghi thêm vào file CSV cạnh log gốc, ví dụ
+``iot_log.rollup_1h.csv``. Các dòng cùng (bucket, thiết bị, chỉ số) có thể
+xuất hiện nhiều lần (logger khởi động lại giữa chừng một bucket); ``query()``
+gộp chúng lại, nên file chỉ cần ghi nối.
+
+Dòng lệnh:
+    python rollup.py query iot_log.csv --res 1h --from "2025-10-30 00:00:00"
+    python rollup.py rebuild iot_log.csv
+"""
+
+import argparse
+import csv
+import math
+import os
+import threading
+import time
+from datetime import datetime
+from typing import NamedTuple
+
+from csv_sink import WriteBehindCSVSink
+from records import TIME_FORMAT, parse_time, reading_from_csv_row
+
+RESOLUTIONS = {"1m": 60, "1h": 3600, "1d": 86400}
+DEFAULT_RESOLUTIONS = ("1m", "1h", "1d")
+METRICS = ("temp", "hum")
+ROLLUP_HEADER = ["bucket", "time", "device", "metric", "count", "sum", "min", "max", "last"]
+
+# Bucket đã đóng ít khi được ghi, không cần flush dày như log gốc
+ROLLUP_FLUSH_ROWS = 500
+ROLLUP_FLUSH_INTERVAL = 5.0
+
+
+class Bucket(NamedTuple):
+    """Một bucket tổng hợp; ``start`` là epoch (giây) đầu bucket."""
+    start: int
+    device: str
+    metric: str
+    count: int
+    sum: float
+    min: float
+    max: float
+    last: float
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def time_str(self):
+        return datetime.fromtimestamp(self.start).strftime(TIME_FORMAT)
+
+    def merge(self, other):
+        """Gộp hai phần của cùng một bucket; ``other`` là phần ghi sau."""
+        return self._replace(count=self.count + other.count,
+                             sum=self.sum + other.sum,
+                             min=min(self.min, other.min),
+                             max=max(self.max, other.max),
+                             last=other.last)
+
+    def to_csv_row(self):
+        return [self.start, self.time_str(), self.device, self.metric,
+                self.count, round(self.sum, 4), self.min, self.max, self.last]
+
+
+def rollup_path(log_path, resolution):
+    """File rollup nằm cạnh log gốc: ``iot_log.csv`` -> ``iot_log.rollup_1h.csv``."""
+    return f"{os.path.splitext(log_path)[0]}.rollup_{resolution}.csv"
+
+
+def bucket_start(ts, seconds):
+    """Đầu bucket chứa ``ts``, căn theo giờ địa phương."""
+    offset = time.localtime(ts).tm_gmtoff
+    return int((ts + offset) // seconds * seconds - offset)
+
+
+def _metric_value(value):
+    if value is None or value == "":
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+class RollupStore:
+    """Các bucket đang mở trong RAM + một sink CSV ghi nối cho mỗi độ phân giải.
+
+    ``update()`` an toàn khi gọi từ nhiều luồng; ``close()`` ghi các bucket
+    còn mở rồi đóng file.
+    """
+
+    def __init__(self, log_path, resolutions=DEFAULT_RESOLUTIONS,
+                 flush_rows=ROLLUP_FLUSH_ROWS, flush_interval=ROLLUP_FLUSH_INTERVAL, **sink_options):
+        for res in resolutions:
+            if res not in RESOLUTIONS:
+                raise ValueError(f"Độ phân giải không hợp lệ: {res!r}")
+        self.log_path = log_path
+        self.resolutions = tuple(resolutions)
+        self.sinks = {res: WriteBehindCSVSink(rollup_path(log_path, res), header=ROLLUP_HEADER,
+                                              flush_rows=flush_rows, flush_interval=flush_interval,
+                                              **sink_options)
+                      for res in self.resolutions}
+        self._open = {}  # (res, device, metric) -> Bucket đang mở
+        self._lock = threading.Lock()
+        self.buckets_written = 0
+
+    def update(self, reading):
+        """Đưa một mẫu vào các bucket tương ứng."""
+        self.update_many((reading,))
+
+    def update_many(self, readings):
+        """Đưa cả lô mẫu vào các bucket trong một lần khóa."""
+        with self._lock:
+            for reading in readings:
+                self._update(reading)
+
+    def _update(self, reading):
+        """Cập nhật bucket cho một mẫu (gọi khi đang giữ khóa)."""
+        for metric in METRICS:
+            value = _metric_value(getattr(reading, metric))
+            if value is None:
+                continue
+            for res in self.resolutions:
+                start = bucket_start(reading.ts, RESOLUTIONS[res])
+                sample = Bucket(start, reading.device, metric, 1, value, value, value, value)
+                key = (res, reading.device, metric)
+                current = self._open.get(key)
+                if current is None or start > current.start:
+                    if current is not None:
+                        self._emit(res, current)
+                    self._open[key] = sample
+                elif start == current.start:
+                    self._open[key] = current.merge(sample)
+                else:
+                    # Mẫu đến trễ thuộc bucket đã đóng: ghi riêng, query() sẽ gộp
+                    self._emit(res, sample)
+
+    def _emit(self, res, bucket):
+        self.sinks[res].write(bucket.to_csv_row())
+        self.buckets_written += 1
+
+    def open_buckets(self, resolution):
+        """Các bucket đang mở (chưa ghi xuống file) của một độ phân giải."""
+        with self._lock:
+            return [b for (res, _, _), b in self._open.items() if res == resolution]
+
+    def query(self, resolution, device=None, metric=None, start=None, end=None):
+        """Như ``query()`` của module, có tính cả các bucket đang mở."""
+        self.sinks[resolution].flush()
+        extra = self.open_buckets(resolution)
+        return query(self.log_path, resolution, device, metric, start, end, extra=extra)
+
+    def close(self):
+        with self._lock:
+            for (res, _, _), bucket in self._open.items():
+                self._emit(res, bucket)
+            self._open.clear()
+        for sink in self.sinks.values():
+            sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def read_buckets(path):
+    """Đọc các dòng của một file rollup (chưa gộp)."""
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            if len(row) < len(ROLLUP_HEADER):
+                continue  # dòng ghi dở khi crash
+            try:
+                yield Bucket(int(row[0]), row[2], row[3], int(row[4]),
+                             float(row[5]), float(row[6]), float(row[7]), float(row[8]))
+            except ValueError:
+                continue
+
+
+def query(log_path, resolution, device=None, metric=None, start=None, end=None, extra=()):
+    """Các bucket của ``log_path`` ở độ phân giải ``resolution``, đã gộp và sắp theo thời gian.
+
+    ``start``/``end`` là epoch giây; lấy các bucket có ``start <= bucket.start < end``.
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Độ phân giải không hợp lệ: {resolution!r}")
+    merged = {}
+    for b in (*read_buckets(rollup_path(log_path, resolution)), *extra):
+        if device is not None and b.device != device:
+            continue
+        if metric is not None and b.metric != metric:
+            continue
+        if start is not None and b.start < start:
+            continue
+        if end is not None and b.start >= end:
+            continue
+        key = (b.start, b.device, b.metric)
+        merged[key] = merged[key].merge(b) if key in merged else b
+    return sorted(merged.values(), key=lambda b: (b.start, b.device, b.metric))
+
+
+def iter_log_readings(log_path, device="unknown"):
+    """Các ``Reading`` của log gốc (CSV, kể cả các đoạn đã xoay vòng, binlog ``.bin`` hoặc SQLite ``.db``)."""
+    from sqlite_sink import is_sqlite_path
+
+    if is_sqlite_path(log_path):
+        from sqlite_sink import iter_range
+
+        yield from iter_range(log_path)
+    elif log_path.endswith(".bin"):
+        from binlog import BinaryLogReader
+
+        with BinaryLogReader(log_path) as reader:
+            yield from reader.iter_readings()
+    else:
+        from segments import iter_log_files, open_text
+
+        for path in iter_log_files(log_path):
+            with open_text(path) as f:
+                for row in csv.reader(f):
+                    reading = reading_from_csv_row(row, device)
+                    if reading is not None:
+                        yield reading
+
+
+def rebuild(log_path, resolutions=DEFAULT_RESOLUTIONS, device="unknown"):
+    """Tạo lại các file rollup từ log gốc; trả về số mẫu đã đọc."""
+    for res in resolutions:
+        path = rollup_path(log_path, res)
+        if os.path.exists(path):
+            os.remove(path)
+    count = 0
+    with RollupStore(log_path, resolutions, flush_rows=4096) as store:
+        for reading in iter_log_readings(log_path, device):
+            store.update(reading)
+            count += 1
+    return count
+
+
+def print_buckets(buckets):
+    from prettytable import PrettyTable
+
+    table = PrettyTable()
+    table.field_names = ["Thời gian", "Thiết bị", "Chỉ số", "Số mẫu", "Min", "Max", "Trung bình", "Cuối"]
+    for b in buckets:
+        table.add_row([b.time_str(), b.device, b.metric, b.count,
+                       round(b.min, 2), round(b.max, 2), round(b.mean, 2), round(b.last, 2)])
+    print(table)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rollup (tổng hợp theo phút/giờ/ngày) của log IoT")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_query = sub.add_parser("query", help="xem các bucket tổng hợp")
+    p_query.add_argument("log", help="file log gốc (.csv hoặc .bin)")
+    p_query.add_argument("--res", choices=list(RESOLUTIONS), default="1h", help="độ phân giải")
+    p_query.add_argument("--device", help="chỉ lấy thiết bị này")
+    p_query.add_argument("--metric", choices=METRICS, help="chỉ lấy chỉ số này")
+    p_query.add_argument("--from", dest="start", help=f"thời điểm bắt đầu ({TIME_FORMAT.replace('%', '%%')})")
+    p_query.add_argument("--to", dest="end", help=f"thời điểm kết thúc, không tính ({TIME_FORMAT.replace('%', '%%')})")
+
+    p_rebuild = sub.add_parser("rebuild", help="tạo lại file rollup từ log gốc")
+    p_rebuild.add_argument("log", help="file log gốc (.csv hoặc .bin)")
+    p_rebuild.add_argument("--res", default=",".join(DEFAULT_RESOLUTIONS),
+                           help="các độ phân giải, cách nhau bởi dấu phẩy")
+    p_rebuild.add_argument("--device", default="unknown", help="tên thiết bị gán cho các dòng CSV không có cột thiết bị")
+
+    args = parser.parse_args(argv)
+    if args.command == "query":
+        start = parse_time(args.start) if args.start else None
+        end = parse_time(args.end) if args.end else None
+        buckets = query(args.log, args.res, args.device, args.metric, start, end)
+        if not buckets:
+            print("(Không có bucket nào; chạy 'rebuild' nếu log có trước khi bật rollup)")
+            return
+        print_buckets(buckets)
+    else:
+        resolutions = [r.strip() for r in args.res.split(",") if r.strip()]
+        n = rebuild(args.log, resolutions, args.device)
+        print(f"✅ Đã tổng hợp {n} mẫu vào " + ", ".join(rollup_path(args.log, r) for r in resolutions))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+# ==================== schemas.py ====================
+"""
+Registry schema payload: ánh xạ (mẫu topic, firmware) -> bộ giải mã đã biên dịch.
+
+Mỗi loại thiết bị gửi JSON một kiểu (simulator: ``temp_c``/``hum_pct`` trên
+``sensor/state``; firmware ESP32: ``temp``/``humidity`` trên ``sensor/data``).
+Thay vì chuỗi ``data.get("temp") or data.get("temperature")`` cho mỗi message
+(coi ``0.0`` là thiếu), mỗi ``Schema`` khai báo trường nguồn và đơn vị, rồi được
+biên dịch một lần thành hàm Python chuyên biệt. Registry nhớ schema đã chọn cho
+từng (topic, firmware), nên mỗi message chỉ tốn: parse JSON (orjson nếu có) +
+một lần gọi hàm trích xuất -> ``records.Reading``.
+
+Payload nhị phân (``common/payload.py``) được nhận diện bằng byte đầu: frame
+``struct`` được giải nén thẳng vào ``Reading`` (không qua dict), CBOR được
+đưa qua cùng bộ trích xuất như JSON. Topic có hậu tố ``/bin``/``/cbor`` dùng
+schema của topic gốc. Lô mẫu (``sensor/batch``: mảng JSON/CBOR hoặc frame
+0xF3) được ``decode_many()`` tách thành nhiều ``Reading``, mỗi mẫu giữ thời
+điểm đo của thiết bị.
+
+Schema tùy chỉnh có thể nạp từ file JSON (``--schemas``)::
+
+    [{"name": "khac", "topic": "+/+/sensor/data", "firmware": "v2.",
+      "fields": {"temp": {"keys": ["t"], "unit": "f_to_c"}, "hum": {"keys": ["h"]}}}]
+"""
+
+import json
+import os
+import sys
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from records import Reading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.payload import (BATCH_V1, HAS_HUM, HAS_TEMP, SENSOR_FRAME, SENSOR_V1, cbor2,  # noqa: E402
+                            iter_batch_frame, split_topic)
+
+try:
+    import orjson
+except ImportError:  # orjson là tùy chọn; json chuẩn vẫn chạy
+    orjson = None
+
+_json_decode = json.JSONDecoder().decode
+
+
+def json_loads(payload):
+    """``json.loads`` cho payload bytes (giải mã UTF-8 trực tiếp, không dò encoding)."""
+    if payload.__class__ is not str:
+        payload = bytes(payload).decode("utf-8")
+    return _json_decode(payload)
+
+
+if orjson is not None:
+    loads = orjson.loads
+else:
+    loads = json_loads
+
+# Chuyển đổi đơn vị -> giá trị chuẩn (°C, %)
+CONVERSIONS = {
+    "c": float,
+    "pct": float,
+    "f_to_c": lambda v: (float(v) - 32.0) * 5.0 / 9.0,
+    "k_to_c": lambda v: float(v) - 273.15,
+    "ratio_to_pct": lambda v: float(v) * 100.0,   # 0..1 -> %
+    "tenths": lambda v: float(v) / 10.0,          # 275 -> 27.5
+    "str": str,
+}
+
+# Trường của Reading mà schema có thể khai báo, kèm đơn vị mặc định
+FIELDS = {"temp": "c", "hum": "pct", "fan": "str", "light": "str", "device": "str"}
+
+
+class Field(NamedTuple):
+    keys: Tuple[str, ...]   # khóa JSON thử lần lượt; lấy khóa đầu tiên có giá trị khác null
+    unit: str
+
+
+class Schema(NamedTuple):
+    name: str
+    topic: str                      # mẫu topic MQTT (+ và #)
+    fields: Dict[str, Field]
+    firmware: Optional[str] = None  # tiền tố firmware (trường "fw" của device/state); None = mọi firmware
+
+
+def topic_matches(pattern, topic):
+    """So khớp topic với mẫu MQTT có ``+`` và ``#``."""
+    p_parts = pattern.split("/")
+    t_parts = topic.split("/")
+    for i, p in enumerate(p_parts):
+        if p == "#":
+            return True
+        if i >= len(t_parts) or (p != "+" and p != t_parts[i]):
+            return False
+    return len(p_parts) == len(t_parts)
+
+
+def compile_schema(schema):
+    """Sinh hàm ``extract(data, received, fallback_device, state) -> Reading`` cho schema.
+
+    Hàm sinh ra chỉ có các phép ``dict.get`` cố định và so sánh ``is None``,
+    không duyệt cấu hình lúc chạy.
+    """
+    env = {"Reading": Reading}
+    lines = ["def extract(d, received, fallback_device, state):",
+             "    get = d.get"]
+    for name in ("temp", "hum", "fan", "light", "device"):
+        field = schema.fields.get(name)
+        if field is None:
+            lines.append(f"    {name} = None")
+            continue
+        lines.append(f"    {name} = get({field.keys[0]!r})")
+        for key in field.keys[1:]:
+            lines.append(f"    if {name} is None:")
+            lines.append(f"        {name} = get({key!r})")
+        conv = CONVERSIONS[field.unit]
+        if conv is float:
+            # Giá trị JSON thường đã là float: chỉ chuyển khi là int/chuỗi
+            lines.append(f"    if {name} is not None and {name}.__class__ is not float:")
+            lines.append("        try:")
+            lines.append(f"            {name} = float({name})")
+            lines.append("        except (TypeError, ValueError):")
+            lines.append(f"            {name} = None")
+        elif conv is not str:
+            env[f"_conv_{name}"] = conv
+            lines.append(f"    if {name} is not None:")
+            lines.append("        try:")
+            lines.append(f"            {name} = _conv_{name}({name})")
+            lines.append("        except (TypeError, ValueError):")
+            lines.append(f"            {name} = None")
+    lines += [
+        "    if device is None:",
+        "        device = fallback_device",
+        "    if fan is None:",
+        "        fan = state.get('fan', 'unknown') if state else 'unknown'",
+        "    if light is None:",
+        "        light = state.get('light', 'unknown') if state else 'unknown'",
+        "    return Reading(received, device, temp, hum, fan, light)",
+    ]
+    exec("\n".join(lines), env)
+    return env["extract"]
+
+
+def _field(keys, unit):
+    return Field(tuple(keys), unit)
+
+
+# Schema mặc định, thử theo thứ tự: cụ thể trước, tổng quát sau
+DEFAULT_SCHEMAS = [
+    Schema("simulator", "+/+/sensor/+",
+           {"temp": _field(["temp_c"], "c"), "hum": _field(["hum_pct"], "pct"),
+            "device": _field(["device"], "str")},
+           firmware="sim-"),
+    Schema("esp32-firmware", "+/+/sensor/data",
+           {"temp": _field(["temp"], "c"), "hum": _field(["humidity"], "pct"),
+            "fan": _field(["fan"], "str"), "light": _field(["light"], "str"),
+            "device": _field(["device"], "str")}),
+    Schema("generic", "#",
+           {"temp": _field(["temp", "temperature", "temp_c"], "c"),
+            "hum": _field(["hum", "humidity", "hum_pct"], "pct"),
+            "fan": _field(["fan"], "str"), "light": _field(["light"], "str"),
+            "device": _field(["device"], "str")}),
+]
+
+
+def decode_sensor_frame(payload, received, device, state=None):
+    """Frame cảm biến ``struct`` v1 -> ``Reading`` (nhiệt độ/độ ẩm lưu theo 0.01)."""
+    _, flags, _, t, h, _ = SENSOR_FRAME.unpack_from(payload)
+    return Reading(received, device,
+                   t / 100 if flags & HAS_TEMP else None,
+                   h / 100 if flags & HAS_HUM else None,
+                   state.get("fan", "unknown") if state else "unknown",
+                   state.get("light", "unknown") if state else "unknown")
+
+
+def decode_batch_frame(payload, device, state=None):
+    """Frame lô mẫu ``struct`` v1 -> list ``Reading`` theo thời điểm đo của từng mẫu."""
+    fan = state.get("fan", "unknown") if state else "unknown"
+    light = state.get("light", "unknown") if state else "unknown"
+    return [Reading(ts, device,
+                    t / 100 if flags & HAS_TEMP else None,
+                    h / 100 if flags & HAS_HUM else None,
+                    fan, light)
+            for ts, flags, t, h, _ in iter_batch_frame(payload)]
+
+
+class SchemaRegistry:
+    """Chọn và nhớ bộ giải mã cho mỗi (topic, firmware)."""
+
+    def __init__(self, schemas=DEFAULT_SCHEMAS):
+        self._schemas = []
+        self._cache = {}
+        for schema in schemas:
+            self.register(schema)
+
+    def register(self, schema, first=False):
+        """Thêm schema (``first=True``: ưu tiên hơn các schema hiện có)."""
+        for name in schema.fields:
+            if name not in FIELDS:
+                raise ValueError(f"Schema {schema.name}: trường không hỗ trợ {name!r}")
+            if schema.fields[name].unit not in CONVERSIONS:
+                raise ValueError(f"Schema {schema.name}: đơn vị không hỗ trợ {schema.fields[name].unit!r}")
+        entry = (schema, compile_schema(schema))
+        if first:
+            self._schemas.insert(0, entry)
+        else:
+            self._schemas.append(entry)
+        self._cache.clear()
+
+    def resolve(self, topic, firmware=None):
+        """(Schema, extract) cho topic/firmware; None nếu không schema nào khớp."""
+        key = (topic, firmware)
+        found = self._cache.get(key)
+        if found is None and key not in self._cache:
+            for schema, extract in self._schemas:
+                if schema.firmware is not None and not (firmware or "").startswith(schema.firmware):
+                    continue
+                if topic_matches(schema.topic, topic):
+                    found = (schema, extract)
+                    break
+            self._cache[key] = found
+        return found
+
+    def decode(self, topic, payload, received, device, state=None):
+        """Giải mã payload (bytes) thành ``Reading`` trong một lượt; None nếu không có schema."""
+        head = payload[0] if payload else 0
+        if head == SENSOR_V1:
+            return decode_sensor_frame(payload, received, device, state)
+        found, data = self._parse(topic, payload, state)
+        if found is None:
+            return None
+        return found[1](data, received, device, state)
+
+    def decode_many(self, topic, payload, received, device, state=None):
+        """Như ``decode()`` nhưng nhận cả lô mẫu; trả về list ``Reading`` (có thể rỗng).
+
+        Mẫu trong lô lấy thời điểm từ trường ``ts`` (epoch giây) của chính nó.
+        """
+        head = payload[0] if payload else 0
+        if head == SENSOR_V1:
+            return [decode_sensor_frame(payload, received, device, state)]
+        if head == BATCH_V1:
+            return decode_batch_frame(payload, device, state)
+        found, data = self._parse(topic, payload, state)
+        if found is None:
+            return []
+        extract = found[1]
+        if data.__class__ is not list:
+            return [extract(data, received, device, state)]
+        readings = []
+        for sample in data:
+            ts = sample.get("ts")
+            if ts.__class__ is not float and ts.__class__ is not int:
+                ts = received
+            readings.append(extract(sample, ts, device, state))
+        return readings
+
+    def _parse(self, topic, payload, state):
+        head = payload[0] if payload else 0
+        if 0x80 <= head <= 0xBF:  # CBOR mảng/map
+            if cbor2 is None:
+                raise ValueError("payload CBOR nhưng chưa cài cbor2")
+            data = cbor2.loads(payload)
+        else:
+            data = loads(payload)
+        firmware = state.get("fw") if state else None
+        return self.resolve(split_topic(topic)[0], firmware), data
+
+    @property
+    def schemas(self):
+        return [schema for schema, _ in self._schemas]
+
+
+def load_schemas(path):
+    """Đọc danh sách schema tùy chỉnh từ file JSON."""
+    with open(path, encoding="utf-8") as f:
+        items = json.load(f)
+    schemas = []
+    for item in items:
+        fields = {}
+        for name, spec in item["fields"].items():
+            keys = spec.get("keys") or [name]
+            fields[name] = Field(tuple(keys), spec.get("unit", FIELDS.get(name, "str")))
+        schemas.append(Schema(item["name"], item.get("topic", "#"), fields, item.get("firmware")))
+    return schemas
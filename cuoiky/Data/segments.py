@@ -0,0 +1,445 @@
+# ==================== segments.py ====================
+"""
+Log CSV chia đoạn (segment): xoay vòng theo kích thước/thời gian, nén đoạn cũ.
+
+Logger luôn ghi vào file đang hoạt động (``iot_log.csv``). Khi file vượt
+``max_bytes`` hoặc sang khung thời gian mới (ví dụ mỗi giờ), nó được đổi tên
+vào thư mục ``iot_log.segments/`` thành ``iot_log.20251030-203122.csv`` rồi
+nén nền bằng gzip hoặc lzma. ``manifest.json`` trong thư mục đó liệt kê từng
+đoạn với khoảng thời gian (nhỏ nhất/lớn nhất), độ trễ tối đa của các dòng
+(``records.Lateness``: mẫu trong lô từ thiết bị ghi với thời điểm đo), số
+dòng và kích thước, để công cụ truy vấn chỉ mở các đoạn cần thiết.
+
+Mỗi bước (đổi tên, ghi manifest, nén) đều nguyên tử; nếu logger chết giữa
+chừng, lần khởi động sau ``SegmentedCSVSink`` đối chiếu thư mục với manifest
+và hoàn tất phần còn dở.
+
+Dòng lệnh:
+    python segments.py list iot_log.csv
+    python segments.py repair iot_log.csv --compress gzip
+"""
+
+import argparse
+import csv
+import gzip
+import json
+import lzma
+import os
+import queue
+import shutil
+import threading
+import time
+
+from csv_sink import DURABILITY_NONE, WriteBehindCSVSink
+from records import Lateness, parse_time, reading_from_csv_row
+from rollup import bucket_start
+
+COMPRESSIONS = {"none": "", "gzip": ".gz", "lzma": ".xz"}
+ROTATE_INTERVALS = {"none": 0, "hourly": 3600, "daily": 86400}
+MANIFEST_VERSION = 1
+
+
+def segment_dir(log_path):
+    return os.path.splitext(log_path)[0] + ".segments"
+
+
+def open_text(path):
+    """Mở một đoạn (thường, .gz hoặc .xz) ở chế độ text để đọc tuần tự."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace", newline="")
+    if path.endswith(".xz"):
+        return lzma.open(path, "rt", encoding="utf-8", errors="replace", newline="")
+    return open(path, encoding="utf-8", errors="replace", newline="")
+
+
+def _row_time(row):
+    try:
+        return parse_time(str(row[0]))
+    except (ValueError, IndexError):
+        return None
+
+
+class SegmentStats:
+    """Khoảng thời gian, độ trễ và số dòng của một đoạn (các khóa tương ứng trong manifest)."""
+
+    def __init__(self):
+        self.start = None
+        self.late = Lateness()
+        self.rows = 0
+
+    def observe(self, ts):
+        if self.start is None or ts < self.start:
+            self.start = ts
+        self.late.observe(ts)
+
+    def entry(self):
+        return {"start": self.start, "end": self.late.latest, "lateness": self.late.lateness, "rows": self.rows}
+
+
+def scan_segment(path):
+    """``SegmentStats`` của một file log/đoạn."""
+    stats = SegmentStats()
+    with open_text(path) as f:
+        for row in csv.reader(f):
+            ts = _row_time(row)
+            if ts is None:
+                continue
+            stats.observe(ts)
+            stats.rows += 1
+    return stats
+
+
+class Manifest:
+    """Danh sách các đoạn (dict: file, start, end, lateness, rows, bytes), lưu nguyên tử."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, "manifest.json")
+        self.segments = []
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                self.segments = json.load(f).get("segments", [])
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "segments": self.segments}, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def add(self, entry):
+        with self._lock:
+            self.segments.append(entry)
+            self.segments.sort(key=lambda s: (s["start"] is None, s["start"] or 0))
+            self.save()
+
+    def update(self, name, **changes):
+        with self._lock:
+            for seg in self.segments:
+                if seg["file"] == name:
+                    seg.update(changes)
+            self.save()
+
+    def remove(self, name):
+        with self._lock:
+            self.segments = [s for s in self.segments if s["file"] != name]
+            self.save()
+
+    def select(self, start=None, end=None):
+        """Các đoạn có khoảng thời gian giao với [start, end)."""
+        with self._lock:
+            return [dict(s) for s in self.segments
+                    if s["start"] is not None
+                    and (end is None or s["start"] < end)
+                    and (start is None or s["end"] >= start)]
+
+
+def _strip_compression(name):
+    for ext in COMPRESSIONS.values():
+        if ext and name.endswith(ext):
+            return name[:-len(ext)]
+    return name
+
+
+def _compress_file(src, compression):
+    """Nén ``src`` thành ``src + đuôi`` qua file tạm; trả về đường dẫn mới."""
+    dst = src + COMPRESSIONS[compression]
+    tmp = dst + ".tmp"
+    opener = gzip.open if compression == "gzip" else lzma.open
+    with open(src, "rb") as fin, opener(tmp, "wb") as fout:
+        shutil.copyfileobj(fin, fout, 1 << 20)
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, dst)
+    return dst
+
+
+class SegmentedCSVSink(WriteBehindCSVSink):
+    """Sink CSV write-behind có xoay vòng đoạn và nén nền.
+
+    - ``max_bytes``: xoay khi file hoạt động đạt kích thước này (0 = tắt).
+    - ``rotate_interval``: giây mỗi đoạn, căn theo giờ địa phương (0 = tắt).
+    - ``compression``: một trong ``COMPRESSIONS``.
+    - ``keep_segments``: chỉ giữ N đoạn mới nhất (None = giữ tất cả).
+    """
+
+    thread_name = "segmented-csv-flusher"
+
+    def __init__(self, path, max_bytes=0, rotate_interval=3600, compression="gzip",
+                 keep_segments=None, **kwargs):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"compression không hợp lệ: {compression!r}")
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.compression = compression
+        self.keep_segments = keep_segments
+        self.segment_dir = segment_dir(path)
+        os.makedirs(self.segment_dir, exist_ok=True)
+        self.manifest = Manifest(self.segment_dir)
+        self.segments_rolled = 0
+
+        self._jobs = queue.Queue()
+        self._compressor = threading.Thread(target=self._compress_worker,
+                                            name="segment-compressor", daemon=True)
+        self._compressor.start()
+        self.repair()
+
+        # Thống kê của đoạn đang hoạt động
+        self._seg = scan_segment(path) if os.path.exists(path) else SegmentStats()
+        super().__init__(path, **kwargs)
+
+    # ---------- Ghi ----------
+
+    def _write_items(self, items):
+        while items:
+            if self._should_roll(_row_time(items[0])):
+                self._roll()
+            cut = self._split_point(items)
+            part, items = items[:cut], items[cut:]
+            super()._write_items(part)
+            for row in part:
+                ts = _row_time(row)
+                if ts is not None:
+                    self._seg.observe(ts)
+            self._seg.rows += len(part)
+
+    def _deadline(self, first_ts):
+        start = self._seg.start if self._seg.start is not None else first_ts
+        if not self.rotate_interval or start is None:
+            return None
+        return bucket_start(start, self.rotate_interval) + self.rotate_interval
+
+    def _split_point(self, items):
+        """Số dòng đầu của lô còn thuộc đoạn hiện tại (lô vắt qua ranh giới thời gian)."""
+        deadline = self._deadline(_row_time(items[0]))
+        if deadline is None:
+            return len(items)
+        last = _row_time(items[-1])
+        if last is None or last < deadline:
+            return len(items)
+        for i, row in enumerate(items):
+            ts = _row_time(row)
+            if ts is not None and ts >= deadline:
+                return max(i, 1)
+        return len(items)
+
+    def _should_roll(self, ts):
+        if not self._seg.rows:
+            return False
+        if self.max_bytes:
+            self._file.flush()
+            if os.fstat(self._file.fileno()).st_size >= self.max_bytes:
+                return True
+        deadline = self._deadline(ts)
+        return deadline is not None and ts is not None and ts >= deadline
+
+    def _roll(self):
+        """Đóng file hoạt động, chuyển thành đoạn, mở file mới (giữ khóa I/O)."""
+        self._file.flush()
+        if self.durability != DURABILITY_NONE:
+            os.fsync(self._file.fileno())
+        self._file.close()
+
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self._seg.start or time.time()))
+        stem = os.path.splitext(os.path.basename(self.path))[0]
+        name = f"{stem}.{stamp}.csv"
+        n = 1
+        while os.path.exists(os.path.join(self.segment_dir, name)) or \
+                any(s["file"].startswith(name) for s in self.manifest.segments):
+            name = f"{stem}.{stamp}-{n}.csv"
+            n += 1
+        target = os.path.join(self.segment_dir, name)
+        os.replace(self.path, target)
+        self.manifest.add({"file": name, **self._seg.entry(), "bytes": os.path.getsize(target)})
+        self.segments_rolled += 1
+
+        self._file = self._open()
+        self._seg = SegmentStats()
+        if self.compression != "none":
+            # Luồng nén tự dọn các đoạn cũ sau khi nén xong: xóa ở đây có thể
+            # trùng lúc nó đang nén chính đoạn đó (để lại .gz mồ côi)
+            self._jobs.put(name)
+        else:
+            self._prune()
+
+    def _prune(self):
+        if not self.keep_segments:
+            return
+        for seg in self.manifest.segments[:-self.keep_segments]:
+            self.manifest.remove(seg["file"])
+            try:
+                os.remove(os.path.join(self.segment_dir, seg["file"]))
+            except FileNotFoundError:
+                pass
+
+    # ---------- Nén nền ----------
+
+    def _compress_worker(self):
+        while True:
+            name = self._jobs.get()
+            if name is None:
+                return
+            try:
+                self._compress_segment(name)
+            except Exception as e:
+                print(f"⚠️ Không nén được đoạn {name}: {e}")
+            try:
+                self._prune()
+            except OSError as e:
+                print(f"⚠️ Không dọn được các đoạn cũ: {e}")
+
+    def _compress_segment(self, name):
+        src = os.path.join(self.segment_dir, name)
+        if not os.path.exists(src):
+            return  # đã bị xóa do giới hạn số đoạn
+        dst = _compress_file(src, self.compression)
+        self.manifest.update(name, file=os.path.basename(dst), bytes=os.path.getsize(dst))
+        os.remove(src)
+
+    def repair(self):
+        """Đối chiếu thư mục đoạn với manifest sau crash; xếp lại các đoạn chưa nén."""
+        directory = self.segment_dir
+        for fname in os.listdir(directory):
+            if fname.endswith(".tmp"):
+                os.remove(os.path.join(directory, fname))
+        on_disk = {f for f in os.listdir(directory) if f != "manifest.json"}
+
+        for seg in list(self.manifest.segments):
+            name = seg["file"]
+            if name in on_disk:
+                continue
+            done = [name + ext for ext in COMPRESSIONS.values() if ext and name + ext in on_disk]
+            if done:
+                # Crash sau khi nén xong nhưng trước khi cập nhật manifest
+                self.manifest.update(name, file=done[0],
+                                     bytes=os.path.getsize(os.path.join(directory, done[0])))
+            else:
+                self.manifest.remove(name)
+
+        for fname in sorted(on_disk):
+            listed = {seg["file"] for seg in self.manifest.segments}
+            path = os.path.join(directory, fname)
+            if fname in listed or not os.path.exists(path):
+                continue
+            base = _strip_compression(fname)
+            if base != fname and base in listed:
+                # Crash sau khi nén xong nhưng trước khi cập nhật manifest
+                self.manifest.update(base, file=fname, bytes=os.path.getsize(path))
+                if os.path.exists(os.path.join(directory, base)):
+                    os.remove(os.path.join(directory, base))
+            elif any(fname + ext in listed for ext in COMPRESSIONS.values() if ext):
+                os.remove(path)  # bản chưa nén còn sót lại sau khi nén xong
+            else:
+                # Crash sau khi đổi tên nhưng trước khi ghi manifest
+                self.manifest.add({"file": fname, **scan_segment(path).entry(),
+                                   "bytes": os.path.getsize(path)})
+
+        if self.compression != "none":
+            for seg in self.manifest.segments:
+                if seg["file"].endswith(".csv"):
+                    self._jobs.put(seg["file"])
+
+    def close(self):
+        super().close()
+        if self._compressor.is_alive():
+            self._jobs.put(None)
+            self._compressor.join()
+
+
+# ---------- Đọc xuyên các đoạn ----------
+
+def load_manifest(log_path):
+    directory = segment_dir(log_path)
+    return Manifest(directory) if os.path.isdir(directory) else None
+
+
+def iter_log_files(log_path, start=None, end=None):
+    """Đường dẫn các đoạn giao với [start, end) theo thứ tự thời gian, rồi file hoạt động."""
+    manifest = load_manifest(log_path)
+    if manifest is not None:
+        for seg in manifest.select(start, end):
+            yield os.path.join(manifest.directory, seg["file"])
+    if os.path.exists(log_path):
+        yield log_path
+
+
+def iter_readings(log_path, start=None, end=None, device="unknown"):
+    """Các Reading có ``start <= ts < end`` trên mọi đoạn và file hoạt động.
+
+    Đoạn nằm ngoài khoảng bị bỏ qua nhờ manifest; file hoạt động được đọc
+    qua chỉ mục thời gian (tsindex.py).
+    """
+    from tsindex import iter_csv_range
+
+    manifest = load_manifest(log_path)
+    for seg in manifest.select(start, end) if manifest is not None else []:
+        # Mọi dòng sau một dòng có thời gian t đều >= t - lateness
+        stop = end + seg.get("lateness", 0) if end is not None else None
+        with open_text(os.path.join(manifest.directory, seg["file"])) as f:
+            for row in csv.reader(f):
+                reading = reading_from_csv_row(row, device)
+                if reading is None or (start is not None and reading.ts < start):
+                    continue
+                if end is not None and reading.ts >= end:
+                    if reading.ts >= stop:
+                        break
+                    continue
+                yield reading
+    if os.path.exists(log_path):
+        yield from iter_csv_range(log_path, start, end, device=device)
+
+
+def tail_segment_rows(log_path, n):
+    """N dòng CSV cuối của các đoạn đã đóng (mới nhất ở cuối), dùng khi file hoạt động quá ngắn."""
+    manifest = load_manifest(log_path)
+    if manifest is None or n <= 0:
+        return []
+    rows = []
+    for seg in reversed(manifest.select()):
+        with open_text(os.path.join(manifest.directory, seg["file"])) as f:
+            seg_rows = [row for row in csv.reader(f) if _row_time(row) is not None]
+        rows = seg_rows[-(n - len(rows)):] + rows
+        if len(rows) >= n:
+            break
+    return rows
+
+
+def main(argv=None):
+    from prettytable import PrettyTable
+
+    from records import TIME_FORMAT
+
+    parser = argparse.ArgumentParser(description="Quản lý các đoạn log IoT")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_list = sub.add_parser("list", help="liệt kê các đoạn trong manifest")
+    p_list.add_argument("log")
+    p_repair = sub.add_parser("repair", help="đối chiếu manifest và nén các đoạn còn dở")
+    p_repair.add_argument("log")
+    p_repair.add_argument("--compress", choices=list(COMPRESSIONS), default="gzip")
+    args = parser.parse_args(argv)
+
+    if args.command == "repair":
+        sink = SegmentedCSVSink(args.log, rotate_interval=0, compression=args.compress)
+        sink.close()
+        print(f"✅ Manifest có {len(sink.manifest.segments)} đoạn")
+        return
+
+    manifest = load_manifest(args.log)
+    if manifest is None:
+        print(f"(Không có thư mục đoạn {segment_dir(args.log)})")
+        return
+    table = PrettyTable()
+    table.field_names = ["Đoạn", "Từ", "Đến", "Số dòng", "Kích thước"]
+    total = 0
+    for seg in manifest.segments:
+        fmt = (lambda ts: "-" if ts is None else time.strftime(TIME_FORMAT, time.localtime(ts)))
+        table.add_row([seg["file"], fmt(seg["start"]), fmt(seg["end"]), seg["rows"], f"{seg['bytes']:,} B"])
+        total += seg["bytes"]
+    print(table)
+    print(f"📦 {len(manifest.segments)} đoạn, {total:,} byte")
+
+
+if __name__ == "__main__":
+    main()
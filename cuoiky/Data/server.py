@@ -1,74 +1,407 @@
-import csv
-import json
-from datetime import datetime
-from paho import mqtt
-from paho.mqtt import client as mqtt_client
+import argparse
+import atexit
+import os
+import signal
+import sys
+import threading
+import time
+from operator import attrgetter
+
+from binlog import BinaryLogSink
+from csv_sink import WriteBehindCSVSink, DURABILITY_POLICIES, DURABILITY_NONE
+from gaps import GAP_KINDS, GapTracker, gaps_path
+from ingest import OVERFLOW_POLICIES, POLICY_BLOCK, IngestPipeline
+from partitions import DATA_DIR, PartitionedSink
+from records import CSV_HEADER, parse_topic
+from rollup import DEFAULT_RESOLUTIONS, RESOLUTIONS, RollupStore
+from schemas import SchemaRegistry, load_schemas, loads
+from segments import COMPRESSIONS, ROTATE_INTERVALS, SegmentedCSVSink
+from sqlite_sink import DB_FILE, SQLiteSink
+from tsindex import INDEX_EVERY, SparseIndex
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.payload import (ENCODING_JSON, ENCODING_STRUCT, decode as decode_payload,  # noqa: E402
+                            decode_state_frame, payload_encoding, split_topic)
+from common.metrics import DECODE_BUCKETS, WRITE_BUCKETS, MetricsRegistry, start_http_server  # noqa: E402
+from common.transport import add_transport_args, create_client  # noqa: E402
 
 BROKER = 'broker.hivemq.com'
 PORT = 1883
-TOPIC = 'demo/room1/sensor/data'  # đúng topic ESP gửi
+# Mọi namespace <owner>/<room>: dữ liệu cảm biến (sensor/data của ESP, sensor/state và
+# sensor/batch của simulator), trạng thái thiết bị (kể cả bản nhị phân device/state/bin|cbor)
+# và online. Thiết bị/phòng được tách từ topic.
+TOPICS = [('+/+/sensor/#', 0), ('+/+/device/state/#', 1), ('+/+/sys/online', 1)]
 CLIENT_ID = 'iot_logger_luong'
 CSV_FILE = 'iot_log.csv'
+BIN_FILE = 'iot_log.bin'
+# csv: iot_log.csv, bin: binlog.py (bản ghi cố định 20 byte),
+# partitioned: partitions.py (một file CSV cho mỗi thiết bị mỗi ngày),
+# sqlite: sqlite_sink.py (bảng readings, WAL, mỗi lần flush một transaction)
+SINK_TYPES = ('csv', 'bin', 'partitioned', 'sqlite')
+
+# Cấu hình write-behind sink
+FLUSH_ROWS = 200        # flush khi bộ đệm đạt số dòng này
+FLUSH_INTERVAL = 1.0    # hoặc sau tối đa số giây này
+DURABILITY = DURABILITY_NONE
+FSYNC_INTERVAL = 5.0
+
+# Xoay vòng log CSV thành các đoạn nén (segments.py). Mặc định tắt để iot_log.csv
+# vẫn nằm nguyên chỗ cho công cụ đọc bên ngoài; bật bằng --rotate/--rotate-size-mb
+# hoặc biến môi trường IOT_LOG_ROTATE / IOT_LOG_ROTATE_SIZE_MB / IOT_LOG_COMPRESS
+ROTATE = os.environ.get('IOT_LOG_ROTATE', 'none')                   # none / hourly / daily
+ROTATE_SIZE_MB = float(os.environ.get('IOT_LOG_ROTATE_SIZE_MB', 0))  # xoay khi file đạt cỡ này (0 = tắt)
+COMPRESSION = os.environ.get('IOT_LOG_COMPRESS', 'none')            # none / gzip / lzma
+
+# Hàng đợi nạp dữ liệu (ingest.py): on_message chỉ xếp hàng, worker giải mã + ghi theo lô.
+# Một worker giữ đúng thứ tự nhận; nhiều worker có thể ghi lệch thứ tự giữa các lô.
+QUEUE_SIZE = 10000
+WORKERS = 1
+BATCH_SIZE = 500
+OVERFLOW = POLICY_BLOCK  # block / drop-oldest / drop-newest
+
+# Rollup theo phút/giờ/ngày (rollup.py), ghi cạnh file log gốc
+ROLLUP_RESOLUTIONS = ",".join(DEFAULT_RESOLUTIONS)
+
+# Chỉ số Prometheus (common/metrics.py) tại http://METRICS_HOST:METRICS_PORT/metrics (0 = tắt)
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9108
+
+# info: chỉ in trạng thái/lỗi; debug: in thêm từng message và từng dòng ghi log
+LOG_LEVELS = ('info', 'debug')
+LOG_LEVEL = 'info'
+
+sink = None    # WriteBehindSink (CSV hoặc binlog), khởi tạo trong start()
+rollups = None  # RollupStore, None khi chạy với --no-rollup
+index = None    # SparseIndex của log CSV (binlog không cần), None khi --no-index
+client = None  # MQTT client của logger, khởi tạo trong main()
+pipeline = None  # IngestPipeline, khởi tạo trong start()
+metrics_server = None  # HTTP server của /metrics, None khi --metrics-port 0
+gaps = None     # GapTracker (gaps.py), None khi --no-gaps
+registry = SchemaRegistry()  # schemas.py: bộ giải mã payload cảm biến theo topic/firmware
+
+# Trạng thái mới nhất theo thiết bị (namespace) từ device/state và sys/online;
+# quạt/đèn của mẫu cảm biến lấy từ đây khi payload không có
+device_states = {}
+last_seen = {}  # namespace -> thời điểm nhận message cuối (epoch giây)
+debug = False   # --log-level debug
+
+metrics = MetricsRegistry()
+MESSAGES_RECEIVED = metrics.counter("iot_messages_received_total",
+                                    "Message worker đã nhận theo kênh topic", ("channel",))
+MESSAGES_DECODED = metrics.counter("iot_messages_decoded_total",
+                                   "Message giải mã thành công theo kênh topic", ("channel",))
+MESSAGES_FAILED = metrics.counter("iot_messages_failed_total",
+                                  "Message lỗi (topic/payload không hợp lệ) theo kênh topic", ("channel",))
+READINGS = metrics.counter("iot_readings_total", "Mẫu cảm biến đưa vào sink")
+DECODE_SECONDS = metrics.histogram("iot_decode_seconds", "Thời gian giải mã một message", DECODE_BUCKETS)
+WRITE_SECONDS = metrics.histogram("iot_write_seconds", "Thời gian ghi + flush một lô của sink", WRITE_BUCKETS)
+
+
+def _sink_stat(name):
+    return lambda: getattr(sink, name) if sink is not None else None
+
+
+def _queue_stat(name):
+    return lambda: pipeline.stats()[name] if pipeline is not None else None
+
+
+def _last_message_ages():
+    now = time.time()
+    return [((ns,), round(now - ts, 3)) for ns, ts in sorted(list(last_seen.items()))]
+
+
+metrics.gauge("iot_sink_rows_written_total", "Dòng đã ghi xuống file", _sink_stat("rows_written"), kind="counter")
+metrics.gauge("iot_sink_bytes_written_total", "Byte đã ghi xuống file", _sink_stat("bytes_written"), kind="counter")
+metrics.gauge("iot_sink_flushes_total", "Số lần flush của sink", _sink_stat("flush_count"), kind="counter")
+metrics.gauge("iot_sink_fsyncs_total", "Số lần fsync của sink", _sink_stat("fsync_count"), kind="counter")
+metrics.gauge("iot_sink_write_errors_total", "Lần ghi/fsync của sink thất bại", _sink_stat("write_errors"),
+              kind="counter")
+metrics.gauge("iot_sink_rows_rejected_total", "Dòng sink bỏ vì lỗi không phải I/O (dữ liệu không ghi được)",
+              _sink_stat("rows_rejected"), kind="counter")
+metrics.gauge("iot_sink_blocked_total", "Số lần ghi phải chờ vì bộ đệm sink đầy", _sink_stat("blocked"),
+              kind="counter")
+metrics.gauge("iot_sink_pending_rows", "Dòng đang chờ trong bộ đệm của sink",
+              lambda: sink.pending() if sink is not None else None)
+metrics.gauge("iot_queue_depth", "Message đang chờ trong hàng đợi nạp", _queue_stat("queued"))
+metrics.gauge("iot_queue_high_watermark", "Độ sâu hàng đợi cao nhất", _queue_stat("high_watermark"))
+metrics.gauge("iot_queue_dropped_total", "Message bị bỏ do hàng đợi đầy", _queue_stat("dropped"), kind="counter")
+metrics.gauge("iot_queue_blocked_total", "Số lần callback MQTT phải chờ hàng đợi", _queue_stat("blocked"),
+              kind="counter")
+metrics.gauge("iot_sensor_gaps_total", "Khoảng trống giữa các mẫu (unchanged: trong deadband, missing: mất dữ liệu)",
+              lambda: [((kind,), gaps.counts[kind]) for kind in GAP_KINDS] if gaps is not None else [],
+              ("kind",), kind="counter")
+metrics.gauge("iot_last_message_age_seconds", "Số giây từ message cuối của mỗi thiết bị",
+              _last_message_ages, ("device",))
 
 
 def on_connect(client, userdata, flags, reason_code, properties=None):
     if reason_code == 0:
         print("✅ MQTT: Kết nối thành công.")
-        client.subscribe(TOPIC)
-        print(f"Đang lắng nghe dữ liệu tại topic: {TOPIC}")
+        client.subscribe(TOPICS)
+        print("Đang lắng nghe dữ liệu tại topic: " + ", ".join(t for t, _ in TOPICS))
     else:
         print("❌ Kết nối thất bại, mã lỗi:", reason_code)
 
 
 def on_message(client, userdata, msg):
-    try:
-        payload = msg.payload.decode()
-        print("📩 Nhận:", payload)
+    # Chạy trong vòng lặp mạng của paho: chỉ xếp hàng, không giải mã hay ghi đĩa
+    pipeline.submit(msg.topic, msg.payload)
 
-        data = json.loads(payload)
-        temp = data.get("temp") or data.get("temperature")
-        hum = data.get("humidity") or data.get("hum")
-        fan = data.get("fan", "unknown")
-        light = data.get("light", "unknown")
 
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+def handle_batch(batch):
+    """Worker: giải mã một lô message thô, ghi các mẫu cảm biến trong một lần."""
+    readings = []
+    samples = []  # (namespace, ts) của từng mẫu, cho gaps.py
+    received, decoded, failed = {}, {}, {}
+    durations = []
+    clock = time.perf_counter
+    for raw in batch:
+        info = parse_topic(raw.topic)
+        channel = info.channel if info is not None else "invalid"
+        received[(channel,)] = received.get((channel,), 0) + 1
+        if info is None:
+            failed[(channel,)] = failed.get((channel,), 0) + 1
+            continue
+        last_seen[info.namespace] = raw.received
+        start = clock()
+        try:
+            decoded_readings = handle_message(raw, info)
+        except Exception as e:
+            failed[(channel,)] = failed.get((channel,), 0) + 1
+            print(f"⚠️ Lỗi khi xử lý message [{raw.topic}]:", e)
+            continue
+        durations.append(clock() - start)
+        readings.extend(decoded_readings)
+        if gaps is not None:
+            samples.extend((info.namespace, r.ts) for r in decoded_readings)
+        decoded[(channel,)] = decoded.get((channel,), 0) + 1
+    MESSAGES_RECEIVED.inc_many(received)
+    MESSAGES_DECODED.inc_many(decoded)
+    MESSAGES_FAILED.inc_many(failed)
+    DECODE_SECONDS.observe_many(durations)
+    if readings:
+        # Mẫu của lô từ thiết bị (sensor/batch) mang thời điểm đo, sớm hơn lúc nhận:
+        # sắp lại để log vẫn tăng dần theo thời gian trong mỗi lần ghi
+        readings.sort(key=attrgetter("ts"))
+        sink.write_readings(readings)
+        READINGS.inc(amount=len(readings))
+        if rollups is not None:
+            rollups.update_many(readings)
+    if samples:
+        # Khoảng trống theo namespace: chính sách "report" đi theo device/state của namespace
+        samples.sort(key=lambda s: s[1])
+        gaps.observe_many(samples, _report_policy)
 
-        with open(CSV_FILE, mode='a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow([timestamp, temp, hum, fan, light])
 
-        print(f"→ Ghi log: {timestamp} | T={temp}°C | H={hum}% | Quạt={fan} | Đèn={light}")
+def _report_policy(namespace):
+    state = device_states.get(namespace)
+    return state.get("report") if state else None
 
-    except Exception as e:
-        print("⚠️ Lỗi khi xử lý message:", e)
 
+def handle_message(raw, info=None):
+    """Giải mã một message; trả về list Reading (rỗng nếu không phải dữ liệu cảm biến)."""
+    if info is None:
+        info = parse_topic(raw.topic)
+        if info is None:
+            return []
+    encoding = payload_encoding(raw.payload)
+    if debug:
+        if encoding == ENCODING_JSON:
+            print(f"📩 Nhận [{raw.topic}]:", raw.payload.decode())
+        else:
+            print(f"📩 Nhận [{raw.topic}]: <{len(raw.payload)} byte {encoding}>")
+
+    if info.channel.startswith("sensor/"):
+        return decode_sensor(info, raw)
+    channel = split_topic(info.channel)[0]
+    if channel == "device/state":
+        state = device_states.setdefault(info.namespace, {})
+        if encoding == ENCODING_STRUCT:
+            _, state["light"], state["fan"], _, state["fw"] = decode_state_frame(raw.payload)
+        else:
+            data = loads(raw.payload) if encoding == ENCODING_JSON else decode_payload(raw.payload)
+            state.update({k: data[k] for k in ("fan", "light", "fw", "report") if k in data})
+    elif channel == "sys/online":
+        data = loads(raw.payload)
+        device_states.setdefault(info.namespace, {})["online"] = data.get("online")
+        print(f"{'🟢' if data.get('online') else '🔴'} {info.namespace} online={data.get('online')}")
+    return []
 
-def create_client():
-    """Tự động xử lý sự khác biệt giữa paho-mqtt v1 và v2."""
-    try:
-        # Cách mới (v2)
-        return mqtt_client.Client(client_id=CLIENT_ID, callback_api_version=mqtt_client.CallbackAPIVersion.v5)
-    except Exception:
-        # Cách cũ (v1)
-        return mqtt_client.Client(CLIENT_ID)
 
+def decode_sensor(info, raw):
+    # Schema chọn theo topic + firmware (trường "fw" của device/state); thiết bị là
+    # trường "device" của payload, nếu không có thì lấy namespace của topic.
+    # Một message sensor/batch chứa nhiều mẫu.
+    readings = registry.decode_many(raw.topic, raw.payload, raw.received, info.namespace,
+                                    device_states.get(info.namespace))
+    if debug:
+        for reading in readings:
+            print(f"→ Ghi log: {reading.time_str()} | {reading.device} | T={reading.temp}°C | H={reading.hum}% "
+                  f"| Quạt={reading.fan} | Đèn={reading.light}")
+    return readings
+
+
+def _handle_sigterm(signum, frame):
+    # Chuyển SIGTERM thành SystemExit để khối finally trong main() flush log
+    raise SystemExit(0)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="MQTT Logger ghi dữ liệu cảm biến ra CSV")
+    add_transport_args(parser, BROKER, PORT)
+    parser.add_argument("--sink", choices=SINK_TYPES, default='csv',
+                        help="định dạng lưu trữ: csv, bin (binlog nhị phân), partitioned hoặc sqlite")
+    parser.add_argument("--csv", default=CSV_FILE, help="đường dẫn file log CSV")
+    parser.add_argument("--bin-file", default=BIN_FILE, help="đường dẫn file binlog khi --sink bin")
+    parser.add_argument("--db", default=DB_FILE, help="đường dẫn cơ sở dữ liệu khi --sink sqlite")
+    parser.add_argument("--data-dir", default=DATA_DIR,
+                        help="thư mục gốc khi --sink partitioned (<thiết bị>/<ngày>.csv)")
+    parser.add_argument("--flush-rows", type=int, default=FLUSH_ROWS,
+                        help="flush khi bộ đệm đạt số dòng này")
+    parser.add_argument("--flush-interval", type=float, default=FLUSH_INTERVAL,
+                        help="thời gian tối đa (giây) một dòng nằm trong bộ đệm")
+    parser.add_argument("--durability", choices=DURABILITY_POLICIES, default=DURABILITY,
+                        help="none: không fsync, flush: fsync mỗi lần flush, interval: fsync mỗi --fsync-interval giây")
+    parser.add_argument("--fsync-interval", type=float, default=FSYNC_INTERVAL,
+                        help="chu kỳ fsync (giây) khi --durability interval")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE,
+                        help="số message tối đa chờ xử lý")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="số worker giải mã/ghi")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="số message tối đa mỗi lô của worker")
+    parser.add_argument("--overflow", choices=OVERFLOW_POLICIES, default=OVERFLOW,
+                        help="khi hàng đợi đầy: block (chặn), drop-oldest hoặc drop-newest")
+    parser.add_argument("--rotate", choices=list(ROTATE_INTERVALS), default=ROTATE,
+                        help="xoay vòng log CSV theo thời gian (mặc định: không xoay)")
+    parser.add_argument("--rotate-size-mb", type=float, default=ROTATE_SIZE_MB,
+                        help="xoay vòng khi file log đạt kích thước này (MB, 0 = tắt)")
+    parser.add_argument("--compress", choices=list(COMPRESSIONS), default=COMPRESSION,
+                        help="nén các đoạn log đã đóng khi bật xoay vòng")
+    parser.add_argument("--keep-segments", type=int, default=None,
+                        help="chỉ giữ N đoạn mới nhất (mặc định: giữ tất cả)")
+    parser.add_argument("--rollup-res", default=ROLLUP_RESOLUTIONS,
+                        help=f"các độ phân giải rollup, cách nhau bởi dấu phẩy ({', '.join(RESOLUTIONS)})")
+    parser.add_argument("--no-rollup", action="store_true", help="không cập nhật rollup")
+    parser.add_argument("--index-every", type=int, default=INDEX_EVERY,
+                        help="chỉ mục thời gian (tsindex.py): một mục cho mỗi N dòng CSV")
+    parser.add_argument("--no-index", action="store_true", help="không cập nhật chỉ mục thời gian")
+    parser.add_argument("--no-gaps", action="store_true",
+                        help="không ghi khoảng trống unchanged/missing (gaps.py) của thiết bị report-by-exception")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="cổng HTTP phục vụ /metrics định dạng Prometheus (0 = tắt)")
+    parser.add_argument("--metrics-host", default=METRICS_HOST, help="địa chỉ lắng nghe của /metrics")
+    parser.add_argument("--log-level", choices=LOG_LEVELS, default=LOG_LEVEL,
+                        help="debug: in từng message nhận được và từng dòng ghi log")
+    parser.add_argument("--schemas", help="file JSON các schema payload bổ sung (ưu tiên hơn mặc định)")
+    return parser.parse_args(argv)
+
+
+def stop():
+    """Dừng logger đang chạy (dùng khi chạy logger trong cùng process với test)."""
+    if client is not None:
+        client.disconnect()
+
+
+def start(args):
+    """Mở sink, chỉ mục, rollup, hàng đợi và /metrics theo ``args`` (chưa kết nối MQTT).
+
+    Tách khỏi ``main()`` để công cụ phát lại (capture.py) đưa message thẳng
+    vào ``pipeline.submit()`` không cần broker.
+    """
+    global sink, rollups, index, gaps, pipeline, metrics_server, debug
+    debug = args.log_level == 'debug'
+    rollups = index = gaps = metrics_server = None
 
-def main():
     print("🚀 Khởi động MQTT Logger...")
-    client = create_client()
-    client.on_connect = on_connect
-    client.on_message = on_message
-    client.connect(BROKER, PORT)
-    client.loop_forever()
+    if args.schemas:
+        for schema in reversed(load_schemas(args.schemas)):
+            registry.register(schema, first=True)
+    sink_options = dict(flush_rows=args.flush_rows,
+                        flush_interval=args.flush_interval,
+                        durability=args.durability,
+                        fsync_interval=args.fsync_interval)
+    if args.sink == 'bin':
+        sink = BinaryLogSink(args.bin_file, **sink_options)
+    elif args.sink == 'partitioned':
+        sink = PartitionedSink(args.data_dir, **sink_options)
+    elif args.sink == 'sqlite':
+        sink = SQLiteSink(args.db, **sink_options)
+    else:
+        max_bytes = int(args.rotate_size_mb * 1024 * 1024)
+        if args.rotate != 'none' or max_bytes:
+            sink = SegmentedCSVSink(args.csv, header=CSV_HEADER, max_bytes=max_bytes,
+                                    rotate_interval=ROTATE_INTERVALS[args.rotate],
+                                    compression=args.compress, keep_segments=args.keep_segments,
+                                    **sink_options)
+        else:
+            sink = WriteBehindCSVSink(args.csv, header=CSV_HEADER, **sink_options)
+        if not args.no_index:
+            index = SparseIndex(args.csv, args.index_every)
+            sink.add_flush_listener(index.catch_up)
+    sink.add_flush_listener(lambda: WRITE_SECONDS.observe(sink.last_flush_seconds))
+    atexit.register(sink.close)
+    if not args.no_rollup:
+        resolutions = [r.strip() for r in args.rollup_res.split(",") if r.strip()]
+        rollups = RollupStore(sink.path, resolutions,
+                              durability=args.durability, fsync_interval=args.fsync_interval)
+        atexit.register(rollups.close)
+    if not args.no_gaps:
+        gaps = GapTracker(gaps_path(sink.path), flush_interval=args.flush_interval)
+        atexit.register(gaps.close)
 
+    pipeline = IngestPipeline(handle_batch, workers=args.workers, maxsize=args.queue_size,
+                              policy=args.overflow, batch_size=args.batch_size)
 
-if __name__ == '__main__':
-    # Tạo file CSV nếu chưa có
+    if args.metrics_port:
+        try:
+            metrics_server = start_http_server(metrics, args.metrics_port, args.metrics_host)
+            print(f"📈 Metrics: http://{args.metrics_host}:{args.metrics_port}/metrics")
+        except OSError as e:
+            print(f"⚠️ Không mở được cổng metrics {args.metrics_port}: {e}")
+
+
+def shutdown(args):
+    """Xử lý nốt hàng đợi, đóng sink/chỉ mục/rollup và in thống kê."""
+    if metrics_server is not None:
+        metrics_server.shutdown()
+        metrics_server.server_close()
+    pipeline.close()
+    stats = pipeline.stats()
+    print(f"📥 Hàng đợi: {stats['processed']} message đã xử lý, {stats['dropped']} bị bỏ "
+          f"({args.overflow}), cao nhất {stats['high_watermark']}/{args.queue_size}.")
+    sink.close()
+    if index is not None:
+        index.close()
+    print(f"💾 Đã ghi {sink.rows_written} dòng vào {sink.path} ({sink.flush_count} lần flush).")
+    if rollups is not None:
+        rollups.close()
+        print(f"📊 Đã ghi {rollups.buckets_written} bucket rollup ({', '.join(rollups.resolutions)}).")
+    if gaps is not None:
+        gaps.close()
+        if any(gaps.counts.values()):
+            print(f"🕳️ Khoảng trống: {gaps.counts['unchanged']} unchanged, {gaps.counts['missing']} missing "
+                  f"→ {gaps.path}")
+
+
+def main(argv=None):
+    global client
+    args = parse_args(argv)
+    start(args)
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, _handle_sigterm)
+
+    client = create_client(CLIENT_ID, args.transport)
+    client.on_connect = on_connect
+    client.on_message = on_message
     try:
-        with open(CSV_FILE, 'x', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(["Thời gian", "Nhiệt độ (°C)", "Độ ẩm (%)", "Trạng thái Quạt", "Trạng thái Đèn"])
-    except FileExistsError:
+        client.connect(args.broker, args.port)
+        client.loop_forever()
+    except KeyboardInterrupt:
         pass
+    finally:
+        client.disconnect()
+        shutdown(args)
 
+
+if __name__ == '__main__':
     main()
@@ -0,0 +1,394 @@
+# ==================== shadow.py ====================
+"""
+Device shadow: bộ nhớ đệm giá trị mới nhất của mọi thiết bị, phục vụ qua HTTP.
+
+Dịch vụ giữ một kết nối MQTT duy nhất (cùng các topic với logger), lưu
+trong bộ nhớ ``device/state``, ``sys/online`` và mẫu cảm biến mới nhất của
+từng namespace ``<owner>/<room>``. Các dashboard (web, Flutter,
+flutter_simulator.py) đọc qua HTTP thay vì mỗi viewer một subscription tới
+broker rồi tự dựng lại trạng thái từ message retained.
+
+Mỗi thiết bị có ``version`` tăng khi một giá trị thay đổi (message lặp lại
+cùng giá trị, ví dụ retained hay heartbeat, không làm tăng version); toàn
+bộ shadow có ``seq`` tăng theo mỗi thay đổi.
+
+HTTP (JSON, chỉ đọc):
+
+- ``GET /devices``: mọi thiết bị, ETag ``"<seq>"``.
+- ``GET /devices/<owner>/<room>``: một thiết bị, ETag ``"<version>"``.
+  Hai đường dẫn trên hỗ trợ ``If-None-Match`` (trả 304 khi không đổi) và
+  long-poll: ``?wait=30`` giữ request tới khi ETag khác ``If-None-Match``
+  hoặc hết thời gian (khi đó trả 304).
+- ``GET /changes?since=<seq>&wait=30``: long-poll các thiết bị đổi sau ``seq``.
+- ``GET /events``: luồng Server-Sent Events, mỗi thay đổi một event
+  ``device`` có ``id: <seq>``; nối lại với ``Last-Event-ID`` không mất thay đổi.
+- ``GET /metrics``: chỉ số Prometheus của chính dịch vụ.
+
+Chạy:
+    python shadow.py --transport loopback --http-port 9110
+    curl -i http://127.0.0.1:9110/devices/luong_iot/room1
+    curl -N http://127.0.0.1:9110/events
+"""
+
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from records import parse_topic
+from schemas import SchemaRegistry, load_schemas, loads
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsRegistry  # noqa: E402
+from common.payload import (ENCODING_JSON, ENCODING_STRUCT, decode as decode_payload,  # noqa: E402
+                            decode_state_frame, payload_encoding, split_topic)
+from common.transport import add_transport_args, create_client  # noqa: E402
+
+BROKER = 'broker.hivemq.com'
+PORT = 1883
+TOPICS = [('+/+/sensor/#', 0), ('+/+/device/state/#', 1), ('+/+/sys/online', 1)]
+CLIENT_ID = 'iot_shadow_luong'
+
+HTTP_HOST = '127.0.0.1'
+HTTP_PORT = 9110
+MAX_WAIT = 60.0         # thời gian long-poll tối đa (giây)
+SSE_KEEPALIVE = 15.0    # gửi comment giữ kết nối SSE sau chừng này giây im lặng
+JSON_TYPE = "application/json; charset=utf-8"
+
+STATE_KEYS = ("light", "fan", "rssi", "fw")
+
+
+class ShadowStore:
+    """Giá trị mới nhất theo thiết bị, an toàn khi dùng từ nhiều luồng.
+
+    Tài liệu của một thiết bị::
+
+        {"device": ..., "version": 3, "seq": 17, "updated": <epoch>,
+         "online": true, "state": {"light": "on", ...}, "sensor": {"ts": ..., "temp": ..., "hum": ...}}
+
+    ``updated`` là thời điểm của thay đổi cuối; body JSON được tuần tự hóa một
+    lần cho mỗi version và dùng lại cho mọi viewer.
+    """
+
+    def __init__(self):
+        self.seq = 0
+        self.updates = 0  # số lần cập nhật nhận được (kể cả không đổi giá trị)
+        self._docs = {}
+        self._bodies = {}
+        self._all_body = None
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def update(self, device, section, values, ts=None):
+        """Gộp ``values`` vào ``section`` ("state", "sensor" hoặc "online"); True nếu có thay đổi."""
+        with self._cond:
+            self.updates += 1
+            doc = self._docs.get(device)
+            if doc is None:
+                doc = self._docs[device] = {"device": device, "version": 0, "seq": 0, "updated": None,
+                                            "online": None, "state": {}, "sensor": {}}
+            if section == "online":
+                if doc["online"] == values:
+                    return False
+                doc["online"] = values
+            else:
+                current = doc[section]
+                if all(current.get(k) == v for k, v in values.items() if k != "ts"):
+                    return False
+                current.update(values)
+            self.seq += 1
+            doc["version"] += 1
+            doc["seq"] = self.seq
+            doc["updated"] = ts if ts is not None else time.time()
+            self._bodies.pop(device, None)
+            self._all_body = None
+            self._cond.notify_all()
+            return True
+
+    def devices(self):
+        with self._cond:
+            return sorted(self._docs)
+
+    def get(self, device):
+        """(body JSON bytes, version) của thiết bị; None nếu chưa biết thiết bị."""
+        with self._cond:
+            doc = self._docs.get(device)
+            if doc is None:
+                return None
+            body = self._bodies.get(device)
+            if body is None:
+                body = self._bodies[device] = json.dumps(doc, ensure_ascii=False).encode("utf-8")
+            return body, doc["version"]
+
+    def get_all(self):
+        """(body JSON bytes của mọi thiết bị, seq)."""
+        with self._cond:
+            if self._all_body is None:
+                self._all_body = json.dumps({"seq": self.seq, "devices": self._docs},
+                                            ensure_ascii=False).encode("utf-8")
+            return self._all_body, self.seq
+
+    def changes(self, since):
+        """(seq hiện tại, list tài liệu đổi sau ``since``) theo thứ tự seq."""
+        with self._cond:
+            docs = [dict(d, state=dict(d["state"]), sensor=dict(d["sensor"]))
+                    for d in self._docs.values() if d["seq"] > since]
+            return self.seq, sorted(docs, key=lambda d: d["seq"])
+
+    def wait(self, predicate, timeout):
+        """Chờ tới khi ``predicate()`` đúng (gọi dưới khóa), hết giờ hoặc đóng; trả về kết quả cuối."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._closed or predicate(), timeout) and not self._closed
+
+    def state(self, device):
+        """Bản sao ``state`` của thiết bị (quạt/đèn/firmware cho bộ giải mã cảm biến)."""
+        with self._cond:
+            doc = self._docs.get(device)
+            return dict(doc["state"]) if doc is not None else None
+
+    def version(self, device):
+        doc = self._docs.get(device)
+        return doc["version"] if doc is not None else 0
+
+    def close(self):
+        """Đánh thức mọi long-poll/SSE đang chờ để server dừng được."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+
+class ShadowUpdater:
+    """Giải mã message MQTT (cùng định dạng với logger) vào một ``ShadowStore``."""
+
+    def __init__(self, store, registry=None):
+        self.store = store
+        self.registry = registry or SchemaRegistry()
+        self.failed = 0
+
+    def handle(self, topic, payload, received=None):
+        received = received if received is not None else time.time()
+        info = parse_topic(topic)
+        if info is None:
+            self.failed += 1
+            return False
+        try:
+            return self._handle(info, topic, payload, received)
+        except Exception as e:
+            self.failed += 1
+            print(f"⚠️ Lỗi khi xử lý message [{topic}]:", e)
+            return False
+
+    def _handle(self, info, topic, payload, received):
+        store = self.store
+        channel = split_topic(info.channel)[0]
+        encoding = payload_encoding(payload)
+        if info.channel.startswith("sensor/"):
+            state = store.state(info.namespace)
+            readings = self.registry.decode_many(topic, payload, received, info.namespace, state)
+            if not readings:
+                return False
+            last = max(readings, key=lambda r: r.ts)
+            return store.update(info.namespace, "sensor", {"ts": last.ts, "temp": last.temp, "hum": last.hum},
+                                received)
+        if channel == "device/state":
+            if encoding == ENCODING_STRUCT:
+                ts, light, fan, rssi, fw = decode_state_frame(payload)
+                data = {"ts": ts, "light": light, "fan": fan, "rssi": rssi, "fw": fw}
+            else:
+                data = loads(payload) if encoding == ENCODING_JSON else decode_payload(payload)
+            values = {k: data[k] for k in ("ts", *STATE_KEYS) if k in data}
+            return store.update(info.namespace, "state", values, received)
+        if channel == "sys/online":
+            return store.update(info.namespace, "online", bool(loads(payload).get("online")), received)
+        return False
+
+
+def _etag(value):
+    return f'"{value}"'
+
+
+def _wait_param(query):
+    try:
+        return max(0.0, min(float(query.get("wait", ["0"])[0]), MAX_WAIT))
+    except ValueError:
+        return 0.0
+
+
+def make_handler(store, metrics):
+    requests = metrics.counter("shadow_http_requests_total", "Request HTTP theo đường dẫn và mã trạng thái",
+                               ("route", "status"))
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            query = parse_qs(url.query)
+            path = url.path.rstrip("/")
+            if path == "/devices":
+                self._conditional("devices", store.get_all, lambda seen: store.seq != seen, query)
+            elif path.startswith("/devices/"):
+                device = path[len("/devices/"):]
+                self._conditional("device", lambda: store.get(device),
+                                  lambda seen: store.version(device) != seen, query)
+            elif path == "/changes":
+                self._changes(query)
+            elif path == "/events":
+                self._events()
+            elif path == "/metrics":
+                self._send("metrics", 200, metrics.render().encode("utf-8"), METRICS_CONTENT_TYPE)
+            else:
+                self._send("other", 404, b'{"error": "not found"}')
+
+        def _send(self, route, status, body=b"", content_type=JSON_TYPE, etag=None):
+            requests.inc(route, str(status))
+            self.send_response(status)
+            if etag is not None:
+                self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+            if status != 304:
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if status != 304:
+                self.wfile.write(body)
+
+        def _conditional(self, route, fetch, changed, query):
+            found = fetch()
+            if found is None:
+                self._send(route, 404, b'{"error": "unknown device"}')
+                return
+            body, version = found
+            if self.headers.get("If-None-Match") == _etag(version):
+                wait = _wait_param(query)
+                if not (wait and store.wait(lambda: changed(version), wait)):
+                    self._send(route, 304, etag=_etag(version))
+                    return
+                body, version = fetch()
+            self._send(route, 200, body, etag=_etag(version))
+
+        def _changes(self, query):
+            try:
+                since = int(query.get("since", ["0"])[0])
+            except ValueError:
+                self._send("changes", 400, b'{"error": "since must be an integer"}')
+                return
+            wait = _wait_param(query)
+            if wait:
+                store.wait(lambda: store.seq > since, wait)
+            seq, docs = store.changes(since)
+            body = json.dumps({"seq": seq, "devices": docs}, ensure_ascii=False).encode("utf-8")
+            self._send("changes", 200, body, etag=_etag(seq))
+
+        def _events(self):
+            try:
+                since = int(self.headers.get("Last-Event-ID") or 0)
+            except ValueError:
+                since = 0
+            requests.inc("events", "200")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            try:
+                while not store.closed:
+                    seq, docs = store.changes(since)
+                    if docs:
+                        self.wfile.write(b"".join(
+                            f"id: {d['seq']}\nevent: device\ndata: {json.dumps(d, ensure_ascii=False)}\n\n"
+                            .encode("utf-8") for d in docs))
+                        self.wfile.flush()
+                        since = seq
+                    elif not store.wait(lambda: store.seq > since, SSE_KEEPALIVE):
+                        self.wfile.write(b": keepalive\n\n")
+                        self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # viewer đã đóng kết nối
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_http_server(store, port, host=HTTP_HOST, metrics=None):
+    """Phục vụ shadow trên luồng nền; trả về server (gọi ``shutdown()`` để dừng)."""
+    metrics = metrics or MetricsRegistry()
+    server = ThreadingHTTPServer((host, port), make_handler(store, metrics))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="shadow-http", daemon=True).start()
+    return server
+
+
+def make_metrics(store, updater):
+    metrics = MetricsRegistry()
+    metrics.gauge("shadow_devices", "Số thiết bị trong shadow", lambda: len(store.devices()))
+    metrics.gauge("shadow_seq", "Số thay đổi đã ghi nhận", lambda: store.seq, kind="counter")
+    metrics.gauge("shadow_updates_total", "Message cập nhật đã nhận (kể cả không đổi giá trị)",
+                  lambda: store.updates, kind="counter")
+    metrics.gauge("shadow_failed_total", "Message lỗi", lambda: updater.failed, kind="counter")
+    return metrics
+
+
+def _handle_sigterm(signum, frame):
+    raise SystemExit(0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Device shadow: trạng thái mới nhất của thiết bị qua HTTP")
+    add_transport_args(parser, BROKER, PORT)
+    parser.add_argument("--http-host", default=HTTP_HOST, help="địa chỉ lắng nghe HTTP")
+    parser.add_argument("--http-port", type=int, default=HTTP_PORT, help="cổng HTTP")
+    parser.add_argument("--schemas", help="file JSON các schema payload bổ sung (ưu tiên hơn mặc định)")
+    args = parser.parse_args(argv)
+
+    registry = SchemaRegistry()
+    if args.schemas:
+        for schema in reversed(load_schemas(args.schemas)):
+            registry.register(schema, first=True)
+    store = ShadowStore()
+    updater = ShadowUpdater(store, registry)
+    server = start_http_server(store, args.http_port, args.http_host, make_metrics(store, updater))
+    print(f"🪞 Shadow: http://{args.http_host}:{args.http_port}/devices")
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, _handle_sigterm)
+
+    def on_connect(client, userdata, flags, reason_code, properties=None):
+        if reason_code == 0:
+            print("✅ MQTT: Kết nối thành công.")
+            client.subscribe(TOPICS)
+        else:
+            print("❌ Kết nối thất bại, mã lỗi:", reason_code)
+
+    def on_message(client, userdata, msg):
+        updater.handle(msg.topic, msg.payload)
+
+    client = create_client(CLIENT_ID, args.transport)
+    client.on_connect = on_connect
+    client.on_message = on_message
+    try:
+        client.connect(args.broker, args.port)
+        client.loop_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.disconnect()
+        store.close()
+        server.shutdown()
+        server.server_close()
+        print(f"🪞 Shadow dừng: {len(store.devices())} thiết bị, {store.seq} thay đổi / {store.updates} message.")
+
+
+if __name__ == '__main__':
+    main()
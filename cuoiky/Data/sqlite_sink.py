@@ -0,0 +1,227 @@
+# ==================== sqlite_sink.py ====================
+"""
+Lưu trữ SQLite cho MQTT logger (truy vấn SQL tùy ý thay vì đọc CSV).
+
+``SQLiteSink`` dùng chung khung write-behind với các sink khác: mỗi lần
+flush (đủ ``flush_rows`` dòng hoặc hết ``flush_interval`` giây) là một
+transaction ``executemany``, nên chi phí commit được chia cho cả lô.
+Cơ sở dữ liệu chạy ở chế độ WAL: người đọc (read_log.py, sqlite3 CLI)
+không chặn logger và ngược lại.
+
+Bảng ``readings(ts, device, temp, hum, fan, light)`` có chỉ mục
+``(device, ts)`` cho truy vấn theo thiết bị và ``(ts)`` cho
+``ORDER BY ts DESC LIMIT N`` trên mọi thiết bị.
+
+Độ bền (``durability``) ánh xạ sang ``PRAGMA synchronous``:
+- ``none``: OFF, không fsync.
+- ``flush``: FULL, fsync mỗi transaction.
+- ``interval``: NORMAL, WAL được checkpoint (fsync) mỗi ``fsync_interval`` giây.
+
+Dòng lệnh:
+    python sqlite_sink.py tail iot_log.db -n 20 --device luong_iot/room1
+    python sqlite_sink.py range iot_log.db --from "2025-10-30 20:00:00" --to "2025-10-30 21:00:00"
+    python sqlite_sink.py import iot_log.csv iot_log.db
+"""
+
+import argparse
+import sqlite3
+
+from csv_sink import DURABILITY_FLUSH, DURABILITY_NONE, WriteBehindSink
+from records import TIME_FORMAT, Reading, parse_time
+
+DB_FILE = "iot_log.db"
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    ts     REAL NOT NULL,
+    device TEXT NOT NULL,
+    temp   REAL,
+    hum    REAL,
+    fan    TEXT,
+    light  TEXT
+);
+CREATE INDEX IF NOT EXISTS readings_device_ts ON readings (device, ts);
+CREATE INDEX IF NOT EXISTS readings_ts ON readings (ts);
+"""
+INSERT = "INSERT INTO readings (ts, device, temp, hum, fan, light) VALUES (?, ?, ?, ?, ?, ?)"
+COLUMNS = "ts, device, temp, hum, fan, light"
+
+
+def is_sqlite_path(path):
+    return str(path).endswith(SQLITE_SUFFIXES)
+
+
+def _synchronous(durability):
+    if durability == DURABILITY_NONE:
+        return "OFF"
+    if durability == DURABILITY_FLUSH:
+        return "FULL"
+    return "NORMAL"
+
+
+class SQLiteSink(WriteBehindSink):
+    """Sink write-behind ghi ``Reading`` vào SQLite, mỗi lô một transaction."""
+
+    thread_name = "sqlite-sink-flusher"
+    # "database is locked", "disk I/O error", đĩa đầy, ... là OperationalError
+    retry_errors = (OSError, sqlite3.OperationalError)
+
+    def _open(self):
+        # Kết nối dùng từ luồng flush và từ close(); khóa I/O của lớp cha tuần tự hóa truy cập
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={_synchronous(self.durability)}")
+        conn.executescript(SCHEMA)
+        self._page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        self._db_bytes = self._size(conn)
+        return conn
+
+    def _size(self, conn):
+        return conn.execute("PRAGMA page_count").fetchone()[0] * self._page_size
+
+    def _reading_item(self, reading):
+        return (reading.ts, reading.device, _num(reading.temp), _num(reading.hum),
+                reading.fan, reading.light)
+
+    def _write_items(self, items):
+        conn = self._file
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(INSERT, items)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        # bytes_written xấp xỉ bằng phần tăng của cơ sở dữ liệu (kể cả chỉ mục)
+        size = self._size(conn)
+        self.bytes_written += size - self._db_bytes
+        self._db_bytes = size
+
+    def _flush_files(self):
+        pass  # COMMIT đã đưa dữ liệu vào WAL
+
+    def _sync_files(self):
+        if self.durability == DURABILITY_FLUSH:
+            return  # synchronous=FULL: COMMIT đã fsync WAL
+        self._file.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def _close_files(self):
+        self._file.close()
+
+
+def _num(value):
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# ---------- Đọc ----------
+
+def connect_readonly(path):
+    """Kết nối chỉ đọc (không tạo file mới nếu ``path`` không tồn tại)."""
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+
+def _reading(row):
+    ts, device, temp, hum, fan, light = row
+    return Reading(ts, device, temp, hum, fan or "unknown", light or "unknown")
+
+
+def tail(path, n, device=None):
+    """N mẫu mới nhất (cũ -> mới), dùng chỉ mục ``ts`` hoặc ``(device, ts)``."""
+    conn = connect_readonly(path)
+    try:
+        if device is None:
+            rows = conn.execute(f"SELECT {COLUMNS} FROM readings ORDER BY ts DESC LIMIT ?", (n,)).fetchall()
+        else:
+            rows = conn.execute(f"SELECT {COLUMNS} FROM readings WHERE device = ? ORDER BY ts DESC LIMIT ?",
+                                (device, n)).fetchall()
+    finally:
+        conn.close()
+    return [_reading(r) for r in reversed(rows)]
+
+
+def iter_range(path, start=None, end=None, device=None):
+    """Các mẫu có ``start <= ts < end`` theo thứ tự thời gian."""
+    where, params = [], []
+    if device is not None:
+        where.append("device = ?")
+        params.append(device)
+    if start is not None:
+        where.append("ts >= ?")
+        params.append(start)
+    if end is not None:
+        where.append("ts < ?")
+        params.append(end)
+    sql = f"SELECT {COLUMNS} FROM readings"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY ts"
+    conn = connect_readonly(path)
+    try:
+        for row in conn.execute(sql, params):
+            yield _reading(row)
+    finally:
+        conn.close()
+
+
+def import_log(log_path, db_path, device="unknown", batch=10000):
+    """Chép một log có sẵn (CSV kể cả các đoạn xoay vòng, hoặc binlog) vào SQLite."""
+    from rollup import iter_log_readings
+
+    count = 0
+    with SQLiteSink(db_path, flush_rows=batch, flush_interval=60.0) as sink:
+        for reading in iter_log_readings(log_path, device):
+            sink.write_reading(reading)
+            count += 1
+    return count
+
+
+def print_readings(readings):
+    from prettytable import PrettyTable
+
+    table = PrettyTable()
+    table.field_names = ["Thời gian", "Thiết bị", "Nhiệt độ (°C)", "Độ ẩm (%)", "Quạt", "Đèn"]
+    for r in readings:
+        table.add_row([r.time_str(), r.device, r.temp, r.hum, r.fan, r.light])
+    print(table)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Log IoT trong SQLite")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_tail = sub.add_parser("tail", help="N mẫu mới nhất")
+    p_tail.add_argument("db", nargs="?", default=DB_FILE)
+    p_tail.add_argument("-n", "--rows", type=int, default=20)
+    p_tail.add_argument("--device", help="chỉ lấy thiết bị này")
+
+    p_range = sub.add_parser("range", help="các mẫu trong khoảng thời gian")
+    p_range.add_argument("db", nargs="?", default=DB_FILE)
+    p_range.add_argument("--from", dest="start", help=f"thời điểm bắt đầu ({TIME_FORMAT.replace('%', '%%')})")
+    p_range.add_argument("--to", dest="end", help=f"thời điểm kết thúc, không tính ({TIME_FORMAT.replace('%', '%%')})")
+    p_range.add_argument("--device", help="chỉ lấy thiết bị này")
+
+    p_import = sub.add_parser("import", help="chép log CSV/binlog có sẵn vào SQLite")
+    p_import.add_argument("log")
+    p_import.add_argument("db", nargs="?", default=DB_FILE)
+    p_import.add_argument("--device", default="unknown", help="tên thiết bị gán cho các dòng CSV không có cột thiết bị")
+
+    args = parser.parse_args(argv)
+    if args.command == "tail":
+        print_readings(tail(args.db, args.rows, args.device))
+    elif args.command == "range":
+        start = parse_time(args.start) if args.start else None
+        end = parse_time(args.end) if args.end else None
+        print_readings(list(iter_range(args.db, start, end, args.device)))
+    else:
+        n = import_log(args.log, args.db, args.device)
+        print(f"✅ Đã chép {n} mẫu vào {args.db}")
+
+
+if __name__ == "__main__":
+    main()
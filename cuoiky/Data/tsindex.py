@@ -0,0 +1,348 @@
+# ==================== tsindex.py ====================
+"""
+Chỉ mục thời gian thưa (sparse) cho log CSV và truy vấn theo khoảng thời gian.
+
+File ``iot_log.csv.idx`` nằm cạnh log, gồm header 48 byte rồi các mục 24 byte
+``float64 epoch | uint64 byte offset | uint64 số thứ tự dòng``: cứ mỗi
+``every`` dòng dữ liệu thì lưu vị trí của một dòng. Truy vấn tìm nhị phân trên
+các mục để nhảy tới gần đầu khoảng cần đọc, rồi chỉ đọc tuần tự phần đó.
+
+Log không tăng dần tuyệt đối: mẫu trong lô từ thiết bị (sensor/batch, backlog
+sau khi mất kết nối) được ghi với thời điểm đo. Header lưu độ trễ tối đa
+(``records.Lateness``) và vị trí đã quét tới; truy vấn nới giới hạn tìm kiếm
+và điều kiện dừng thêm đúng độ trễ đó, và luôn đọc hết phần log ghi sau lần
+đánh chỉ mục cuối.
+
+Chỉ mục là dữ liệu dẫn xuất: nó chỉ được ghi sau khi dòng log tương ứng đã
+flush, mục ghi dở được cắt bỏ khi mở, và mục cuối được kiểm tra lại với log.
+Nếu không khớp (log bị thay/cắt), chỉ mục được tạo lại từ đầu.
+
+Với binlog (``.bin``) không cần file chỉ mục: bản ghi kích thước cố định nên
+``BinaryLogReader.search()`` tìm nhị phân trực tiếp trên file.
+
+Dòng lệnh:
+    python tsindex.py query iot_log.csv --from "2025-10-30 20:31:00" --to "2025-10-30 20:45:00"
+    python tsindex.py rebuild iot_log.csv
+    python tsindex.py info iot_log.csv
+"""
+
+import argparse
+import bisect
+import csv
+import os
+import struct
+import threading
+
+from records import TIME_FORMAT, Lateness, parse_time, reading_from_csv_row
+
+MAGIC = b"IOTX"
+VERSION = 2
+# magic, version, kích thước mục, every, độ trễ tối đa (giây), thời gian mới nhất,
+# offset và số dòng đã quét tới
+HEADER = struct.Struct("<4sHHIddQQ4x")
+HEADER_SIZE = HEADER.size            # 48
+ENTRY = struct.Struct("<dQQ")
+ENTRY_SIZE = ENTRY.size              # 24
+
+INDEX_EVERY = 256  # mặc định: một mục cho mỗi 256 dòng
+
+
+def index_path(log_path):
+    return log_path + ".idx"
+
+
+def _line_time(line):
+    """Thời gian ở cột đầu của một dòng CSV (bytes); None nếu không phải dòng dữ liệu."""
+    field = line.split(b",", 1)[0].strip().strip(b'"')
+    try:
+        return parse_time(field.decode("utf-8", errors="replace"))
+    except ValueError:
+        return None
+
+
+class SparseIndex:
+    """Chỉ mục thưa của một file log CSV; ``catch_up()`` đọc phần log mới ghi thêm.
+
+    ``readonly=True`` (dùng khi truy vấn trong lúc logger đang chạy) chỉ nạp
+    các mục đã có, không ghi hay sửa file chỉ mục.
+    """
+
+    def __init__(self, log_path, every=INDEX_EVERY, path=None, readonly=False):
+        if every < 1:
+            raise ValueError("every phải >= 1")
+        self.log_path = log_path
+        self.path = path or index_path(log_path)
+        self.every = every
+        self.readonly = readonly
+        self.times = []
+        self.offsets = []
+        self.rows = []
+        self.scan_pos = 0   # offset đầu dòng chưa quét
+        self.row_count = 0  # số dòng dữ liệu trước scan_pos
+        self.late = Lateness()  # độ trễ của các dòng trước scan_pos
+        self._lock = threading.Lock()
+        self._file = None
+        self._inode = None
+        self._load()
+        if not readonly:
+            self.catch_up()
+
+    # ---------- Nạp / kiểm tra ----------
+
+    def _load(self):
+        loaded = self._read_entries()
+        if loaded is None or not self._verify(*loaded):
+            if not self.readonly:
+                self._reset()
+            return
+        entries, (lateness, latest, scanned, rows) = loaded
+        for ts, offset, row in entries:
+            self.times.append(ts)
+            self.offsets.append(offset)
+            self.rows.append(row)
+        if not self.readonly:
+            self._file = open(self.path, "r+b")
+        # Tiếp tục quét từ vị trí header ghi lại (các mục ghi sau header khi crash
+        # được quét lại nhưng không thêm lần hai)
+        self.scan_pos, self.row_count = scanned, rows
+        self.late = Lateness(latest if rows else None, lateness)
+
+    def _read_entries(self):
+        """(các mục hợp lệ, trạng thái quét trong header); None nếu cần tạo lại."""
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "rb") as f:
+            data = f.read()
+        if len(data) < HEADER_SIZE:
+            return None
+        magic, version, entry_size, every, *state = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION or entry_size != ENTRY_SIZE:
+            return None
+        if self.readonly:
+            self.every = every
+        elif every != self.every:
+            return None
+        usable = (len(data) - HEADER_SIZE) // ENTRY_SIZE * ENTRY_SIZE
+        if HEADER_SIZE + usable != len(data) and not self.readonly:
+            # Mục ghi dở khi crash
+            with open(self.path, "r+b") as f:
+                f.truncate(HEADER_SIZE + usable)
+        return list(ENTRY.iter_unpack(data[HEADER_SIZE:HEADER_SIZE + usable])), state
+
+    def _verify(self, entries, state):
+        """Mục cuối phải trỏ đúng vào một dòng của log có cùng thời gian, phần đã quét phải còn trong log."""
+        try:
+            size = os.path.getsize(self.log_path)
+        except OSError:
+            return False
+        if state[2] > size:
+            return False
+        if not entries:
+            return True
+        ts, offset, _ = entries[-1]
+        try:
+            with open(self.log_path, "rb") as f:
+                f.seek(offset)
+                return _line_time(f.readline()) == ts
+        except OSError:
+            return False
+
+    def _reset(self):
+        if self._file is not None:
+            self._file.close()
+        self.times, self.offsets, self.rows = [], [], []
+        self.scan_pos = self.row_count = 0
+        self.late = Lateness()
+        self._file = open(self.path, "w+b")
+        self._write_header()
+
+    def _write_header(self):
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, VERSION, ENTRY_SIZE, self.every, self.late.lateness,
+                                     self.late.latest or 0.0, self.scan_pos, self.row_count))
+        self._file.flush()
+
+    @property
+    def lateness(self):
+        """Độ trễ tối đa (giây) của các dòng đã quét."""
+        return self.late.lateness
+
+    # ---------- Cập nhật ----------
+
+    def catch_up(self):
+        """Đánh chỉ mục phần log ghi thêm từ lần quét trước; trả về số dòng mới."""
+        if self.readonly:
+            raise ValueError("Chỉ mục mở ở chế độ chỉ đọc")
+        with self._lock:
+            if not os.path.exists(self.log_path):
+                return 0
+            st = os.stat(self.log_path)
+            if st.st_size < self.scan_pos or (self._inode is not None and st.st_ino != self._inode):
+                self._reset()  # log bị cắt ngắn / thay mới (xoay vòng đoạn)
+            self._inode = st.st_ino
+            new_rows = 0
+            entries = []
+            last_row = self.rows[-1] if self.rows else -1
+            with open(self.log_path, "rb") as f:
+                f.seek(self.scan_pos)
+                while True:
+                    line = f.readline()
+                    if not line.endswith(b"\n"):
+                        break  # dòng chưa ghi xong: để lần sau
+                    offset = self.scan_pos
+                    self.scan_pos += len(line)
+                    ts = _line_time(line)
+                    if ts is None:
+                        continue
+                    self.late.observe(ts)
+                    row = self.row_count
+                    self.row_count += 1
+                    new_rows += 1
+                    if row % self.every == 0 and row > last_row:
+                        entries.append((ts, offset, row))
+            if entries:
+                self._file.seek(0, os.SEEK_END)
+                self._file.write(b"".join(ENTRY.pack(*e) for e in entries))
+                self._file.flush()
+                for ts, offset, row in entries:
+                    self.times.append(ts)
+                    self.offsets.append(offset)
+                    self.rows.append(row)
+            if new_rows:
+                # Header sau các mục: reader thấy vị trí quét mới thì cũng thấy độ trễ của nó
+                self._write_header()
+            return new_rows
+
+    def rebuild(self):
+        """Bỏ chỉ mục cũ và quét lại toàn bộ log."""
+        with self._lock:
+            self._reset()
+        return self.catch_up()
+
+    # ---------- Truy vấn ----------
+
+    def locate(self, start):
+        """Offset an toàn để bắt đầu đọc các dòng có thời gian >= ``start``."""
+        with self._lock:
+            if start is None or not self.times:
+                return 0
+            # Chỉ dùng các mục nằm trong phần đã quét (độ trễ đã biết). Mục có
+            # thời gian < start - lateness: mọi dòng tới nó đều < start
+            target = start - self.late.lateness
+            lo, hi = 0, bisect.bisect_left(self.offsets, self.scan_pos)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self.times[mid] < target:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            return self.offsets[lo - 1] if lo > 0 else 0
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def iter_csv_range(log_path, start=None, end=None, index=None, device="unknown"):
+    """Các Reading của log CSV có ``start <= ts < end`` (epoch giây; None = không giới hạn)."""
+    own_index = index is None
+    if own_index:
+        index = SparseIndex(log_path, readonly=True)
+    try:
+        offset = index.locate(start)
+        scanned, lateness = index.scan_pos, index.lateness
+    finally:
+        if own_index:
+            index.close()
+
+    with open(log_path, "rb") as f:
+        f.seek(offset)
+        pos = offset
+        while True:
+            line = f.readline()
+            if not line:
+                break
+            line_start = pos
+            pos += len(line)
+            ts = _line_time(line)
+            if ts is None:
+                continue
+            if end is not None and ts >= end + lateness and line_start < scanned:
+                # Mọi dòng sau đó trong phần đã đánh chỉ mục đều >= end; phần ghi
+                # sau lần đánh chỉ mục cuối (độ trễ chưa biết) vẫn đọc hết
+                if pos >= scanned:
+                    continue
+                f.seek(scanned)
+                pos = scanned
+                continue
+            if (start is not None and ts < start) or (end is not None and ts >= end):
+                continue
+            row = next(csv.reader([line.decode("utf-8", errors="replace")]), [])
+            reading = reading_from_csv_row(row, device)
+            if reading is not None:
+                yield reading
+
+
+def iter_range(log_path, start=None, end=None, device="unknown"):
+    """Truy vấn theo khoảng thời gian cho log CSV (kể cả các đoạn đã xoay vòng) hoặc binlog."""
+    if log_path.endswith(".bin"):
+        from binlog import BinaryLogReader
+
+        with BinaryLogReader(log_path) as reader:
+            yield from reader.iter_range(start, end)
+    else:
+        from segments import iter_readings
+
+        yield from iter_readings(log_path, start, end, device)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Truy vấn log IoT theo khoảng thời gian")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_query = sub.add_parser("query", help="in các dòng trong khoảng thời gian")
+    p_query.add_argument("log", help="file log (.csv hoặc .bin)")
+    p_query.add_argument("--from", dest="start", help=f"thời điểm bắt đầu ({TIME_FORMAT.replace('%', '%%')})")
+    p_query.add_argument("--to", dest="end", help=f"thời điểm kết thúc, không tính ({TIME_FORMAT.replace('%', '%%')})")
+    p_query.add_argument("--device", help="chỉ lấy thiết bị này")
+
+    p_rebuild = sub.add_parser("rebuild", help="tạo lại chỉ mục từ log")
+    p_rebuild.add_argument("log")
+    p_rebuild.add_argument("--every", type=int, default=INDEX_EVERY, help="một mục cho mỗi N dòng")
+
+    p_info = sub.add_parser("info", help="thông tin chỉ mục")
+    p_info.add_argument("log")
+
+    args = parser.parse_args(argv)
+    if args.command == "query":
+        start = parse_time(args.start) if args.start else None
+        end = parse_time(args.end) if args.end else None
+        count = 0
+        for r in iter_range(args.log, start, end):
+            if args.device and r.device != args.device:
+                continue
+            print(f"{r.time_str()} | {r.device} | T={r.temp}°C | H={r.hum}% | Quạt={r.fan} | Đèn={r.light}")
+            count += 1
+        print(f"({count} dòng)")
+    elif args.command == "rebuild":
+        with SparseIndex(args.log, args.every) as index:
+            n = index.rebuild()
+            print(f"✅ Đã đánh chỉ mục {n} dòng, {len(index.times)} mục -> {index.path}")
+    else:
+        with SparseIndex(args.log, readonly=True) as index:
+            print(f"📇 {index.path}: {len(index.times)} mục, mỗi {index.every} dòng, "
+                  f"độ trễ tối đa {index.lateness:g}s")
+            if index.times:
+                print(f"   Mục cuối: dòng {index.rows[-1]} tại byte {index.offsets[-1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Analytics Benchmark
+Generates a synthetic binlog (default 10 million rows across 100 devices)
+and measures the NumPy analytics layer: chunked loading, per-device
+summaries with anomaly counts (two passes), rolling mean/std, and dew
+point / heat index. A plain per-row Python loop over a sample of the same
+data is timed as the baseline.
+"""
+
+import argparse
+import math
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Data"))
+
+import analytics  # noqa: E402
+from binlog import HEADER, MAGIC, RECORD_DTYPE, RECORD_SIZE, VERSION, open_memmap  # noqa: E402
+
+
+def write_synthetic_binlog(path, rows, devices, seed=0):
+    """Write `rows` records round-robin over `devices` in 1M-row blocks"""
+    rng = np.random.default_rng(seed)
+    start_ms = int(time.time() * 1000) - rows * 100
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, RECORD_SIZE))
+        for offset in range(0, rows, 1_000_000):
+            n = min(1_000_000, rows - offset)
+            block = np.zeros(n, dtype=RECORD_DTYPE)
+            idx = np.arange(offset, offset + n)
+            block["ts_ms"] = start_ms + idx * 100
+            block["device"] = idx % devices
+            block["temp"] = 27 + 3 * np.sin(idx / 50_000) + rng.normal(0, 0.3, n)
+            block["hum"] = 70 + 10 * np.cos(idx / 70_000) + rng.normal(0, 1.0, n)
+            spikes = rng.random(n) < 1e-4
+            block["temp"][spikes] += 15
+            block.tofile(f)
+    with open(path + ".devices", "w", encoding="utf-8") as f:
+        for n in range(devices):
+            f.write(f"bench/room{n}\n")
+
+
+def python_loop(temp, hum):
+    """Per-row baseline: dew point, heat index and running sums in pure Python"""
+    count = total = 0.0
+    for t, rh in zip(temp.tolist(), hum.tolist()):
+        gamma = math.log(rh / 100.0) + 17.62 * t / (243.12 + t)
+        dew = 243.12 * gamma / (17.62 - gamma)
+        f = t * 9 / 5 + 32
+        hi = 0.5 * (f + 61.0 + (f - 68.0) * 1.2 + rh * 0.094)
+        if (hi + f) / 2 >= 80:
+            hi = (-42.379 + 2.04901523 * f + 10.14333127 * rh - 0.22475541 * f * rh
+                  - 6.83783e-3 * f * f - 5.481717e-2 * rh * rh + 1.22874e-3 * f * f * rh
+                  + 8.5282e-4 * f * rh * rh - 1.99e-6 * f * f * rh * rh)
+        count += 1
+        total += dew + hi
+    return total / count
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000_000, help="rows in the synthetic log")
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--chunk-rows", type=int, default=analytics.CHUNK_ROWS)
+    parser.add_argument("--window", type=int, default=60, help="rolling window (samples)")
+    parser.add_argument("--loop-rows", type=int, default=500_000,
+                        help="rows for the per-row Python baseline")
+    parser.add_argument("--keep", help="write the synthetic log here instead of a temp dir")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.keep or os.path.join(tmp, "synthetic.bin")
+        elapsed, _ = timed(write_synthetic_binlog, path, args.rows, args.devices)
+        size_mb = os.path.getsize(path) / 1e6
+        print(f"🧪 Synthetic log: {args.rows:,} rows, {args.devices} devices, "
+              f"{size_mb:,.0f} MB (generated in {elapsed:.1f}s)")
+
+        def load_all():
+            return sum(float(np.nansum(c.temp)) for c in analytics.load_chunks(path, args.chunk_rows))
+
+        def derived():
+            n = 0
+            for c in analytics.load_chunks(path, args.chunk_rows):
+                analytics.dew_point(c.temp, c.hum)
+                analytics.heat_index(c.temp, c.hum)
+                n += len(c)
+            return n
+
+        elapsed, _ = timed(load_all)
+        results.append(("chunked load (mmap)", elapsed, args.rows, ""))
+        elapsed, _ = timed(derived)
+        results.append(("dew point + heat index", elapsed, args.rows, ""))
+        elapsed, out = timed(analytics.rolling, path, args.window, None, args.chunk_rows)
+        results.append((f"rolling mean/std (w={args.window})", elapsed, args.rows, ""))
+        elapsed, reports = timed(analytics.analyze, path, args.chunk_rows)
+        anomalies = sum(r.z_anomalies for r in reports)
+        results.append(("analyze (2 passes)", elapsed, args.rows,
+                        f"{len(reports)} devices, {anomalies} z-anomalies"))
+
+        sample = open_memmap(path)[:args.loop_rows]
+        temp = sample["temp"].astype(np.float64)
+        hum = sample["hum"].astype(np.float64)
+        elapsed, _ = timed(python_loop, temp, hum)
+        results.append(("per-row Python loop (baseline)", elapsed, len(sample), "dew point + heat index"))
+        del sample, out
+
+    baseline = results[-1][2] / results[-1][1]
+    print(f"{'stage':<34}{'seconds':>10}{'rows/s':>16}{'vs loop':>10}  notes")
+    print("─" * 90)
+    for name, elapsed, rows, notes in results:
+        rate = rows / elapsed
+        print(f"{name:<34}{elapsed:>10.3f}{rate:>16,.0f}{rate / baseline:>9.1f}x  {notes}")
+
+
+if __name__ == "__main__":
+    main()
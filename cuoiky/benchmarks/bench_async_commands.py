@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Pipelined Command Benchmark
+Sends one bulk operation (a command to every device, repeated --rounds
+times) through common/controller.py's AsyncController and compares the
+in-flight windows: window 1 is the serialized send-and-wait loop, larger
+windows pipeline commands across devices. Every command is matched to its
+state echo by correlation ID, so several commands may be in flight per
+device. Devices hold each state publish for --device-latency seconds (their
+coalescing window), standing in for radio/processing time on real hardware;
+commands arriving meanwhile are answered by the same state message.
+
+Runs fully offline on the loopback broker by default; --transport tcp
+targets a local broker (e.g. mosquitto).
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "simulators"))
+
+from common import loopback  # noqa: E402
+from common.controller import AsyncController, CommandTimeout  # noqa: E402
+from common.transport import TRANSPORTS, TRANSPORT_LOOPBACK, create_client  # noqa: E402
+from fleet import Fleet  # noqa: E402
+
+NS_TEMPLATE = "bench/room{n}"
+
+
+async def run_window(client_factory, args, namespaces, window):
+    """(seconds, answered, timed out, in-flight high watermark) for one window size"""
+    controller = AsyncController(client_factory(f"bench_async_{window}_{int(time.time())}"),
+                                 window=window, timeout=args.timeout)
+    await controller.connect(args.broker, args.port)
+    commands = [(ns, {"light": "toggle"}) for _ in range(args.rounds) for ns in namespaces]
+    start = time.perf_counter()
+    results = await controller.command_many(commands)
+    elapsed = time.perf_counter() - start
+    controller.close()
+    lost = sum(1 for r in results if isinstance(r, CommandTimeout))
+    return elapsed, len(results) - lost, lost, controller.in_flight_high_watermark
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--transport", choices=TRANSPORTS, default=TRANSPORT_LOOPBACK)
+    parser.add_argument("--broker", default="localhost", help="broker host for --transport tcp")
+    parser.add_argument("--port", type=int, default=1883, help="broker port for --transport tcp")
+    parser.add_argument("--devices", type=int, default=50, help="virtual devices to command")
+    parser.add_argument("--rounds", type=int, default=20, help="commands per device")
+    parser.add_argument("--windows", default="1,8,64,256", help="comma list of in-flight windows")
+    parser.add_argument("--timeout", type=float, default=5.0, help="seconds before a command counts as lost")
+    parser.add_argument("--device-latency", type=float, default=0.005,
+                        help="seconds a device takes to answer (its coalescing window)")
+    args = parser.parse_args()
+
+    namespaces = [NS_TEMPLATE.format(n=n) for n in range(args.devices)]
+    broker = loopback.LoopbackBroker() if args.transport == TRANSPORT_LOOPBACK else None
+
+    def client_factory(client_id):
+        return create_client(client_id, args.transport, broker=broker)
+
+    # Device side: sensors and heartbeats off, every state publish answers commands
+    fleet = Fleet(args.broker, args.port, publish_interval=0, heartbeat_interval=0,
+                  status_interval=0, client_factory=client_factory)
+    for n, ns in enumerate(namespaces):
+        fleet.add_device(ns, f"bench_{n:04d}", "bench", verbose=False,
+                         coalesce_window=args.device_latency)
+    fleet_thread = threading.Thread(target=fleet.run, name="fleet", daemon=True)
+    fleet_thread.start()
+    deadline = time.monotonic() + 30
+    while not all(d.client.is_connected() for d in fleet.devices):
+        if time.monotonic() > deadline:
+            raise SystemExit("❌ Devices did not connect within 30s")
+        time.sleep(0.05)
+
+    total = args.devices * args.rounds
+    results = [(window, asyncio.run(run_window(client_factory, args, namespaces, window)))
+               for window in (int(w) for w in args.windows.split(",") if w.strip())]
+    fleet.stop()
+    fleet_thread.join(5)
+
+    baseline = results[0][1][0]
+    print(f"📊 {total:,} commands ({args.devices} devices × {args.rounds}), transport {args.transport}, "
+          f"device latency {args.device_latency * 1000:g} ms")
+    print(f"{'window':>8}{'seconds':>10}{'cmd/s':>12}{'answered':>10}{'lost':>6}{'max in flight':>15}{'speedup':>10}")
+    print("─" * 71)
+    for window, (elapsed, answered, lost, high) in results:
+        print(f"{window:>8}{elapsed:>10.3f}{answered / elapsed:>12,.0f}{answered:>10}{lost:>6}{high:>15}"
+              f"{baseline / elapsed:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+End-to-end Command Latency Benchmark
+Drives the loop users feel: controller publishes {device: action} on
+<ns>/device/cmd -> VirtualDevice.handle_device_command -> retained
+<ns>/device/state -> back to the controller. Reports p50/p95/p99/max
+latency and sustained commands/second, and writes JSON results that can
+be compared between runs with --baseline.
+
+Runs fully offline: --transport loopback (default) uses the in-process
+broker, --transport tcp targets a local broker (e.g. mosquitto).
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "simulators"))
+
+from common import loopback  # noqa: E402
+from common.transport import TRANSPORTS, TRANSPORT_LOOPBACK, create_client  # noqa: E402
+from fleet import Fleet  # noqa: E402
+
+NS_TEMPLATE = "bench/room{n}"
+COMMANDS = [("light", "toggle"), ("fan", "toggle")]
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Controller:
+    """App side: sends commands and times the matching state echo.
+
+    Commands carry no request ID, so each device has at most one command
+    in flight and the next state message on its topic is the answer.
+    """
+
+    def __init__(self, client, namespaces, timeout):
+        self.client = client
+        self.timeout = timeout
+        self.ready = threading.Event()
+        self._lock = threading.Lock()
+        self._idle = deque(namespaces)
+        self._in_flight = {}  # state topic -> (send time, ns)
+        self._slots = threading.Condition(self._lock)
+        self._state_topics = {f"{ns}/device/state": ns for ns in namespaces}
+        self.latencies = []
+        self.timeouts = 0
+        self.first_send = None
+        self.last_done = None
+        client.on_connect = self.on_connect
+        client.on_message = self.on_message
+
+    def on_connect(self, client, userdata, flags, rc, properties=None):
+        client.subscribe([(topic, 1) for topic in self._state_topics])
+        self.ready.set()
+
+    def on_message(self, client, userdata, msg):
+        now = time.perf_counter()
+        if msg.retain:
+            return  # retained snapshot from subscribe time, not an echo
+        with self._lock:
+            pending = self._in_flight.pop(msg.topic, None)
+            if pending is None:
+                return
+            sent_at, ns = pending
+            self.latencies.append(now - sent_at)
+            self.last_done = now
+            self._idle.append(ns)
+            self._slots.notify()
+
+    def acquire(self, concurrency, deadline):
+        """Wait for a free device within the concurrency window"""
+        with self._lock:
+            while not self._idle or len(self._in_flight) >= concurrency:
+                self._expire()
+                if time.perf_counter() > deadline:
+                    return None
+                self._slots.wait(0.05)
+            return self._idle.popleft()
+
+    def send(self, ns, device, action):
+        topic = f"{ns}/device/state"
+        with self._lock:
+            now = time.perf_counter()
+            if self.first_send is None:
+                self.first_send = now
+            self._in_flight[topic] = (now, ns)
+        self.client.publish(f"{ns}/device/cmd", json.dumps({device: action}), qos=1)
+
+    def reset(self, deadline):
+        """Let warmup commands finish, then forget their results"""
+        self.drain(deadline)
+        with self._lock:
+            self.latencies.clear()
+            self.timeouts = 0
+            self.first_send = None
+            self.last_done = None
+
+    def drain(self, deadline):
+        with self._lock:
+            while self._in_flight and time.perf_counter() < deadline:
+                self._slots.wait(0.05)
+            self.timeouts += len(self._in_flight)
+            self._idle.extend(ns for _, ns in self._in_flight.values())
+            self._in_flight.clear()
+
+    def _expire(self):
+        now = time.perf_counter()
+        for topic, (sent_at, ns) in list(self._in_flight.items()):
+            if now - sent_at > self.timeout:
+                del self._in_flight[topic]
+                self._idle.append(ns)
+                self.timeouts += 1
+
+
+def run_scenario(args, rate, concurrency):
+    """One rate/concurrency point; returns a result dict"""
+    namespaces = [NS_TEMPLATE.format(n=n) for n in range(args.devices)]
+
+    # A fresh loopback broker per scenario so retained state does not leak
+    broker = loopback.LoopbackBroker() if args.transport == TRANSPORT_LOOPBACK else None
+
+    def client_factory(client_id):
+        return create_client(client_id, args.transport, broker=broker)
+
+    # Device side: sensors and heartbeats off so every state message is an echo
+    fleet = Fleet(args.broker, args.port, publish_interval=0, heartbeat_interval=0,
+                  status_interval=0, client_factory=client_factory)
+    for n, ns in enumerate(namespaces):
+        fleet.add_device(ns, f"bench_{n:04d}", "bench", verbose=False)
+    fleet_thread = threading.Thread(target=fleet.run, name="fleet", daemon=True)
+    fleet_thread.start()
+
+    controller = Controller(client_factory(f"bench_controller_{int(time.time())}"),
+                            namespaces, args.timeout)
+    controller.client.connect(args.broker, args.port, 60)
+    controller.client.loop_start()
+    deadline = time.monotonic() + 30
+    while not (controller.ready.is_set() and all(d.client.is_connected() for d in fleet.devices)):
+        if time.monotonic() > deadline:
+            raise SystemExit("❌ Devices did not connect within 30s")
+        time.sleep(0.05)
+    time.sleep(args.settle)
+
+    total = args.warmup + args.commands
+    commands = itertools.cycle(COMMANDS)
+    start = time.perf_counter()
+    stop_at = start + args.max_seconds
+    sent = 0
+    for i in range(total):
+        if i == args.warmup:
+            controller.reset(time.perf_counter() + args.timeout)
+        if rate:
+            wait = start + i / rate - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+        ns = controller.acquire(concurrency, stop_at)
+        if ns is None:
+            break
+        device, action = next(commands)
+        controller.send(ns, device, action)
+        sent += 1
+    controller.drain(time.perf_counter() + args.timeout)
+
+    controller.client.loop_stop()
+    controller.client.disconnect()
+    fleet.stop()
+    fleet_thread.join(5)
+
+    latencies = sorted(controller.latencies)
+    completed = len(latencies)
+    elapsed = (controller.last_done - controller.first_send) if completed else 0.0
+    to_ms = lambda v: round(v * 1000.0, 3) if v is not None else None  # noqa: E731
+    return {
+        "rate": rate,
+        "concurrency": concurrency,
+        "sent": max(0, sent - args.warmup),
+        "completed": completed,
+        "timeouts": controller.timeouts,
+        "elapsed_s": round(elapsed, 4),
+        "commands_per_s": round(completed / elapsed, 1) if elapsed > 0 else None,
+        "latency_ms": {
+            "p50": to_ms(percentile(latencies, 50)),
+            "p95": to_ms(percentile(latencies, 95)),
+            "p99": to_ms(percentile(latencies, 99)),
+            "max": to_ms(latencies[-1] if latencies else None),
+            "mean": to_ms(sum(latencies) / completed if completed else None),
+        },
+    }
+
+
+def print_results(results, baseline=None):
+    base = {}
+    if baseline:
+        base = {(r["rate"], r["concurrency"]): r for r in baseline.get("results", [])}
+
+    print(f"{'rate':>8}{'conc':>6}{'done':>8}{'lost':>6}{'cmd/s':>10}"
+          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    print("─" * 78)
+    for r in results:
+        lat = r["latency_ms"]
+        fmt = lambda v: f"{v:>10.3f}" if v is not None else f"{'-':>10}"  # noqa: E731
+        rate = r["rate"] or "max"
+        cps = r["commands_per_s"] or 0
+        print(f"{rate:>8}{r['concurrency']:>6}{r['completed']:>8}{r['timeouts']:>6}{cps:>10.1f}"
+              f"{fmt(lat['p50'])}{fmt(lat['p95'])}{fmt(lat['p99'])}{fmt(lat['max'])}")
+        prev = base.get((r["rate"], r["concurrency"]))
+        if prev and prev["latency_ms"]["p99"] and lat["p99"] and prev["commands_per_s"]:
+            d_p99 = (lat["p99"] / prev["latency_ms"]["p99"] - 1) * 100
+            d_cps = (cps / prev["commands_per_s"] - 1) * 100
+            print(f"{'':>14}vs baseline: p99 {d_p99:+.1f}%, cmd/s {d_cps:+.1f}%")
+
+
+def parse_list(text, cast):
+    return [cast(v) for v in text.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end command latency benchmark")
+    parser.add_argument("--transport", choices=TRANSPORTS, default=TRANSPORT_LOOPBACK,
+                        help="in-process loopback broker or a real (local) broker over tcp")
+    parser.add_argument("--broker", default="localhost", help="broker host for --transport tcp")
+    parser.add_argument("--port", type=int, default=1883, help="broker port for --transport tcp")
+    parser.add_argument("--devices", type=int, default=32, help="virtual devices to command")
+    parser.add_argument("--rates", default="0",
+                        help="comma list of target commands/s (0 = as fast as possible)")
+    parser.add_argument("--concurrency", default="1,8,32",
+                        help="comma list of max commands in flight (capped at --devices)")
+    parser.add_argument("--commands", type=int, default=2000, help="measured commands per scenario")
+    parser.add_argument("--warmup", type=int, default=100, help="unmeasured commands per scenario")
+    parser.add_argument("--timeout", type=float, default=5.0, help="seconds before a command counts as lost")
+    parser.add_argument("--max-seconds", type=float, default=120.0, help="cap per scenario")
+    parser.add_argument("--settle", type=float, default=0.2, help="pause after connect before sending")
+    parser.add_argument("--output", default=None, help="write JSON results to this file")
+    parser.add_argument("--baseline", default=None, help="JSON file from a previous run to compare with")
+    parser.add_argument("--label", default="", help="free-form label stored in the JSON")
+    args = parser.parse_args()
+
+    rates = parse_list(args.rates, float)
+    concurrencies = sorted({min(c, args.devices) for c in parse_list(args.concurrency, int)})
+
+    print("🚀 Command latency benchmark")
+    print(f"📡 Transport: {args.transport}"
+          + (f" ({args.broker}:{args.port})" if args.transport != TRANSPORT_LOOPBACK else ""))
+    print(f"🤖 Devices: {args.devices}, {args.commands} commands per scenario (+{args.warmup} warmup)")
+
+    results = []
+    for rate in rates:
+        for concurrency in concurrencies:
+            results.append(run_scenario(args, rate, concurrency))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.output:
+        report = {
+            "benchmark": "command_latency",
+            "label": args.label,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+CSV Sink Benchmark
+Compares rows/second of the legacy per-message open/append logger against
+the write-behind sink under each durability policy.
+
+The burst runs write every row as fast as possible, so the sink mostly
+measures buffering plus a flush at close. The paced runs feed --rate
+rows/second for --seconds (hundreds of flushes at the default settings)
+and report the steady-state cost per flush and per fsync, which is where
+the durability policies differ.
+"""
+
+import argparse
+import csv
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Data"))
+
+from csv_sink import WriteBehindCSVSink, DURABILITY_POLICIES  # noqa: E402
+
+
+def make_rows(count):
+    """Rows shaped like the ones server.py writes"""
+    return [["2025-10-30 20:31:22", 27.7 + (i % 10) / 10, 75.5, "unknown", "unknown"]
+            for i in range(count)]
+
+
+def bench_open_append(path, rows):
+    """Legacy behaviour: open, build a csv.writer, write one row, close"""
+    start = time.perf_counter()
+    for row in rows:
+        with open(path, mode='a', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(row)
+    return time.perf_counter() - start
+
+
+def bench_sink(path, rows, durability, flush_rows, flush_interval, fsync_interval):
+    """Write-behind sink; close() is timed so every row is on disk"""
+    start = time.perf_counter()
+    sink = WriteBehindCSVSink(path, flush_rows=flush_rows, flush_interval=flush_interval,
+                              durability=durability, fsync_interval=fsync_interval)
+    for row in rows:
+        sink.write(row)
+    sink.close()
+    return time.perf_counter() - start, sink
+
+
+def bench_paced(path, rows, rate, durability, flush_rows, flush_interval, fsync_interval):
+    """Feed rows at `rate` rows/second in 10 ms ticks; per-flush timings from a flush listener"""
+    sink = WriteBehindCSVSink(path, flush_rows=flush_rows, flush_interval=flush_interval,
+                              durability=durability, fsync_interval=fsync_interval)
+    flush_seconds = []
+    sink.add_flush_listener(lambda: flush_seconds.append(sink.last_flush_seconds))
+    tick = 0.01
+    per_tick = max(1, round(rate * tick))
+    write_seconds = 0.0
+    max_pending = 0
+    start = time.perf_counter()
+    for n, i in enumerate(range(0, len(rows), per_tick)):
+        delay = start + n * tick - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        began = time.perf_counter()
+        sink.write_rows(rows[i:i + per_tick])
+        write_seconds += time.perf_counter() - began
+        max_pending = max(max_pending, sink.pending())
+    sink.close()
+    return sink, flush_seconds, write_seconds, max_pending
+
+
+def count_lines(path):
+    with open(path, encoding='utf-8') as f:
+        return sum(1 for _ in f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=50_000, help="rows per run")
+    parser.add_argument("--flush-rows", type=int, default=500)
+    parser.add_argument("--flush-interval", type=float, default=1.0)
+    parser.add_argument("--fsync-interval", type=float, default=1.0)
+    parser.add_argument("--rate", type=int, default=20_000, help="rows/second of the paced runs")
+    parser.add_argument("--seconds", type=float, default=3.0, help="duration of each paced run")
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "legacy.csv")
+        elapsed = bench_open_append(path, rows)
+        assert count_lines(path) == args.rows
+        results.append(("open/append per message", elapsed, "-"))
+
+        for durability in DURABILITY_POLICIES:
+            path = os.path.join(tmp, f"sink_{durability}.csv")
+            elapsed, sink = bench_sink(path, rows, durability, args.flush_rows,
+                                       args.flush_interval, args.fsync_interval)
+            assert count_lines(path) == args.rows
+            results.append((f"write-behind ({durability})", elapsed,
+                            f"{sink.flush_count} flush / {sink.fsync_count} fsync"))
+
+        paced_rows = make_rows(int(args.rate * args.seconds))
+        paced = []
+        for durability in DURABILITY_POLICIES:
+            path = os.path.join(tmp, f"paced_{durability}.csv")
+            paced.append((durability,) + bench_paced(path, paced_rows, args.rate, durability, args.flush_rows,
+                                                     args.flush_interval, args.fsync_interval))
+            assert count_lines(path) == len(paced_rows)
+
+    baseline = results[0][1]
+    print(f"📊 {args.rows:,} rows per run")
+    print(f"{'method':<32}{'seconds':>10}{'rows/s':>14}{'speedup':>10}  notes")
+    print("─" * 82)
+    for name, elapsed, notes in results:
+        print(f"{name:<32}{elapsed:>10.3f}{args.rows / elapsed:>14,.0f}{baseline / elapsed:>9.1f}x  {notes}")
+
+    print()
+    print(f"⏱️ Paced: {len(paced_rows):,} rows at {args.rate:,}/s, flush every {args.flush_rows} rows "
+          f"or {args.flush_interval:g}s")
+    print(f"{'durability':<12}{'flushes':>9}{'fsyncs':>8}{'flush ms':>10}{'p95 ms':>9}"
+          f"{'fsync ms':>10}{'write() µs/row':>16}{'max pending':>13}")
+    print("─" * 87)
+    for durability, sink, flush_seconds, write_seconds, max_pending in paced:
+        p95 = statistics.quantiles(flush_seconds, n=20)[-1] if len(flush_seconds) > 1 else flush_seconds[0]
+        fsync_ms = f"{sink.fsync_seconds / sink.fsync_count * 1e3:.3f}" if sink.fsync_count else "-"
+        print(f"{durability:<12}{sink.flush_count:>9}{sink.fsync_count:>8}"
+              f"{statistics.mean(flush_seconds) * 1e3:>10.3f}{p95 * 1e3:>9.3f}{fsync_ms:>10}"
+              f"{write_seconds / len(paced_rows) * 1e6:>16.2f}{max_pending:>13,}")
+
+
+if __name__ == "__main__":
+    main()
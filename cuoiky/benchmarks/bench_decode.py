@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Payload Decode Benchmark
+Measures the per-message cost of turning a raw MQTT sensor payload into a
+Reading: the legacy `data.get(...) or data.get(...)` chain against the
+schema registry's compiled extractors, with the stdlib json parser and with
+orjson when it is installed, and the compact struct frame
+(common/payload.py) that is unpacked straight into a Reading.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Data"))
+
+import schemas  # noqa: E402
+from common.payload import ENCODING_STRUCT, encode_sensor, topic_for  # noqa: E402
+from records import Reading  # noqa: E402
+
+SIM_STATE = {"fw": "sim-1.0.0", "fan": "off", "light": "on"}
+ESP_STATE = {"fw": "luongfw-1.1.0", "fan": "on", "light": "off"}
+
+
+def make_messages(count, seed=0):
+    """(topic, payload, namespace, state) tuples, half simulator and half firmware shaped"""
+    rng = random.Random(seed)
+    messages = []
+    for i in range(count):
+        if i % 2:
+            payload = {"ts": i, "temp_c": round(rng.uniform(17, 28), 1),
+                       "hum_pct": round(rng.uniform(35, 75), 1), "lux": rng.randint(50, 300)}
+            messages.append(("sim/room1/sensor/state", json.dumps(payload).encode(), "sim/room1", SIM_STATE))
+        else:
+            payload = {"ts": i, "humidity": round(rng.uniform(35, 75), 1),
+                       "temp": round(rng.uniform(17, 28), 1), "light": None}
+            messages.append(("luong_iot/room1/sensor/data", json.dumps(payload).encode(), "luong_iot/room1", ESP_STATE))
+    return messages
+
+
+def make_frames(messages):
+    """The same samples as struct frames on the suffixed topics"""
+    frames = []
+    for topic, payload, namespace, state in messages:
+        data = json.loads(payload)
+        temp = data.get("temp_c", data.get("temp"))
+        hum = data.get("hum_pct", data.get("humidity"))
+        frame = encode_sensor(ENCODING_STRUCT, data["ts"], temp, hum, data.get("lux"))
+        frames.append((topic_for(topic, ENCODING_STRUCT), frame, namespace, state))
+    return frames
+
+
+def decode_legacy(topic, payload, namespace, state):
+    """The decode path server.py used before the schema registry"""
+    data = json.loads(payload.decode())
+    temp = data.get("temp") or data.get("temperature") or data.get("temp_c")
+    hum = data.get("humidity") or data.get("hum") or data.get("hum_pct")
+    device = data.get("device") or namespace
+    fan = data.get("fan") or state.get("fan", "unknown")
+    light = data.get("light") or state.get("light", "unknown")
+    return Reading(0.0, device, temp, hum, fan, light)
+
+
+def make_registry_decoder(loads):
+    registry = schemas.SchemaRegistry()
+
+    def decode(topic, payload, namespace, state):
+        found = registry.resolve(topic, state.get("fw"))
+        return found[1](loads(payload), 0.0, namespace, state)
+    return decode
+
+
+def decode_frame(topic, payload, namespace, state):
+    return schemas.decode_sensor_frame(payload, 0.0, namespace, state)
+
+
+def bench(decode, messages, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for topic, payload, namespace, state in messages:
+            decode(topic, payload, namespace, state)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=200_000, help="messages per run")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per decoder (best is reported)")
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages)
+    frames = make_frames(messages)
+    decoders = [("legacy or-chain + json", decode_legacy, messages),
+                ("registry + json", make_registry_decoder(schemas.json_loads), messages)]
+    if schemas.orjson is not None:
+        decoders.append(("registry + orjson", make_registry_decoder(schemas.orjson.loads), messages))
+    else:
+        print("(orjson not installed: skipping the orjson run)")
+    decoders.append(("struct frame", decode_frame, frames))
+
+    # The json and orjson backends must decode to identical records
+    reference = [decoders[1][1](*m) for m in messages[:1000]]
+    for _, decode, msgs in decoders[2:-1]:
+        assert [decode(*m) for m in msgs[:1000]] == reference
+
+    results = [(name, bench(decode, msgs, args.repeat)) for name, decode, msgs in decoders]
+    json_bytes = sum(len(m[1]) for m in messages) / len(messages)
+    frame_bytes = sum(len(m[1]) for m in frames) / len(frames)
+    print(f"📦 payload size: json {json_bytes:.1f} B, struct frame {frame_bytes:.1f} B")
+    baseline = results[0][1]
+    print(f"📊 {args.messages:,} messages per run, best of {args.repeat}")
+    print(f"{'decoder':<28}{'seconds':>10}{'ns/msg':>10}{'msg/s':>14}{'speedup':>10}")
+    print("─" * 72)
+    for name, elapsed in results:
+        print(f"{name:<28}{elapsed:>10.3f}{elapsed / args.messages * 1e9:>10.0f}"
+              f"{args.messages / elapsed:>14,.0f}{baseline / elapsed:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+SQLite Ingestion Benchmark
+Compares inserts/second of a naive logger that commits every reading (one
+transaction per row) against SQLiteSink, which writes each flush as one
+executemany transaction, under each durability policy. Also times the
+indexed read paths read_log.py uses: the latest N rows of one device and a
+one-minute range query.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Data"))
+
+from csv_sink import DURABILITY_POLICIES  # noqa: E402
+from records import Reading  # noqa: E402
+from sqlite_sink import INSERT, SCHEMA, SQLiteSink, _synchronous, iter_range, tail  # noqa: E402
+
+DEVICES = 8
+BASE_TS = 1_761_830_000.0
+
+
+def make_readings(count):
+    """Readings from DEVICES devices, one per second each"""
+    return [Reading(BASE_TS + i / DEVICES, f"luong_iot/room{i % DEVICES}", 27.7 + (i % 10) / 10,
+                    75.5, "off", "on") for i in range(count)]
+
+
+def bench_per_row_commit(path, readings, durability):
+    """One INSERT + COMMIT per reading, same pragmas and indexes as the sink"""
+    start = time.perf_counter()
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={_synchronous(durability)}")
+    conn.executescript(SCHEMA)
+    for r in readings:
+        conn.execute(INSERT, (r.ts, r.device, r.temp, r.hum, r.fan, r.light))
+        conn.commit()
+    conn.close()
+    return time.perf_counter() - start
+
+
+def bench_sink(path, readings, durability, flush_rows, flush_interval, fsync_interval):
+    """SQLiteSink; close() is timed so every row is committed"""
+    start = time.perf_counter()
+    sink = SQLiteSink(path, flush_rows=flush_rows, flush_interval=flush_interval,
+                      durability=durability, fsync_interval=fsync_interval)
+    for r in readings:
+        sink.write_reading(r)
+    sink.close()
+    return time.perf_counter() - start, sink
+
+
+def count_rows(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM readings").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def bench_queries(path, repeat):
+    """Best time of the latest-N and one-minute range queries"""
+    device = "luong_iot/room3"
+    mid = BASE_TS + count_rows(path) / DEVICES / 2
+    latest = rng = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = tail(path, 20, device)
+        latest = min(latest, time.perf_counter() - start)
+        assert len(rows) == 20
+        start = time.perf_counter()
+        rows = list(iter_range(path, mid, mid + 60, device))
+        rng = min(rng, time.perf_counter() - start)
+        assert len(rows) == 60
+    return latest, rng
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=20_000, help="rows per run")
+    parser.add_argument("--flush-rows", type=int, default=500)
+    parser.add_argument("--flush-interval", type=float, default=1.0)
+    parser.add_argument("--fsync-interval", type=float, default=1.0)
+    parser.add_argument("--query-repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    readings = make_readings(args.rows)
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for durability in DURABILITY_POLICIES:
+            path = os.path.join(tmp, f"per_row_{durability}.db")
+            elapsed = bench_per_row_commit(path, readings, durability)
+            assert count_rows(path) == args.rows
+            baseline = elapsed
+            results.append((f"commit per row ({durability})", elapsed, 1.0, f"{args.rows} commits"))
+
+            path = os.path.join(tmp, f"sink_{durability}.db")
+            elapsed, sink = bench_sink(path, readings, durability, args.flush_rows,
+                                       args.flush_interval, args.fsync_interval)
+            assert count_rows(path) == args.rows
+            results.append((f"batched sink ({durability})", elapsed, baseline / elapsed,
+                            f"{sink.flush_count} commits / {sink.fsync_count} fsync"))
+
+        latest, rng = bench_queries(path, args.query_repeat)
+
+    print(f"📊 {args.rows:,} rows per run, {DEVICES} devices (speedup vs. per-row commits, same durability)")
+    print(f"{'method':<32}{'seconds':>10}{'rows/s':>14}{'speedup':>10}  notes")
+    print("─" * 86)
+    for name, elapsed, speedup, notes in results:
+        print(f"{name:<32}{elapsed:>10.3f}{args.rows / elapsed:>14,.0f}{speedup:>9.1f}x  {notes}")
+    print(f"🔎 latest 20 rows of one device: {latest * 1e3:.2f} ms, "
+          f"one-minute range of one device: {rng * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Shared helpers used by the logger, the simulators, the tests and the benchmarks."""
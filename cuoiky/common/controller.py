@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Async Device Controller
+An asyncio API for sending device commands and awaiting their answers.
+
+Every command published on <ns>/device/cmd carries a correlation ID:
+
+    {"light": "toggle", "cid": "3f9a01c2-17"}
+
+and the device echoes the IDs it has applied in the "cids" list of its next
+<ns>/device/state (several when commands were coalesced into one publish).
+AsyncController.command() returns once the state naming its ID arrives,
+with that state document, or raises CommandTimeout. Up to `window`
+commands are in flight at once, across any number of devices, so bulk
+operations are pipelined instead of waiting for each echo in turn:
+
+    controller = AsyncController(create_client(), window=64)
+    await controller.connect(broker, port)
+    states = await controller.command_many([(ns, {"light": "off"}) for ns in rooms])
+
+Devices publishing the v1 struct state frame cannot echo IDs; commands to
+them always time out.
+"""
+
+import asyncio
+import itertools
+import json
+import threading
+import uuid
+
+CID_KEY = "cid"    # correlation ID in a command
+ACK_KEY = "cids"   # correlation IDs answered by a device/state message
+
+DEFAULT_WINDOW = 32
+DEFAULT_TIMEOUT = 5.0
+
+
+class CommandTimeout(TimeoutError):
+    """No device/state echoed the command's correlation ID in time"""
+
+    def __init__(self, namespace, cid, timeout):
+        super().__init__(f"no answer from {namespace} to command {cid} within {timeout}s")
+        self.namespace = namespace
+        self.cid = cid
+
+
+def make_command(values, cid):
+    """Command payload for {actuator: action, ...} tagged with a correlation ID"""
+    return json.dumps({**values, CID_KEY: cid})
+
+
+def acked_ids(state):
+    """Correlation IDs answered by a decoded device/state document"""
+    if not isinstance(state, dict):
+        return ()
+    return state.get(ACK_KEY) or ()
+
+
+class AsyncController:
+    """Correlated, windowed command sender on top of one MQTT client.
+
+    The MQTT client runs its own network thread (loop_start); answers are
+    handed to the asyncio loop that called connect().
+    """
+
+    def __init__(self, client, window=DEFAULT_WINDOW, timeout=DEFAULT_TIMEOUT, qos=1):
+        self.client = client
+        self.window = window
+        self.timeout = timeout
+        self.qos = qos
+        self.sent = 0
+        self.answered = 0
+        self.timeouts = 0
+        self.in_flight_high_watermark = 0
+        self._loop = None
+        self._slots = None
+        self._pending = {}  # cid -> (future, namespace)
+        self._subscribed = set()
+        self._lock = threading.Lock()
+        self._prefix = uuid.uuid4().hex[:8]
+        self._ids = itertools.count(1)
+        self._connected = None
+        client.on_connect = self._on_connect
+        client.on_message = self._on_message
+
+    # ---------- Lifecycle ----------
+
+    async def connect(self, broker, port, keepalive=60, timeout=10.0):
+        """Connect and start the client's network thread; returns once CONNACK arrived"""
+        self._loop = asyncio.get_running_loop()
+        self._slots = asyncio.Semaphore(self.window)
+        self._connected = asyncio.Event()
+        self.client.connect(broker, port, keepalive)
+        self.client.loop_start()
+        await asyncio.wait_for(self._connected.wait(), timeout)
+
+    def close(self):
+        """Fail every outstanding command and disconnect"""
+        for future, _ in list(self._pending.values()):
+            if not future.done():
+                future.cancel()
+        self._pending.clear()
+        self.client.loop_stop()
+        self.client.disconnect()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def in_flight(self):
+        return len(self._pending)
+
+    # ---------- Commands ----------
+
+    async def command(self, namespace, values, timeout=None):
+        """Send {actuator: action, ...} to one device; returns the state document that answered it"""
+        timeout = self.timeout if timeout is None else timeout
+        async with self._slots:
+            cid = f"{self._prefix}-{next(self._ids)}"
+            future = self._loop.create_future()
+            self._pending[cid] = (future, namespace)
+            self.in_flight_high_watermark = max(self.in_flight_high_watermark, len(self._pending))
+            try:
+                self._subscribe(namespace)
+                self.client.publish(f"{namespace}/device/cmd", make_command(values, cid), qos=self.qos)
+                self.sent += 1
+                return await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise CommandTimeout(namespace, cid, timeout) from None
+            finally:
+                self._pending.pop(cid, None)
+
+    async def command_many(self, commands, timeout=None, return_exceptions=True):
+        """Pipeline [(namespace, values), ...] through the in-flight window.
+
+        Results come back in input order; with return_exceptions a timed-out
+        command yields its CommandTimeout instead of aborting the batch.
+        """
+        return await asyncio.gather(*(self.command(ns, values, timeout) for ns, values in commands),
+                                    return_exceptions=return_exceptions)
+
+    # ---------- MQTT callbacks (client thread) ----------
+
+    def _subscribe(self, namespace):
+        # Subscribing before the first command is enough: the broker handles
+        # SUBSCRIBE before the PUBLISH that follows it on the same connection
+        with self._lock:
+            if namespace in self._subscribed:
+                return
+            self._subscribed.add(namespace)
+        self.client.subscribe(f"{namespace}/device/state", qos=1)
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        if rc != 0:
+            return
+        with self._lock:
+            topics = [(f"{ns}/device/state", 1) for ns in self._subscribed]
+        if topics:
+            client.subscribe(topics)  # restore after a reconnect
+        self._loop.call_soon_threadsafe(self._connected.set)
+
+    def _on_message(self, client, userdata, msg):
+        if msg.retain:
+            return  # snapshot from subscribe time, not an answer
+        try:
+            state = json.loads(msg.payload)
+        except ValueError:
+            return  # binary state frame: carries no correlation IDs
+        cids = acked_ids(state)
+        if cids:
+            self._loop.call_soon_threadsafe(self._resolve, cids, state)
+
+    def _resolve(self, cids, state):
+        for cid in cids:
+            pending = self._pending.get(cid)
+            if pending is not None and not pending[0].done():
+                pending[0].set_result(state)
+                self.answered += 1
@@ -0,0 +1,491 @@
+#!/usr/bin/env python3
+"""
+In-process Loopback MQTT Broker
+A stand-in for an MQTT broker that lives inside the current process.
+Client mimics the subset of paho.mqtt.client.Client used by this project,
+so the logger, the simulators, the tests and the benchmarks can all run
+offline in one process with zero network latency.
+
+Supported MQTT semantics:
+- topic filters with + and # (wildcards never match $-topics at level 0)
+- retained messages (an empty retained payload clears the topic)
+- QoS 0/1: QoS 1 messages for an offline client with a persistent session
+  (clean_session=False) are queued and delivered on reconnect; QoS 0
+  messages for offline clients are dropped
+- Last Will and Testament, published when a client goes away without a
+  DISCONNECT (abort(), client-id takeover)
+
+Messages are delivered synchronously on the publishing thread. Publishes
+made from inside a callback are queued and delivered once the current
+callback returns, so delivery never recurses.
+"""
+
+import collections
+import itertools
+import threading
+
+MQTT_ERR_SUCCESS = 0
+MQTT_ERR_NO_CONN = 4
+
+MAX_QUEUED_MESSAGES = 100  # per offline session, same default as infra/mosquitto.conf
+
+
+def topic_matches(sub, topic):
+    """True if topic matches the subscription filter (supports + and #)"""
+    sub_levels = sub.split("/")
+    topic_levels = topic.split("/")
+    if topic.startswith("$") and sub_levels[0] in ("+", "#"):
+        return False
+    for i, level in enumerate(sub_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels):
+            return False
+        if level != "+" and level != topic_levels[i]:
+            return False
+    return len(sub_levels) == len(topic_levels)
+
+
+def _to_bytes(payload):
+    if payload is None:
+        return b""
+    if isinstance(payload, bytes):
+        return payload
+    if isinstance(payload, (bytearray, memoryview)):
+        return bytes(payload)
+    return str(payload).encode("utf-8")
+
+
+class LoopbackMessage:
+    """Same attributes as paho's MQTTMessage"""
+    __slots__ = ("topic", "payload", "qos", "retain", "mid")
+
+    def __init__(self, topic, payload, qos=0, retain=False, mid=0):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.mid = mid
+
+
+class MessageInfo:
+    """Same interface as paho's MQTTMessageInfo"""
+
+    def __init__(self, mid, rc=MQTT_ERR_SUCCESS):
+        self.mid = mid
+        self.rc = rc
+
+    def is_published(self):
+        return self.rc == MQTT_ERR_SUCCESS
+
+    def wait_for_publish(self, timeout=None):
+        return None
+
+
+class _TrieNode:
+    __slots__ = ("children", "sessions")
+
+    def __init__(self):
+        self.children = {}
+        self.sessions = {}  # _Session -> granted qos
+
+
+class _SubscriptionTrie:
+    """Topic filter trie; matching costs O(topic levels), not O(subscriptions)"""
+
+    def __init__(self):
+        self.root = _TrieNode()
+
+    def add(self, topic_filter, session, qos):
+        node = self.root
+        for level in topic_filter.split("/"):
+            node = node.children.setdefault(level, _TrieNode())
+        node.sessions[session] = qos
+
+    def remove(self, topic_filter, session):
+        path = [self.root]
+        for level in topic_filter.split("/"):
+            node = path[-1].children.get(level)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].sessions.pop(session, None)
+        # Prune empty branches
+        levels = topic_filter.split("/")
+        for depth in range(len(levels), 0, -1):
+            node = path[depth]
+            if node.sessions or node.children:
+                break
+            del path[depth - 1].children[levels[depth - 1]]
+
+    def match(self, topic):
+        """{session: max granted qos} for every filter matching topic"""
+        levels = topic.split("/")
+        found = {}
+        dollar = topic.startswith("$")
+
+        def collect(sessions):
+            for session, qos in sessions.items():
+                if found.get(session, -1) < qos:
+                    found[session] = qos
+
+        stack = [(self.root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            wildcard_ok = not (dollar and depth == 0)
+            if wildcard_ok:
+                multi = node.children.get("#")
+                if multi is not None:
+                    collect(multi.sessions)
+            if depth == len(levels):
+                collect(node.sessions)
+                continue
+            exact = node.children.get(levels[depth])
+            if exact is not None:
+                stack.append((exact, depth + 1))
+            if wildcard_ok:
+                single = node.children.get("+")
+                if single is not None:
+                    stack.append((single, depth + 1))
+        return found
+
+
+class _Session:
+    """Broker-side state for one client id"""
+    __slots__ = ("client_id", "client", "clean", "subscriptions", "queue", "will")
+
+    def __init__(self, client_id, clean):
+        self.client_id = client_id
+        self.client = None
+        self.clean = clean
+        self.subscriptions = {}  # filter -> qos
+        self.queue = collections.deque()
+        self.will = None
+
+
+class LoopbackBroker:
+    """Routes publishes between Client instances of one process"""
+
+    def __init__(self, max_queued_messages=MAX_QUEUED_MESSAGES):
+        self.max_queued_messages = max_queued_messages
+        self._lock = threading.Lock()
+        self._trie = _SubscriptionTrie()
+        self._sessions = {}       # client id -> _Session
+        self._retained = {}       # topic -> LoopbackMessage
+        self._pending = collections.deque()
+        self._dispatching = False
+        self._mids = itertools.count(1)
+        self._anon_ids = itertools.count(1)
+        self.stats = collections.Counter()
+
+    # ---------- Connections ----------
+
+    def connect(self, client, clean_session, will):
+        """Attach client; returns True if a previous session was resumed"""
+        kicked = None
+        with self._lock:
+            client_id = client._client_id or f"loopback-anon-{next(self._anon_ids)}"
+            session = self._sessions.get(client_id)
+            if session is not None and session.client is not None and session.client is not client:
+                kicked = session.client  # client-id takeover, like a real broker
+                self._detach(session, graceful=False)
+                session = self._sessions.get(client_id)
+            if session is not None and clean_session:
+                self._drop_session(session)
+                session = None
+            present = session is not None
+            if session is None:
+                session = _Session(client_id, clean_session)
+                self._sessions[client_id] = session
+            session.client = client
+            session.will = will
+            client._session = session
+            while session.queue:
+                self._pending.append((client, session.queue.popleft()))
+        if kicked is not None:
+            kicked._on_broker_disconnect()
+        self._drain()
+        return present
+
+    def disconnect(self, client, graceful=True):
+        with self._lock:
+            session = client._session
+            if session is None or session.client is not client:
+                return
+            self._detach(session, graceful)
+        self._drain()
+
+    def _detach(self, session, graceful):
+        # Caller holds the lock
+        will = session.will
+        session.client = None
+        session.will = None
+        if session.clean:
+            self._drop_session(session)
+        if will is not None and not graceful:
+            self._route(*will)
+
+    def _drop_session(self, session):
+        for topic_filter in session.subscriptions:
+            self._trie.remove(topic_filter, session)
+        session.subscriptions.clear()
+        session.queue.clear()
+        self._sessions.pop(session.client_id, None)
+
+    def kill(self, client_id):
+        """Drop a client as if its network connection died (publishes its LWT)"""
+        with self._lock:
+            session = self._sessions.get(client_id)
+            client = session.client if session else None
+        if client is not None:
+            client.abort()
+
+    # ---------- Pub/Sub ----------
+
+    def subscribe(self, client, topic_filter, qos):
+        with self._lock:
+            session = client._session
+            session.subscriptions[topic_filter] = qos
+            self._trie.add(topic_filter, session, qos)
+            for msg in self._retained.values():
+                if topic_matches(topic_filter, msg.topic):
+                    self._pending.append((client, LoopbackMessage(
+                        msg.topic, msg.payload, min(qos, msg.qos), True, msg.mid)))
+        self._drain()
+
+    def unsubscribe(self, client, topic_filter):
+        with self._lock:
+            session = client._session
+            if session.subscriptions.pop(topic_filter, None) is not None:
+                self._trie.remove(topic_filter, session)
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        with self._lock:
+            mid = self._route(topic, _to_bytes(payload), qos, retain)
+        self._drain()
+        return mid
+
+    def _route(self, topic, payload, qos, retain):
+        # Caller holds the lock
+        mid = next(self._mids)
+        self.stats["received"] += 1
+        if retain:
+            if payload:
+                self._retained[topic] = LoopbackMessage(topic, payload, qos, True, mid)
+            else:
+                self._retained.pop(topic, None)
+        for session, granted in self._trie.match(topic).items():
+            msg = LoopbackMessage(topic, payload, min(qos, granted), False, mid)
+            if session.client is not None:
+                self._pending.append((session.client, msg))
+            else:
+                self._enqueue_offline(session, msg)
+        return mid
+
+    def _enqueue_offline(self, session, msg):
+        # Caller holds the lock; only QoS 1 survives while the client is away
+        if msg.qos < 1:
+            self.stats["dropped"] += 1
+        elif len(session.queue) >= self.max_queued_messages:
+            self.stats["dropped"] += 1
+        else:
+            session.queue.append(msg)
+            self.stats["queued"] += 1
+
+    def retained(self, topic):
+        """Current retained payload for topic, or None"""
+        with self._lock:
+            msg = self._retained.get(topic)
+            return msg.payload if msg else None
+
+    # ---------- Delivery ----------
+
+    def _drain(self):
+        with self._lock:
+            if self._dispatching:
+                return
+            self._dispatching = True
+        try:
+            while True:
+                with self._lock:
+                    if not self._pending:
+                        self._dispatching = False
+                        return
+                    client, msg = self._pending.popleft()
+                    session = client._session
+                    if session is None or session.client is not client:
+                        # Went offline after routing
+                        if session is not None and not session.clean:
+                            self._enqueue_offline(session, msg)
+                        else:
+                            self.stats["dropped"] += 1
+                        continue
+                    self.stats["delivered"] += 1
+                client._deliver(msg)
+        except BaseException:
+            with self._lock:
+                self._dispatching = False
+            raise
+
+
+_default_broker = None
+_default_lock = threading.Lock()
+
+
+def default_broker():
+    """Process-wide broker shared by every Client created without one"""
+    global _default_broker
+    with _default_lock:
+        if _default_broker is None:
+            _default_broker = LoopbackBroker()
+        return _default_broker
+
+
+class Client:
+    """Drop-in for the parts of paho.mqtt.client.Client this project uses.
+
+    Callbacks are invoked with the paho v1 signatures.
+    """
+
+    def __init__(self, client_id="", clean_session=True, userdata=None, broker=None, **kwargs):
+        self._client_id = client_id
+        self._clean_session = clean_session
+        self._userdata = userdata
+        self._broker = broker or default_broker()
+        self._session = None
+        self._will = None
+        self._connected = False
+        self._stopped = threading.Event()
+        self._mids = itertools.count(1)
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+        self.on_publish = None
+        self.on_subscribe = None
+
+    # ---------- Connection ----------
+
+    def connect(self, host=None, port=None, keepalive=60, *args, **kwargs):
+        self._stopped.clear()
+        present = self._broker.connect(self, self._clean_session, self._will)
+        self._connected = True
+        if self.on_connect:
+            self.on_connect(self, self._userdata, {"session present": int(present)}, 0)
+        return MQTT_ERR_SUCCESS
+
+    def reconnect(self):
+        return self.connect()
+
+    def disconnect(self, *args, **kwargs):
+        """Graceful disconnect: the will is discarded"""
+        if not self._connected:
+            return MQTT_ERR_NO_CONN
+        self._broker.disconnect(self, graceful=True)
+        self._closed(0)
+        return MQTT_ERR_SUCCESS
+
+    def abort(self):
+        """Close without DISCONNECT, as on a network failure: the broker publishes the will"""
+        if not self._connected:
+            return MQTT_ERR_NO_CONN
+        self._broker.disconnect(self, graceful=False)
+        self._closed(MQTT_ERR_NO_CONN)
+        return MQTT_ERR_SUCCESS
+
+    def _on_broker_disconnect(self):
+        # Session taken over by another client with the same id
+        if self._connected:
+            self._closed(MQTT_ERR_NO_CONN)
+
+    def _closed(self, rc):
+        self._connected = False
+        self._stopped.set()
+        if self.on_disconnect:
+            self.on_disconnect(self, self._userdata, rc)
+
+    def is_connected(self):
+        return self._connected
+
+    # ---------- Pub/Sub ----------
+
+    def subscribe(self, topic, qos=0, *args, **kwargs):
+        if not self._connected:
+            return MQTT_ERR_NO_CONN, None
+        topics = topic if isinstance(topic, list) else [(topic, qos)]
+        mid = next(self._mids)
+        for topic_filter, sub_qos in topics:
+            self._broker.subscribe(self, topic_filter, min(sub_qos, 1))
+        if self.on_subscribe:
+            self.on_subscribe(self, self._userdata, mid, [min(q, 1) for _, q in topics])
+        return MQTT_ERR_SUCCESS, mid
+
+    def unsubscribe(self, topic, *args, **kwargs):
+        if not self._connected:
+            return MQTT_ERR_NO_CONN, None
+        for topic_filter in (topic if isinstance(topic, list) else [topic]):
+            self._broker.unsubscribe(self, topic_filter)
+        return MQTT_ERR_SUCCESS, next(self._mids)
+
+    def publish(self, topic, payload=None, qos=0, retain=False, *args, **kwargs):
+        if not self._connected:
+            return MessageInfo(0, MQTT_ERR_NO_CONN)
+        mid = next(self._mids)
+        self._broker.publish(topic, payload, min(qos, 1), retain)
+        if self.on_publish:
+            self.on_publish(self, self._userdata, mid)
+        return MessageInfo(mid)
+
+    def _deliver(self, msg):
+        if self.on_message:
+            try:
+                self.on_message(self, self._userdata, msg)
+            except Exception as e:
+                # Same as a paho network thread: one bad callback must not break routing
+                print(f"❌ Loopback on_message error [{self._client_id}]: {e!r}")
+
+    # ---------- Config ----------
+
+    def will_set(self, topic, payload=None, qos=0, retain=False, *args, **kwargs):
+        self._will = (topic, _to_bytes(payload), min(qos, 1), retain)
+
+    def will_clear(self):
+        self._will = None
+
+    def user_data_set(self, userdata):
+        self._userdata = userdata
+
+    def username_pw_set(self, username, password=None):
+        pass
+
+    def tls_set(self, *args, **kwargs):
+        pass
+
+    # ---------- Network loop API (nothing to pump in-process) ----------
+
+    def loop_start(self):
+        return MQTT_ERR_SUCCESS
+
+    def loop_stop(self, *args, **kwargs):
+        return MQTT_ERR_SUCCESS
+
+    def loop_forever(self, *args, **kwargs):
+        self._stopped.wait()
+        return MQTT_ERR_SUCCESS
+
+    def loop(self, timeout=1.0, *args, **kwargs):
+        return MQTT_ERR_SUCCESS if self._connected else MQTT_ERR_NO_CONN
+
+    def loop_read(self, *args, **kwargs):
+        return self.loop()
+
+    def loop_write(self, *args, **kwargs):
+        return self.loop()
+
+    def loop_misc(self):
+        return self.loop()
+
+    def want_write(self):
+        return False
+
+    def socket(self):
+        return None
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Prometheus Metrics
+Minimal thread-safe metrics in the Prometheus text format, shared by the
+logger (Data/server.py, Data/shadow.py) and the simulators:
+
+- Counter: monotonically increasing count, optionally labelled (e.g. per topic channel).
+- Histogram: latency distribution over fixed buckets (_bucket, _sum and
+  _count, like the official Prometheus client).
+- Gauge: value read at scrape time through a function (queue depth, bytes
+  written, age of the last message per device, ...).
+
+start_http_server() serves GET /metrics with the standard library's
+http.server on a background thread:
+
+    curl http://127.0.0.1:9108/metrics
+"""
+
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Default buckets (seconds)
+DECODE_BUCKETS = (5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 5e-3, 0.01)
+WRITE_BUCKETS = (1e-4, 5e-4, 1e-3, 5e-3, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+class Counter:
+    """Monotonic counter: inc(*label_values, amount=1)"""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def inc_many(self, counts):
+        """Add a whole {label_values: count} dict under one lock"""
+        with self._lock:
+            for key, n in counts.items():
+                self._values[key] = self._values.get(key, 0) + n
+
+    def value(self, *label_values):
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name, _labels(self.labelnames, k), v) for k, v in items]
+
+
+class Gauge:
+    """Value computed at scrape time.
+
+    func() returns a number or, with labelnames, a list of (label_values, number)
+    pairs. kind="counter" exposes a count kept elsewhere (e.g. sink.flush_count).
+    """
+
+    def __init__(self, name, help_text, func, labelnames=(), kind="gauge"):
+        self.name = name
+        self.help = help_text
+        self.func = func
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+
+    def samples(self):
+        value = self.func()
+        if not self.labelnames:
+            return [] if value is None else [(self.name, "", value)]
+        return [(self.name, _labels(self.labelnames, k), v) for k, v in value]
+
+
+class Histogram:
+    """Distribution over `buckets` (ascending upper bounds, +Inf implied)"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=WRITE_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    def observe_many(self, values):
+        """Observe several values under one lock"""
+        buckets = self.buckets
+        idx = [bisect.bisect_left(buckets, v) for v in values]
+        with self._lock:
+            for i in idx:
+                self._counts[i] += 1
+            self._sum += sum(values)
+
+    @property
+    def count(self):
+        with self._lock:
+            return sum(self._counts)
+
+    def samples(self):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        out = []
+        cumulative = 0
+        for bound, n in zip((*self.buckets, float("inf")), counts):
+            cumulative += n
+            out.append((self.name + "_bucket", _labels(("le",), (_number(float(bound)),)), cumulative))
+        out.append((self.name + "_sum", "", total))
+        out.append((self.name + "_count", "", cumulative))
+        return out
+
+
+class MetricsRegistry:
+    """Set of metrics; render() returns the /metrics page"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self.register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, buckets=WRITE_BUCKETS):
+        return self.register(Histogram(name, help_text, buckets))
+
+    def gauge(self, name, help_text, func, labelnames=(), kind="gauge"):
+        return self.register(Gauge(name, help_text, func, labelnames, kind))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for m in metrics:
+            try:
+                samples = m.samples()
+            except Exception as e:  # one failing gauge must not break the page
+                lines.append(f"# {m.name}: read failed ({e})")
+                continue
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(f"{name}{labels} {_number(value)}" for name, labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+def start_http_server(registry, port, host="127.0.0.1"):
+    """Serve /metrics on a background thread; returns the server (shutdown() stops it)"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # no log line per scrape
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
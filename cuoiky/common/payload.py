@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Sensor / Device-State Payload Encodings
+JSON text is the default wire format. Two compact alternatives can be
+selected per device:
+
+- struct: a versioned fixed-layout frame. The first byte names the frame
+  type and version (0xF1 sensor v1, 0xF2 state v1, 0xF3 sensor batch v1),
+  so a receiver can tell it apart from JSON ('{', '[') and CBOR (a map or
+  array, 0x80-0xBF) without the topic.
+- cbor: the JSON document encoded as CBOR (needs the optional cbor2 package).
+
+A device may also micro-batch samples into one message on `<ns>/sensor/batch`:
+a JSON/CBOR array of sample objects (each with its own "ts", epoch seconds
+with millisecond precision) or a batch frame (0xF3).
+
+Binary payloads are published on the normal topic plus a suffix
+(`<ns>/sensor/state/bin`, `<ns>/device/state/cbor`), so JSON-only
+subscribers of `<ns>/sensor/state` never see bytes they cannot parse.
+
+Sensor frame v1 (12 bytes, little endian):
+    B header  B flags  I ts (epoch s)  h temp (0.01 °C)  H hum (0.01 %)  H lux
+Sensor batch frame v1 (12 bytes + 11 per sample):
+    B header  B reserved  H count  Q base ts (epoch ms)
+    then per sample: I offset from base (ms)  B flags  h temp  H hum  H lux
+State frame v1 (8 bytes + firmware):
+    B header  B flags  I ts (epoch s)  b rssi (dBm)  B fw length  fw (UTF-8)
+"""
+
+import json
+import struct
+
+try:
+    import cbor2
+except ImportError:  # optional: only needed for the cbor encoding
+    cbor2 = None
+
+ENCODING_JSON = "json"
+ENCODING_STRUCT = "struct"
+ENCODING_CBOR = "cbor"
+ENCODINGS = (ENCODING_JSON, ENCODING_STRUCT, ENCODING_CBOR)
+
+TOPIC_SUFFIXES = {ENCODING_JSON: "", ENCODING_STRUCT: "/bin", ENCODING_CBOR: "/cbor"}
+
+SENSOR_V1 = 0xF1
+STATE_V1 = 0xF2
+BATCH_V1 = 0xF3
+SENSOR_FRAME = struct.Struct("<BBIhHH")
+STATE_FRAME = struct.Struct("<BBIbB")
+BATCH_FRAME = struct.Struct("<BBHQ")
+BATCH_SAMPLE = struct.Struct("<IBhHH")
+MAX_BATCH = 65535
+
+# Flag bits
+HAS_TEMP = 0x01
+HAS_HUM = 0x02
+HAS_LUX = 0x04
+LIGHT_ON = 0x08
+FAN_ON = 0x10
+
+
+def require_encoding(encoding):
+    """Raise ValueError if `encoding` is unknown or its codec is not installed"""
+    if encoding not in ENCODINGS:
+        raise ValueError(f"unknown payload encoding: {encoding!r}")
+    if encoding == ENCODING_CBOR and cbor2 is None:
+        raise ValueError("the cbor encoding needs the cbor2 package (pip install cbor2)")
+
+
+def topic_for(topic, encoding):
+    """Topic a payload of this encoding is published on"""
+    return topic + TOPIC_SUFFIXES[encoding]
+
+
+def split_topic(topic):
+    """(base topic, encoding) from a possibly suffixed topic"""
+    if topic.endswith("/bin"):
+        return topic[:-4], ENCODING_STRUCT
+    if topic.endswith("/cbor"):
+        return topic[:-5], ENCODING_CBOR
+    return topic, ENCODING_JSON
+
+
+def payload_encoding(payload):
+    """Encoding of a payload judged by its first byte"""
+    if not payload:
+        return ENCODING_JSON
+    head = payload[0]
+    if head == SENSOR_V1 or head == STATE_V1 or head == BATCH_V1:
+        return ENCODING_STRUCT
+    if 0x80 <= head <= 0xBF:  # CBOR array or map
+        return ENCODING_CBOR
+    return ENCODING_JSON
+
+
+def _centi(value, signed):
+    if value is None:
+        return 0, False
+    n = int(round(value * 100))
+    lo, hi = (-32768, 32767) if signed else (0, 65535)
+    return min(max(n, lo), hi), True
+
+
+def _sample_flags(temp, hum, lux):
+    t, has_t = _centi(temp, True)
+    h, has_h = _centi(hum, False)
+    flags = (HAS_TEMP if has_t else 0) | (HAS_HUM if has_h else 0) | (HAS_LUX if lux is not None else 0)
+    return flags, t, h, min(max(int(lux or 0), 0), 65535)
+
+
+def encode_sensor(encoding, ts, temp, hum, lux=None):
+    """Sensor sample -> payload (str for JSON, bytes otherwise)"""
+    if encoding == ENCODING_STRUCT:
+        flags, t, h, lx = _sample_flags(temp, hum, lux)
+        return SENSOR_FRAME.pack(SENSOR_V1, flags, int(ts), t, h, lx)
+    data = {"ts": int(ts), "temp_c": temp, "hum_pct": hum, "lux": lux}
+    if encoding == ENCODING_CBOR:
+        return cbor2.dumps(data)
+    return json.dumps(data)
+
+
+def decode_sensor_frame(payload):
+    """Sensor frame v1 -> (ts, temp, hum, lux); missing values are None"""
+    _, flags, ts, t, h, lux = SENSOR_FRAME.unpack_from(payload)
+    return (ts,
+            t / 100 if flags & HAS_TEMP else None,
+            h / 100 if flags & HAS_HUM else None,
+            lux if flags & HAS_LUX else None)
+
+
+def encode_sensor_batch(encoding, samples):
+    """[(ts, temp, hum, lux), ...] -> one batch payload; ts keep millisecond precision"""
+    if len(samples) > MAX_BATCH:
+        raise ValueError(f"at most {MAX_BATCH} samples per batch")
+    if encoding == ENCODING_STRUCT:
+        base_ms = int(round(samples[0][0] * 1000)) if samples else 0
+        parts = [BATCH_FRAME.pack(BATCH_V1, 0, len(samples), base_ms)]
+        for ts, temp, hum, lux in samples:
+            flags, t, h, lx = _sample_flags(temp, hum, lux)
+            offset = min(max(int(round(ts * 1000)) - base_ms, 0), 0xFFFFFFFF)
+            parts.append(BATCH_SAMPLE.pack(offset, flags, t, h, lx))
+        return b"".join(parts)
+    data = [{"ts": round(ts, 3), "temp_c": temp, "hum_pct": hum, "lux": lux}
+            for ts, temp, hum, lux in samples]
+    if encoding == ENCODING_CBOR:
+        return cbor2.dumps(data)
+    return json.dumps(data)
+
+
+def iter_batch_frame(payload):
+    """Batch frame v1 -> (ts, flags, temp, hum, lux) per sample; temp/hum still in 0.01 units"""
+    _, _, count, base_ms = BATCH_FRAME.unpack_from(payload)
+    if BATCH_FRAME.size + count * BATCH_SAMPLE.size > len(payload):
+        raise ValueError(f"truncated batch frame ({len(payload)} bytes for {count} samples)")
+    for offset, flags, t, h, lux in BATCH_SAMPLE.iter_unpack(
+            memoryview(payload)[BATCH_FRAME.size:BATCH_FRAME.size + count * BATCH_SAMPLE.size]):
+        yield (base_ms + offset) / 1000, flags, t, h, lux
+
+
+def decode_sensor_batch_frame(payload):
+    """Batch frame v1 -> [(ts, temp, hum, lux), ...]; missing values are None"""
+    return [(ts,
+             t / 100 if flags & HAS_TEMP else None,
+             h / 100 if flags & HAS_HUM else None,
+             lux if flags & HAS_LUX else None)
+            for ts, flags, t, h, lux in iter_batch_frame(payload)]
+
+
+def encode_state(encoding, ts, light, fan, rssi, fw, extra=None):
+    """Device state -> payload (str for JSON, bytes otherwise)
+
+    `extra` holds further actuator values (JSON/CBOR only; the v1 frame
+    carries just light and fan).
+    """
+    if encoding == ENCODING_STRUCT:
+        fw_bytes = fw.encode("utf-8")[:255]
+        flags = (LIGHT_ON if light == "on" else 0) | (FAN_ON if fan == "on" else 0)
+        return STATE_FRAME.pack(STATE_V1, flags, int(ts), max(min(int(rssi), 127), -128), len(fw_bytes)) + fw_bytes
+    data = {"ts": int(ts), "light": light, "fan": fan, "rssi": rssi, "fw": fw}
+    if extra:
+        data.update(extra)
+    if encoding == ENCODING_CBOR:
+        return cbor2.dumps(data)
+    return json.dumps(data)
+
+
+def decode_state_frame(payload):
+    """State frame v1 -> (ts, light, fan, rssi, fw)"""
+    _, flags, ts, rssi, fw_len = STATE_FRAME.unpack_from(payload)
+    fw = bytes(payload[STATE_FRAME.size:STATE_FRAME.size + fw_len]).decode("utf-8", "replace")
+    return (ts, "on" if flags & LIGHT_ON else "off", "on" if flags & FAN_ON else "off", rssi, fw)
+
+
+def decode(payload):
+    """Any payload -> dict, or a list of dicts for a batch (convenience for tools;
+    the logger uses the frame decoders)"""
+    encoding = payload_encoding(payload)
+    if encoding == ENCODING_STRUCT:
+        if payload[0] == BATCH_V1:
+            return [{"ts": ts, "temp_c": temp, "hum_pct": hum, "lux": lux}
+                    for ts, temp, hum, lux in decode_sensor_batch_frame(payload)]
+        if payload[0] == SENSOR_V1:
+            ts, temp, hum, lux = decode_sensor_frame(payload)
+            return {"ts": ts, "temp_c": temp, "hum_pct": hum, "lux": lux}
+        ts, light, fan, rssi, fw = decode_state_frame(payload)
+        return {"ts": ts, "light": light, "fan": fan, "rssi": rssi, "fw": fw}
+    if encoding == ENCODING_CBOR:
+        require_encoding(ENCODING_CBOR)
+        return cbor2.loads(payload)
+    return json.loads(payload)
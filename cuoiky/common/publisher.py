@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Pooled MQTT Publisher
+A pool of persistent MQTT sessions for sending many messages (e.g. device
+commands) without a TCP + MQTT handshake per message. Each session runs
+its own network thread (loop_start) and keeps up to `max_inflight` QoS 1
+publishes outstanding; publish() blocks only when that window is full, and
+wait_all() returns once every PUBACK is in:
+
+    with PooledPublisher(sessions=4) as pool:
+        pool.connect(broker, port)
+        for ns in rooms:
+            pool.publish(f"{ns}/device/cmd", '{"light": "off"}')
+        pool.wait_all(timeout=10)
+
+Messages for the same topic always go through the same session, so MQTT's
+per-session ordering keeps a device's commands in order.
+"""
+
+import threading
+import time
+import zlib
+
+from common.transport import create_client
+
+MQTT_ERR_SUCCESS = 0
+MQTT_ERR_NO_CONN = 4  # paho queues QoS > 0 publishes made while reconnecting
+
+DEFAULT_SESSIONS = 4
+DEFAULT_MAX_INFLIGHT = 100
+
+
+class PublishError(RuntimeError):
+    """A session could not connect or a publish was rejected"""
+
+
+class _Session:
+    """One persistent client and its in-flight window"""
+
+    def __init__(self, client, max_inflight):
+        self.client = client
+        self.slots = threading.BoundedSemaphore(max_inflight)
+        self.connected = threading.Event()
+        self.rc = None
+
+
+class PooledPublisher:
+    """Publisher spreading topics over `sessions` persistent MQTT connections"""
+
+    def __init__(self, sessions=DEFAULT_SESSIONS, max_inflight=DEFAULT_MAX_INFLIGHT, qos=1,
+                 client_factory=create_client, client_id_prefix="publisher", keepalive=60):
+        self.qos = qos
+        self.keepalive = keepalive
+        self.published = 0
+        self.acked = 0
+        self.failed = 0
+        self.in_flight_high_watermark = 0
+        self._outstanding = 0
+        self._idle = threading.Condition()
+        stamp = int(time.time())
+        self._sessions = []
+        for n in range(sessions):
+            client = client_factory(f"{client_id_prefix}_{n}_{stamp}")
+            session = _Session(client, max_inflight)
+            if hasattr(client, "max_inflight_messages_set"):
+                client.max_inflight_messages_set(max_inflight)
+            client.on_connect = self._on_connect_for(session)
+            client.on_publish = self._on_publish_for(session)
+            self._sessions.append(session)
+
+    # ---------- Lifecycle ----------
+
+    def connect(self, broker, port, timeout=10.0):
+        """Connect every session and start its network thread; returns once all CONNACKs arrived"""
+        for session in self._sessions:
+            session.client.connect(broker, port, self.keepalive)
+            session.client.loop_start()
+        deadline = time.monotonic() + timeout
+        for n, session in enumerate(self._sessions):
+            if not session.connected.wait(max(0.0, deadline - time.monotonic())):
+                raise PublishError(f"session {n} did not connect within {timeout}s (rc={session.rc})")
+
+    def close(self, timeout=10.0):
+        """Wait for outstanding PUBACKs (up to timeout), then disconnect every session"""
+        self.wait_all(timeout)
+        for session in self._sessions:
+            session.client.disconnect()
+            session.client.loop_stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def sessions(self):
+        return len(self._sessions)
+
+    @property
+    def in_flight(self):
+        return self._outstanding
+
+    # ---------- Publishing ----------
+
+    def publish(self, topic, payload, qos=None, retain=False):
+        """Queue one message; blocks while its session already has max_inflight unacknowledged"""
+        qos = self.qos if qos is None else qos
+        session = self._sessions[zlib.crc32(topic.encode()) % len(self._sessions)]
+        session.slots.acquire()
+        with self._idle:
+            self.published += 1
+            self._outstanding += 1
+            self.in_flight_high_watermark = max(self.in_flight_high_watermark, self._outstanding)
+        # No lock of ours is held across client.publish(): paho runs on_publish on its
+        # network thread under its own mutex (the loopback client even runs it inside
+        # publish()), so the slot is released by whichever comes first
+        info = session.client.publish(topic, payload, qos=qos, retain=retain)
+        if not (info.rc == MQTT_ERR_SUCCESS or (info.rc == MQTT_ERR_NO_CONN and qos > 0)):
+            # Rejected outright: on_publish will not come, the slot is released now
+            self._done(session, failed=True)
+        return info
+
+    def publish_many(self, messages, rate=None):
+        """Publish (topic, payload) pairs, paced to at most `rate` messages/second; returns the count"""
+        interval = 1.0 / rate if rate else 0.0
+        next_at = time.monotonic()
+        count = 0
+        for topic, payload in messages:
+            if interval:
+                delay = next_at - time.monotonic()
+                if delay > 0.001:
+                    time.sleep(delay)
+                next_at += interval
+            self.publish(topic, payload)
+            count += 1
+        return count
+
+    def wait_all(self, timeout=None):
+        """Block until every publish so far is acknowledged; False on timeout"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._outstanding == 0, timeout)
+
+    # ---------- MQTT callbacks (session threads) ----------
+
+    def _on_connect_for(self, session):
+        def on_connect(client, userdata, flags, rc, properties=None):
+            session.rc = rc
+            if rc == 0:
+                session.connected.set()
+        return on_connect
+
+    def _on_publish_for(self, session):
+        def on_publish(client, userdata, mid, *args):
+            self._done(session)
+        return on_publish
+
+    def _done(self, session, failed=False):
+        session.slots.release()
+        with self._idle:
+            if failed:
+                self.failed += 1
+            else:
+                self.acked += 1
+            self._outstanding -= 1
+            if self._outstanding == 0:
+                self._idle.notify_all()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Pluggable MQTT Transport
+Every script gets its MQTT client from create_client(), so the same code
+runs against a real broker over TCP (paho-mqtt) or against the in-process
+loopback broker (common/loopback.py).
+
+The transport is chosen with --transport on the command line or the
+MQTT_TRANSPORT environment variable; the broker address the same way
+with --broker/--port or MQTT_BROKER/MQTT_PORT.
+"""
+
+import os
+
+from common import loopback
+
+TRANSPORT_TCP = "tcp"
+TRANSPORT_LOOPBACK = "loopback"
+TRANSPORTS = (TRANSPORT_TCP, TRANSPORT_LOOPBACK)
+
+
+def default_transport():
+    return os.environ.get("MQTT_TRANSPORT", TRANSPORT_TCP)
+
+
+def create_client(client_id="", transport=None, clean_session=True, broker=None):
+    """MQTT client for the selected transport.
+
+    Callbacks use the paho v1 signatures on both transports; paho-mqtt 2.x
+    is asked for its VERSION1 callback API.
+    ``broker`` selects a specific LoopbackBroker (default: the process-wide one).
+    """
+    transport = transport or default_transport()
+    if transport == TRANSPORT_LOOPBACK:
+        return loopback.Client(client_id, clean_session=clean_session, broker=broker)
+    if transport != TRANSPORT_TCP:
+        raise ValueError(f"Unknown MQTT transport: {transport!r} (expected one of {TRANSPORTS})")
+
+    import paho.mqtt.client as mqtt
+    try:
+        return mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION1,
+                           client_id=client_id, clean_session=clean_session)
+    except AttributeError:
+        # paho-mqtt 1.x
+        return mqtt.Client(client_id=client_id, clean_session=clean_session)
+
+
+def add_transport_args(parser, broker, port):
+    """Add --transport/--broker/--port with env-var overrides to an argparse parser"""
+    parser.add_argument("--transport", choices=TRANSPORTS, default=default_transport(),
+                        help="tcp: real MQTT broker, loopback: in-process broker (env MQTT_TRANSPORT)")
+    parser.add_argument("--broker", default=os.environ.get("MQTT_BROKER", broker),
+                        help="MQTT broker host (env MQTT_BROKER)")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("MQTT_PORT", port)),
+                        help="MQTT broker port (env MQTT_PORT)")
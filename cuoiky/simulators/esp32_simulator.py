@@ -1,15 +1,29 @@
 #!/usr/bin/env python3
 """
 ESP32 IoT Device Simulator
-Simulates an ESP32 device publishing sensor data and receiving commands via MQTT
+Simulates an ESP32 device publishing sensor data and receiving commands via MQTT.
+With --devices N it runs a fleet of N virtual devices in one process.
+Sensor values come from the NumPy signal model (signals.py) unless
+--signal random is given or NumPy is not installed. Samples taken during
+a broker outage are buffered (store_forward.py) and sent with their
+original timestamps after reconnecting; --metrics-port exposes the
+buffer counters in Prometheus format.
 """
 
-import json
-import time
-import random
-import threading
-from datetime import datetime
-import paho.mqtt.client as mqtt
+import argparse
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from common.metrics import MetricsRegistry, start_http_server  # noqa: E402
+from common.payload import ENCODINGS, require_encoding  # noqa: E402
+from common.transport import add_transport_args, create_client  # noqa: E402
+from fleet import Fleet  # noqa: E402
+from signals import SignalModel, np  # noqa: E402
+from store_forward import DEFAULT_SPILL_CAPACITY  # noqa: E402
+from virtual_device import ACTUATORS, make_actuators  # noqa: E402
 
 # Configuration
 MQTT_BROKER = "broker.hivemq.com"
@@ -18,211 +32,230 @@ TOPIC_NS = "demo/room1"
 DEVICE_ID = "esp32_simulator"
 FIRMWARE_VERSION = "sim-1.0.0"
 
-# Device state
-device_state = {
-    "light": "off",
-    "fan": "off", 
-    "online": True
-}
-
-# MQTT client
-client = mqtt.Client(client_id=f"{DEVICE_ID}_{int(time.time())}")
-
-def on_connect(client, userdata, flags, rc):
-    if rc == 0:
-        print(f"✅ Connected to MQTT broker: {MQTT_BROKER}")
-        
-        # Subscribe to command topic
-        cmd_topic = f"{TOPIC_NS}/device/cmd"
-        client.subscribe(cmd_topic, qos=1)
-        print(f"📡 Subscribed to: {cmd_topic}")
-        
-        # Publish initial online status
-        publish_online_status(True)
-        
-        # Publish initial device state
-        publish_device_state()
-        
-    else:
-        print(f"❌ Failed to connect to MQTT broker, code: {rc}")
+# Fleet defaults
+FLEET_NS_TEMPLATE = "fleet/room{n}"
+PUBLISH_INTERVAL = 3.0
+HEARTBEAT_INTERVAL = 15.0
 
-def on_message(client, userdata, msg):
-    try:
-        topic = msg.topic
-        payload = msg.payload.decode('utf-8')
-        print(f"📥 Received [{topic}]: {payload}")
-        
-        if topic == f"{TOPIC_NS}/device/cmd":
-            handle_device_command(payload)
-            
-    except Exception as e:
-        print(f"❌ Error handling message: {e}")
-
-def handle_device_command(payload):
-    """Handle device control commands"""
+# Command bursts: fold state changes arriving within this window into one
+# retained device/state, and publish state at most once per interval
+COALESCE_WINDOW = 0.05
+MIN_STATE_INTERVAL = 0.25
+
+# Report-by-exception: longest silence before a sample/state is sent anyway
+MAX_SILENCE = 60.0
+
+# Sensor signals: model = signals.SignalModel, random = uniform noise per sample
+SIGNAL_SOURCES = ("model", "random")
+
+# Store-and-forward: samples kept per device while offline, and how fast the
+# whole fleet replays them after reconnecting
+BACKLOG_CAPACITY = 1000
+FLUSH_RATE = 500.0
+FLUSH_BATCH = 200
+
+METRICS_HOST = "127.0.0.1"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="ESP32 IoT device simulator")
+    add_transport_args(parser, MQTT_BROKER, MQTT_PORT)
+    parser.add_argument("--devices", type=int, default=1,
+                        help="number of virtual devices to run in this process")
+    parser.add_argument("--interval", type=float, default=PUBLISH_INTERVAL,
+                        help="sensor publish interval in seconds")
+    parser.add_argument("--heartbeat", type=float, default=HEARTBEAT_INTERVAL,
+                        help="device state heartbeat interval in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="random +/- seconds added to every publish interval")
+    parser.add_argument("--ns-template", default=None,
+                        help=f"topic namespace per device, {{n}} is the device index "
+                             f"(default: {TOPIC_NS} for one device, {FLEET_NS_TEMPLATE} for a fleet)")
+    parser.add_argument("--connect-rate", type=float, default=200.0,
+                        help="max new broker connections per second")
+    parser.add_argument("--duration", type=float, default=None,
+                        help="stop after this many seconds (default: run until Ctrl+C)")
+    parser.add_argument("--encoding", default="json",
+                        help=f"payload encoding ({', '.join(ENCODINGS)}); a comma list is "
+                             f"assigned round-robin across devices, e.g. json,struct")
+    parser.add_argument("--batch-count", type=int, default=0,
+                        help="publish sensor samples in batches of this many (0 = no count limit)")
+    parser.add_argument("--batch-window", type=float, default=0.0,
+                        help="publish a sensor batch once its oldest sample is this many seconds old "
+                             "(with --batch-count 0 and --batch-window 0 every sample is its own message)")
+    parser.add_argument("--actuators", default=",".join(a.name for a in ACTUATORS),
+                        help="comma list of on/off actuators each device exposes to commands")
+    parser.add_argument("--coalesce-window", type=float, default=COALESCE_WINDOW,
+                        help="seconds to wait after a command for more before publishing the state")
+    parser.add_argument("--min-state-interval", type=float, default=MIN_STATE_INTERVAL,
+                        help="minimum seconds between command-driven state publishes "
+                             "(0 and --coalesce-window 0 = publish on every change)")
+    parser.add_argument("--deadband", default="",
+                        help="report by exception: publish a sample only when a metric moves more than "
+                             "its band, e.g. temp=0.2,hum=1 (default: publish every sample)")
+    parser.add_argument("--max-silence", type=float, default=MAX_SILENCE,
+                        help="with --deadband: publish a sample and the state at least this often (seconds)")
+    parser.add_argument("--signal", choices=SIGNAL_SOURCES, default="model",
+                        help="sensor values: correlated signal model with day/night cycle (needs NumPy) "
+                             "or independent uniform random samples")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed of the signal model; the same seed replays the same readings")
+    parser.add_argument("--dropout-rate", type=float, default=0.0,
+                        help="per-sample probability that a sensor goes down for a while (signal model)")
+    parser.add_argument("--anomaly-rate", type=float, default=0.0,
+                        help="per-sample probability of an injected spike (signal model)")
+    parser.add_argument("--backlog", type=int, default=BACKLOG_CAPACITY,
+                        help="samples each device buffers in memory while disconnected (0 = drop them)")
+    parser.add_argument("--spill-dir", default=None,
+                        help="directory for per-device spill files once the in-memory backlog is full")
+    parser.add_argument("--spill-capacity", type=int, default=DEFAULT_SPILL_CAPACITY,
+                        help="samples each device may spill to disk before the oldest are evicted")
+    parser.add_argument("--flush-rate", type=float, default=FLUSH_RATE,
+                        help="buffered samples per second the whole fleet sends after reconnecting (0 = unlimited)")
+    parser.add_argument("--flush-batch", type=int, default=FLUSH_BATCH,
+                        help="buffered samples per sensor/batch message")
+    parser.add_argument("--metrics-port", type=int, default=0,
+                        help="serve Prometheus metrics of the simulator on this port (0 = off)")
+    parser.add_argument("--verbose", action="store_true",
+                        help="print every publish and command (default for a single device)")
+    return parser.parse_args(argv)
+
+
+def parse_deadband(text):
+    """"temp=0.2,hum=1" -> {"temp": 0.2, "hum": 1.0}"""
+    deadband = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        metric, sep, band = item.partition("=")
+        if not sep or metric.strip() not in ("temp", "hum", "lux"):
+            raise ValueError(f"bad deadband {item!r} (expected temp=, hum= or lux=<band>)")
+        deadband[metric.strip()] = float(band)
+    return deadband
+
+
+def make_metrics(fleet):
+    """Prometheus view of the fleet's publish and store-and-forward counters"""
+    metrics = MetricsRegistry()
+    stat = lambda name: lambda: fleet.backlog_stats()[name]  # noqa: E731
+    metrics.gauge("sim_devices_connected", "Devices with a live broker connection",
+                  lambda: sum(1 for d in fleet.devices if d.client.is_connected()))
+    metrics.gauge("sim_samples_published_total", "Sensor samples published",
+                  lambda: sum(d.samples_published for d in fleet.devices), kind="counter")
+    metrics.gauge("sim_backlog_samples", "Samples waiting in store-and-forward buffers", stat("pending"))
+    metrics.gauge("sim_backlog_buffered_total", "Samples buffered while disconnected", stat("buffered"),
+                  kind="counter")
+    metrics.gauge("sim_backlog_flushed_total", "Buffered samples sent after reconnecting", stat("flushed"),
+                  kind="counter")
+    metrics.gauge("sim_backlog_evicted_total", "Buffered samples dropped because the buffer was full",
+                  stat("evicted"), kind="counter")
+    metrics.gauge("sim_backlog_spilled_total", "Buffered samples moved to the spill files", stat("spilled"),
+                  kind="counter")
+    return metrics
+
+
+def main(argv=None):
+    args = parse_args(argv)
     try:
-        cmd = json.loads(payload)
-        state_changed = False
-        
-        # Handle light command
-        if "light" in cmd:
-            light_cmd = cmd["light"]
-            if light_cmd == "on":
-                device_state["light"] = "on"
-                state_changed = True
-            elif light_cmd == "off":
-                device_state["light"] = "off"
-                state_changed = True
-            elif light_cmd == "toggle":
-                device_state["light"] = "off" if device_state["light"] == "on" else "on"
-                state_changed = True
-            
-            print(f"💡 Light: {device_state['light'].upper()}")
-        
-        # Handle fan command
-        if "fan" in cmd:
-            fan_cmd = cmd["fan"]
-            if fan_cmd == "on":
-                device_state["fan"] = "on"
-                state_changed = True
-            elif fan_cmd == "off":
-                device_state["fan"] = "off"
-                state_changed = True
-            elif fan_cmd == "toggle":
-                device_state["fan"] = "off" if device_state["fan"] == "on" else "on"
-                state_changed = True
-            
-            print(f"🌀 Fan: {device_state['fan'].upper()}")
-        
-        # Publish updated device state immediately
-        if state_changed:
-            publish_device_state()
-            
-    except json.JSONDecodeError as e:
-        print(f"❌ Invalid JSON command: {e}")
-
-def publish_sensor_data():
-    """Publish simulated sensor data"""
-    topic = f"{TOPIC_NS}/sensor/state"
-    
-    # Generate fake sensor readings
-    temp_c = round(20.0 + random.uniform(-3, 8), 1)  # 17-28°C
-    hum_pct = round(50.0 + random.uniform(-15, 25), 1)  # 35-75%
-    lux = random.randint(50, 300)  # 50-300 lux
-    
-    data = {
-        "ts": int(time.time()),
-        "temp_c": temp_c,
-        "hum_pct": hum_pct,
-        "lux": lux
-    }
-    
-    payload = json.dumps(data)
-    result = client.publish(topic, payload, qos=0)
-    
-    if result.rc == mqtt.MQTT_ERR_SUCCESS:
-        print(f"🌡️  Sensor: {temp_c}°C, {hum_pct}%, {lux}lux")
-    else:
-        print(f"❌ Failed to publish sensor data")
-
-def publish_device_state():
-    """Publish device state (retained)"""
-    topic = f"{TOPIC_NS}/device/state"
-    
-    # Simulate WiFi RSSI
-    rssi = random.randint(-70, -40)  # -70 to -40 dBm
-    
-    data = {
-        "ts": int(time.time()),
-        "light": device_state["light"],
-        "fan": device_state["fan"],
-        "rssi": rssi,
-        "fw": FIRMWARE_VERSION
-    }
-    
-    payload = json.dumps(data)
-    result = client.publish(topic, payload, qos=1, retain=True)
-    
-    if result.rc == mqtt.MQTT_ERR_SUCCESS:
-        print(f"📊 Device state: Light={device_state['light']}, Fan={device_state['fan']}, RSSI={rssi}dBm")
-    else:
-        print(f"❌ Failed to publish device state")
-
-def publish_online_status(online):
-    """Publish online status (retained)"""
-    topic = f"{TOPIC_NS}/sys/online"
-    
-    data = {"online": online}
-    payload = json.dumps(data)
-    result = client.publish(topic, payload, qos=1, retain=True)
-    
-    if result.rc == mqtt.MQTT_ERR_SUCCESS:
-        print(f"🟢 Online status: {online}")
-    else:
-        print(f"❌ Failed to publish online status")
-
-def sensor_publisher():
-    """Background thread to publish sensor data every 3 seconds"""
-    while True:
-        if client.is_connected():
-            publish_sensor_data()
-        time.sleep(3)
-
-def heartbeat_publisher():
-    """Background thread to publish device state every 15 seconds"""
-    while True:
-        if client.is_connected():
-            publish_device_state()
-        time.sleep(15)
-
-def main():
+        deadband = parse_deadband(args.deadband)
+    except ValueError as e:
+        raise SystemExit(f"❌ {e}")
+    encodings = [e.strip() for e in args.encoding.split(",") if e.strip()] or ["json"]
+    for encoding in encodings:
+        try:
+            require_encoding(encoding)
+        except ValueError as e:
+            raise SystemExit(f"❌ {e}")
+    actuators = make_actuators([a.strip() for a in args.actuators.split(",") if a.strip()])
+    single = args.devices == 1
+    ns_template = args.ns_template or (TOPIC_NS if single else FLEET_NS_TEMPLATE)
+    verbose = args.verbose or single
+
     print("🚀 ESP32 IoT Device Simulator Starting...")
-    print(f"📡 MQTT Broker: {MQTT_BROKER}:{MQTT_PORT}")
-    print(f"🏠 Topic Namespace: {TOPIC_NS}")
-    print(f"🆔 Device ID: {DEVICE_ID}")
+    print(f"📡 MQTT Broker: {args.broker}:{args.port}" if args.transport == "tcp"
+          else "📡 MQTT Broker: in-process loopback")
+    if single:
+        print(f"🏠 Topic Namespace: {ns_template.format(n=0)}")
+        print(f"🆔 Device ID: {DEVICE_ID}")
+    else:
+        print(f"🏠 Topic Namespaces: {ns_template} (n = 0..{args.devices - 1})")
+        print(f"🤖 Devices: {args.devices}, interval {args.interval}s ± {args.jitter}s")
+    if encodings != ["json"]:
+        print(f"📦 Payload encoding: {', '.join(encodings)}")
+    if deadband:
+        bands = ", ".join(f"{m} ±{b:g}" for m, b in deadband.items())
+        print(f"📉 Report by exception: {bands}, at least every {args.max_silence:g}s")
+    if args.batch_count or args.batch_window:
+        print(f"🧺 Sensor batches: up to {args.batch_count or '∞'} samples / {args.batch_window or '∞'}s "
+              f"on <ns>/sensor/batch")
+    signal_model = None
+    if args.signal == "model":
+        if np is None:
+            print("⚠️ NumPy not installed: falling back to --signal random")
+        else:
+            signal_model = SignalModel(args.devices, args.interval, seed=args.seed,
+                                       dropout_rate=args.dropout_rate, anomaly_rate=args.anomaly_rate)
+            print(f"📈 Signal model: seed {args.seed if args.seed is not None else 'random'}, "
+                  f"dropouts {args.dropout_rate:g}, anomalies {args.anomaly_rate:g} per sample")
+    if args.backlog:
+        print(f"📦 Store-and-forward: {args.backlog} samples per device"
+              f"{f', spilling to {args.spill_dir}' if args.spill_dir else ''}, "
+              f"replayed at {f'{args.flush_rate:g}/s' if args.flush_rate else 'full speed'}")
     print("─" * 50)
-    
-    # Setup MQTT callbacks
-    client.on_connect = on_connect
-    client.on_message = on_message
-    
-    # Set Last Will Testament
-    lwt_topic = f"{TOPIC_NS}/sys/online"
-    lwt_payload = json.dumps({"online": False})
-    client.will_set(lwt_topic, lwt_payload, qos=1, retain=True)
-    
+
+    fleet = Fleet(args.broker, args.port,
+                  publish_interval=args.interval,
+                  heartbeat_interval=args.heartbeat,
+                  jitter=args.jitter,
+                  connect_rate=args.connect_rate,
+                  status_interval=0 if single else 10.0,
+                  client_factory=lambda client_id: create_client(client_id, args.transport),
+                  signal_model=signal_model,
+                  backlog_capacity=args.backlog, spill_dir=args.spill_dir,
+                  spill_capacity=args.spill_capacity, flush_rate=args.flush_rate,
+                  flush_batch=args.flush_batch)
+    for n in range(args.devices):
+        device_id = DEVICE_ID if single else f"{DEVICE_ID}_{n:04d}"
+        fleet.add_device(ns_template.format(n=n), device_id, FIRMWARE_VERSION, verbose=verbose,
+                         encoding=encodings[n % len(encodings)],
+                         batch_count=args.batch_count, batch_window=args.batch_window,
+                         actuators=actuators, coalesce_window=args.coalesce_window,
+                         min_state_interval=args.min_state_interval,
+                         deadband=deadband, max_silence=args.max_silence)
+
+    metrics_server = None
+    if args.metrics_port:
+        try:
+            metrics_server = start_http_server(make_metrics(fleet), args.metrics_port, METRICS_HOST)
+            print(f"📈 Metrics: http://{METRICS_HOST}:{args.metrics_port}/metrics")
+        except OSError as e:
+            print(f"⚠️ Cannot open metrics port {args.metrics_port}: {e}")
+
+    print("✅ Simulator running! Press Ctrl+C to stop")
+    print("─" * 50)
+
     try:
-        # Connect to broker
-        print(f"🔄 Connecting to {MQTT_BROKER}...")
-        client.connect(MQTT_BROKER, MQTT_PORT, 60)
-        
-        # Start background threads
-        sensor_thread = threading.Thread(target=sensor_publisher, daemon=True)
-        heartbeat_thread = threading.Thread(target=heartbeat_publisher, daemon=True)
-        
-        sensor_thread.start()
-        heartbeat_thread.start()
-        
-        # Start MQTT loop
-        client.loop_start()
-        
-        print("✅ Simulator running! Press Ctrl+C to stop")
-        print("─" * 50)
-        
-        # Keep main thread alive
-        while True:
-            time.sleep(1)
-            
+        fleet.run(duration=args.duration)
     except KeyboardInterrupt:
         print("\n🛑 Shutting down simulator...")
-        
-        # Publish offline status
-        publish_online_status(False)
-        time.sleep(1)  # Wait for message to be sent
-        
-        client.loop_stop()
-        client.disconnect()
-        print("👋 Goodbye!")
+    if not single:
+        print(fleet.status_line())
+    else:
+        device = fleet.devices[0]
+        print(f"🎮 Commands: {device.commands_received} received, {device.commands_coalesced} coalesced, "
+              f"{device.state_published} state publishes")
+        if deadband:
+            print(f"📉 Samples: {device.samples_published} published, {device.samples_suppressed} in deadband")
+    if signal_model is not None and (signal_model.dropouts or signal_model.anomalies):
+        print(f"📈 Signal model: {signal_model.dropouts} sensor dropouts, {signal_model.anomalies} anomalies generated")
+    if args.backlog:
+        stats = fleet.backlog_stats()
+        print(f"📦 Backlog: {stats['buffered']} buffered, {stats['flushed']} flushed, "
+              f"{stats['evicted']} evicted, {stats['pending']} unsent"
+              f"{' (kept in the spill files)' if args.spill_dir and stats['pending'] else ''}")
+    if metrics_server is not None:
+        metrics_server.shutdown()
+        metrics_server.server_close()
+    print("👋 Goodbye!")
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
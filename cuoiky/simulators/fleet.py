@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Virtual Device Fleet
+Runs many VirtualDevice instances in one process on a single scheduler
+thread. Every device keeps its own MQTT connection; socket I/O for all of
+them is multiplexed through one selector and periodic work (sensor
+publishes, heartbeats, keepalive) is driven from one timer heap.
+
+With backlog_capacity > 0 every device buffers the samples it takes while
+disconnected (store_forward.py, optionally spilling to spill_dir) and
+flushes them after reconnecting. One token bucket of flush_rate samples/s
+is shared by the whole fleet, so a mass reconnect drains at a steady rate
+instead of hitting the logger with every backlog at once.
+"""
+
+import heapq
+import itertools
+import os
+import random
+import selectors
+import socket
+import sys
+import threading
+import time
+import paho.mqtt.client as mqtt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.transport import create_client  # noqa: E402
+from store_forward import DEFAULT_SPILL_CAPACITY, SampleBuffer, TokenBucket  # noqa: E402
+from virtual_device import ACTUATORS, VirtualDevice  # noqa: E402
+
+DRAIN_INTERVAL = 0.1  # seconds between backlog flush rounds
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def raise_fd_limit():
+    """Each paho client holds ~3 descriptors; lift the soft limit to the hard one"""
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            pass
+
+
+class Fleet:
+    """N virtual devices driven by one selector + timer loop"""
+
+    def __init__(self, broker, port, publish_interval=3.0, heartbeat_interval=15.0,
+                 jitter=0.0, keepalive=60, connect_rate=200.0, reconnect_delay=5.0,
+                 status_interval=10.0, client_factory=create_client, signal_model=None,
+                 backlog_capacity=0, spill_dir=None, spill_capacity=DEFAULT_SPILL_CAPACITY,
+                 flush_rate=500.0, flush_batch=200):
+        self.broker = broker
+        self.port = port
+        self.publish_interval = publish_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.jitter = jitter
+        self.keepalive = keepalive
+        self.connect_rate = connect_rate
+        self.reconnect_delay = reconnect_delay
+        self.status_interval = status_interval
+        self.client_factory = client_factory
+        self.signal_model = signal_model  # signals.SignalModel sized for every device, or None
+
+        # Store-and-forward (backlog_capacity 0 = off: samples taken offline are dropped)
+        self.backlog_capacity = backlog_capacity
+        self.spill_dir = spill_dir
+        self.spill_capacity = spill_capacity
+        self.flush_batch = flush_batch
+        self._flush_bucket = TokenBucket(flush_rate) if flush_rate else None
+        self._drain_from = 0  # device index the next flush round starts at (round-robin)
+
+        self.devices = []
+        self._tasks = []  # heap of (when, seq, fn, args)
+        self._tasks_lock = threading.Lock()
+        self._seq = itertools.count()
+        self._thread_id = None
+        self._sel = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._sel.register(self._wake_r, selectors.EVENT_READ, None)
+        self._pending_connect = set()
+        self._running = False
+        self._started_at = None
+        self.task_errors = 0  # scheduled tasks that raised
+
+    # ---------- Setup ----------
+
+    def add_device(self, topic_ns, device_id, firmware, verbose=False, encoding="json",
+                   batch_count=0, batch_window=0.0, actuators=ACTUATORS, coalesce_window=0.0,
+                   min_state_interval=0.0, deadband=None, max_silence=0.0):
+        """Create a device with its own client; returns the VirtualDevice"""
+        signals = self.signal_model.channel(len(self.devices)) if self.signal_model is not None else None
+        backlog = None
+        if self.backlog_capacity:
+            spill_path = None
+            if self.spill_dir:
+                os.makedirs(self.spill_dir, exist_ok=True)
+                spill_path = os.path.join(self.spill_dir, f"{device_id}.spill")
+            backlog = SampleBuffer(self.backlog_capacity, spill_path, self.spill_capacity)
+        client = self.client_factory(f"{device_id}_{int(time.time())}")
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_register_write
+        client.on_socket_unregister_write = self._on_socket_unregister_write
+
+        device = VirtualDevice(client, topic_ns, device_id, firmware, verbose=verbose,
+                               encoding=encoding, batch_count=batch_count,
+                               batch_window=batch_window, actuators=actuators,
+                               coalesce_window=coalesce_window,
+                               min_state_interval=min_state_interval, scheduler=self.call_later,
+                               deadband=deadband, max_silence=max_silence,
+                               sample_interval=self.publish_interval or None, signals=signals,
+                               backlog=backlog)
+        self.devices.append(device)
+        return device
+
+    def call_later(self, delay, fn, *args):
+        """Schedule fn(*args) on the fleet thread after delay seconds; safe from any thread"""
+        with self._tasks_lock:
+            heapq.heappush(self._tasks, (time.monotonic() + delay, next(self._seq), fn, args))
+        if self._thread_id is not None and threading.get_ident() != self._thread_id:
+            # e.g. a command delivered on the loopback broker's thread: wake the selector
+            try:
+                self._wake_w.send(b"x")
+            except OSError:
+                pass
+
+    # ---------- Socket callbacks (paho external loop API) ----------
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._sel.register(sock, selectors.EVENT_READ, client)
+
+    def _on_socket_close(self, client, userdata, sock):
+        try:
+            self._sel.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._sel.modify(sock, selectors.EVENT_READ | selectors.EVENT_WRITE, client)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        try:
+            self._sel.modify(sock, selectors.EVENT_READ, client)
+        except (KeyError, ValueError):
+            pass
+
+    # ---------- Periodic tasks ----------
+
+    def _next_delay(self, interval):
+        if self.jitter:
+            return max(0.0, interval + random.uniform(-self.jitter, self.jitter))
+        return interval
+
+    def _connect(self, device):
+        self._pending_connect.discard(device)
+        try:
+            device.client.connect(self.broker, self.port, self.keepalive)
+        except OSError as e:
+            print(f"❌ [{device.device_id}] Connect failed: {e}; retrying in {self.reconnect_delay}s")
+            self._pending_connect.add(device)
+            self.call_later(self.reconnect_delay, self._connect, device)
+
+    # Periodic tasks reschedule themselves before doing their work, so one that
+    # raises (see _run_due_tasks) still runs again next period
+
+    def _sensor_tick(self, device):
+        self.call_later(self._next_delay(self.publish_interval), self._sensor_tick, device)
+        if device.client.is_connected() or device.backlog is not None:
+            device.publish_sensor_data()
+
+    def _drain_backlogs(self):
+        # One flush round: devices take turns, each sends at most flush_batch
+        # samples. Samples a device took since reconnecting ride along for free
+        # (they are its live rate); only catching up on the outage draws on the
+        # shared flush_rate budget
+        self.call_later(DRAIN_INTERVAL, self._drain_backlogs)
+        n = len(self.devices)
+        starved = None
+        for i in range(n):
+            index = (self._drain_from + i) % n
+            device = self.devices[index]
+            if not device.backlog or not device.client.is_connected():
+                continue
+            wanted = min(len(device.backlog), self.flush_batch)
+            granted = min(device.backlog_credit, wanted)
+            if granted < wanted:
+                catch_up = wanted - granted
+                granted += self._flush_bucket.take(catch_up) if self._flush_bucket is not None else catch_up
+                if granted < wanted and starved is None:
+                    starved = index
+            if granted:
+                device.flush_backlog(granted)
+        # Next round starts with the first device that ran out of budget
+        self._drain_from = starved if starved is not None else (self._drain_from + 1) % max(n, 1)
+
+    def _heartbeat_tick(self, device):
+        self.call_later(self._next_delay(self.heartbeat_interval), self._heartbeat_tick, device)
+        if device.client.is_connected():
+            device.heartbeat()
+
+    def _housekeeping(self):
+        # Keepalive pings and dropped-connection detection for every client
+        self.call_later(1.0, self._housekeeping)
+        for device in self.devices:
+            if device in self._pending_connect:
+                continue
+            if device.client.loop_misc() == mqtt.MQTT_ERR_NO_CONN:
+                self._pending_connect.add(device)
+                self.call_later(self.reconnect_delay, self._connect, device)
+
+    def _status(self):
+        self.call_later(self.status_interval, self._status)
+        print(self.status_line())
+
+    def status_line(self):
+        connected = sum(1 for d in self.devices if d.client.is_connected())
+        sensors = sum(d.sensor_published for d in self.devices)
+        samples = sum(d.samples_published for d in self.devices)
+        states = sum(d.state_published for d in self.devices)
+        commands = sum(d.commands_received for d in self.devices)
+        coalesced = sum(d.commands_coalesced for d in self.devices)
+        suppressed = sum(d.samples_suppressed for d in self.devices)
+        dropped = sum(d.samples_dropped for d in self.devices)
+        elapsed = max(time.monotonic() - self._started_at, 1e-9)
+        line = (f"📈 {connected}/{len(self.devices)} connected | "
+                f"sensor msgs: {sensors} ({sensors / elapsed:.0f}/s, {samples} samples"
+                f"{f', {suppressed} in deadband' if suppressed else ''}"
+                f"{f', {dropped} lost to sensor dropouts' if dropped else ''}) | "
+                f"states: {states} | commands: {commands} ({coalesced} coalesced)")
+        if self.backlog_capacity:
+            stats = self.backlog_stats()
+            line += (f" | backlog: {stats['pending']} pending, {stats['buffered']} buffered, "
+                     f"{stats['flushed']} flushed, {stats['evicted']} evicted")
+        if self.task_errors:
+            line += f" | ⚠️ {self.task_errors} task errors"
+        return line
+
+    def backlog_stats(self):
+        """Store-and-forward totals over every device (all 0 when buffering is off)"""
+        backlogs = [d.backlog for d in self.devices if d.backlog is not None]
+        return {"pending": sum(len(b) for b in backlogs),
+                "buffered": sum(b.buffered for b in backlogs),
+                "flushed": sum(b.flushed for b in backlogs),
+                "evicted": sum(b.evicted for b in backlogs),
+                "spilled": sum(b.spilled for b in backlogs)}
+
+    # ---------- Event loop ----------
+
+    def run(self, duration=None):
+        """Run the fleet on the calling thread until stop() or duration elapses"""
+        raise_fd_limit()
+        self._thread_id = threading.get_ident()
+        self._running = True
+        self._started_at = time.monotonic()
+        deadline = self._started_at + duration if duration else None
+
+        # Stagger connects, then spread first publishes across one interval
+        # (an interval of 0 disables that publisher)
+        for i, device in enumerate(self.devices):
+            connect_at = i / self.connect_rate if self.connect_rate else 0.0
+            self._pending_connect.add(device)
+            self.call_later(connect_at, self._connect, device)
+            if self.publish_interval:
+                self.call_later(connect_at + random.uniform(0, self.publish_interval),
+                                self._sensor_tick, device)
+            if self.heartbeat_interval:
+                self.call_later(connect_at + random.uniform(0, self.heartbeat_interval),
+                                self._heartbeat_tick, device)
+        self.call_later(1.0, self._housekeeping)
+        if self.backlog_capacity:
+            self.call_later(DRAIN_INTERVAL, self._drain_backlogs)
+        if self.status_interval:
+            self.call_later(self.status_interval, self._status)
+
+        try:
+            while self._running:
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    break
+                timeout = 1.0
+                with self._tasks_lock:
+                    if self._tasks:
+                        timeout = min(timeout, max(0.0, self._tasks[0][0] - now))
+                self._poll(timeout)
+                self._run_due_tasks()
+        finally:
+            self.shutdown()
+
+    def _poll(self, timeout):
+        for key, mask in self._sel.select(timeout):
+            client = key.data
+            if client is None:
+                try:
+                    self._wake_r.recv(4096)
+                except BlockingIOError:
+                    pass
+                continue
+            if mask & selectors.EVENT_READ:
+                client.loop_read()
+            if mask & selectors.EVENT_WRITE:
+                client.loop_write()
+
+    def _run_due_tasks(self):
+        now = time.monotonic()
+        while True:
+            with self._tasks_lock:
+                if not self._tasks or self._tasks[0][0] > now:
+                    return
+                _, _, fn, args = heapq.heappop(self._tasks)
+            try:
+                fn(*args)
+            except Exception as e:
+                # A failing task (publish error, bad signal sample, ...) must not
+                # take the loop, and with it every other device, down
+                self.task_errors += 1
+                owner = next((a.device_id for a in args if hasattr(a, "device_id")), "fleet")
+                print(f"❌ [{owner}] {getattr(fn, '__name__', fn)} failed: {e!r}")
+
+    def stop(self):
+        """Ask the loop to exit; safe to call from any thread"""
+        self._running = False
+        try:
+            self._wake_w.send(b"x")
+        except OSError:
+            pass
+
+    def shutdown(self, timeout=2.0):
+        """Publish offline status, disconnect every device and flush sockets"""
+        self._running = False
+        with self._tasks_lock:
+            self._tasks.clear()
+        for device in self.devices:
+            if device.client.is_connected():
+                device.flush_sensor_batch()
+                device.publish_online_status(False)
+                device.client.disconnect()
+            if device.backlog is not None:
+                device.backlog.close()  # a spilled backlog is replayed by the next run
+
+        # Pump I/O until every DISCONNECT has been written
+        deadline = time.monotonic() + timeout
+        while len(self._sel.get_map()) > 1 and time.monotonic() < deadline:
+            self._poll(0.05)
@@ -4,10 +4,19 @@ Flutter App Simulator - IoT Device Controller
 Simulates the Flutter mobile app for controlling IoT devices
 """
 
+import argparse
 import json
+import os
+import sys
 import time
+import uuid
 import paho.mqtt.client as mqtt
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.controller import acked_ids, make_command  # noqa: E402
+from common.transport import TRANSPORT_LOOPBACK, add_transport_args, create_client  # noqa: E402
+
 # Configuration
 MQTT_BROKER = "broker.hivemq.com"
 MQTT_PORT = 1883
@@ -23,11 +32,14 @@ device_state = {
     "online": False
 }
 
-client = mqtt.Client(client_id=CLIENT_ID)
+client = None  # created in main() for the selected transport
+
+# Commands waiting for their state echo: correlation ID -> (device, action, send time)
+pending_commands = {}
 
-def on_connect(client, userdata, flags, rc):
+def on_connect(client, userdata, flags, rc, properties=None):
     if rc == 0:
-        print(f"✅ Connected to MQTT broker: {MQTT_BROKER}")
+        print("✅ Connected to MQTT broker")
         
         # Subscribe to device state and online status
         device_topic = f"{TOPIC_NS}/device/state"
@@ -64,6 +76,12 @@ def handle_device_state(payload):
         device_state["fan"] = data.get("fan", "unknown") 
         device_state["rssi"] = data.get("rssi", 0)
         device_state["fw"] = data.get("fw", "unknown")
+
+        for cid in acked_ids(data):
+            pending = pending_commands.pop(cid, None)
+            if pending is not None:
+                device, action, sent_at = pending
+                print(f"✅ Command {device} -> {action} confirmed in {(time.monotonic() - sent_at) * 1000:.0f} ms")
         
         print(f"📱 Device State Updated:")
         print(f"   💡 Light: {device_state['light'].upper()}")
@@ -93,15 +111,17 @@ def send_command(device, action):
         return False
     
     topic = f"{TOPIC_NS}/device/cmd"
-    command = {device: action}
-    payload = json.dumps(command)
+    cid = uuid.uuid4().hex[:12]
+    payload = make_command({device: action}, cid)
     
+    pending_commands[cid] = (device, action, time.monotonic())
     result = client.publish(topic, payload, qos=1)
     
     if result.rc == mqtt.MQTT_ERR_SUCCESS:
-        print(f"📤 Sent command: {device} -> {action}")
+        print(f"📤 Sent command: {device} -> {action} (id {cid})")
         return True
     else:
+        pending_commands.pop(cid, None)
         print(f"❌ Failed to send command")
         return False
 
@@ -131,20 +151,35 @@ def print_menu():
     print("q. Quit")
     print("-" * 50)
 
-def main():
+def main(argv=None):
+    global client
+    parser = argparse.ArgumentParser(description="Flutter app simulator (IoT device controller)")
+    add_transport_args(parser, MQTT_BROKER, MQTT_PORT)
+    args = parser.parse_args(argv)
+
     print("🚀 Flutter App Simulator Starting...")
-    print(f"📡 MQTT Broker: {MQTT_BROKER}:{MQTT_PORT}")
+    print(f"📡 MQTT Broker: {args.broker}:{args.port} ({args.transport})")
     print(f"🏠 Topic Namespace: {TOPIC_NS}")
     print(f"🆔 Client ID: {CLIENT_ID}")
     
+    if args.transport == TRANSPORT_LOOPBACK:
+        # No broker shared with other processes: run a simulated device here
+        import threading
+        from fleet import Fleet
+        fleet = Fleet(None, None, status_interval=0,
+                      client_factory=lambda client_id: create_client(client_id, args.transport))
+        fleet.add_device(TOPIC_NS, "esp32_simulator", "sim-1.0.0")
+        threading.Thread(target=fleet.run, daemon=True).start()
+
     # Setup MQTT callbacks
+    client = create_client(CLIENT_ID, args.transport)
     client.on_connect = on_connect
     client.on_message = on_message
     
     try:
         # Connect to broker
-        print(f"🔄 Connecting to {MQTT_BROKER}...")
-        client.connect(MQTT_BROKER, MQTT_PORT, 60)
+        print(f"🔄 Connecting to {args.broker}...")
+        client.connect(args.broker, args.port, 60)
         
         # Start MQTT loop in background
         client.loop_start()
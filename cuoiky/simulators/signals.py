@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Sensor Signal Model
+Generates realistic temperature / humidity / light readings for a whole
+fleet at once with NumPy, in blocks of `block` samples per device:
+
+- every device has its own offset from the metric's mean (room-to-room spread);
+- a day/night cycle follows the local time of each sample (temp peaks
+  mid-afternoon, humidity moves the other way, light is 0 at night);
+- around that, each metric does a mean-reverting random walk (AR(1) /
+  Ornstein-Uhlenbeck), so consecutive samples are correlated;
+- sensor dropouts: a device goes silent for a geometric number of samples
+  (mean `dropout_length`), starting with probability `dropout_rate` per sample;
+- anomalies: with probability `anomaly_rate` one sample carries a spike.
+
+Devices pull their next sample from the precomputed block (channel(i)), so
+the per-tick cost in the publisher is an array lookup. The same seed gives
+the same signals:
+
+    model = SignalModel(devices=5000, interval=3.0, seed=42, dropout_rate=1e-3)
+    next_sample = model.channel(17)
+    next_sample()  # -> (temp_c, hum_pct, lux) or None during a dropout
+"""
+
+import math
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import NamedTuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; devices fall back to uniform random samples
+    np = None
+
+DEFAULT_BLOCK = 256
+DROPOUT_LENGTH = 20
+MAX_BLOCKS = 4  # blocks kept for devices lagging behind; older rows are skipped
+
+
+class Metric(NamedTuple):
+    """One simulated sensor channel"""
+    name: str
+    mean: float
+    spread: float       # std of the per-device offset from mean
+    amplitude: float    # day/night swing (negative = lowest at peak_hour)
+    peak_hour: float    # local hour of the diurnal maximum
+    volatility: float   # stationary std of the random walk around the daily curve
+    reversion: float    # seconds for the walk to forget ~63% of a deviation
+    anomaly: float      # size of an injected spike
+    low: float
+    high: float
+    decimals: int
+
+
+METRICS = (
+    Metric("temp", 23.0, 1.5, 3.0, 15.0, 0.4, 600.0, 8.0, -10.0, 50.0, 1),
+    Metric("hum", 55.0, 5.0, -8.0, 15.0, 2.0, 900.0, 25.0, 0.0, 100.0, 1),
+    Metric("lux", 120.0, 30.0, 150.0, 13.0, 15.0, 300.0, 400.0, 0.0, 2000.0, 0),
+)
+
+
+def _utc_offset():
+    return datetime.now().astimezone().utcoffset().total_seconds()
+
+
+class SignalModel:
+    """Block-generated signals for `devices` sensors sampled every `interval` seconds"""
+
+    def __init__(self, devices, interval=3.0, seed=None, block=DEFAULT_BLOCK, start=None,
+                 metrics=METRICS, dropout_rate=0.0, dropout_length=DROPOUT_LENGTH, anomaly_rate=0.0):
+        if np is None:
+            raise RuntimeError("SignalModel needs NumPy (pip install numpy)")
+        self.devices = devices
+        self.interval = interval or 1.0
+        self.block = block
+        self.start = time.time() if start is None else start
+        self.metrics = tuple(metrics)
+        self.dropout_rate = dropout_rate
+        self.dropout_length = dropout_length
+        self.anomaly_rate = anomaly_rate
+        self.rng = np.random.default_rng(seed)
+
+        column = lambda field: np.array([getattr(m, field) for m in self.metrics], dtype=float)  # noqa: E731
+        self._mean = column("mean")
+        self._amplitude = column("amplitude")
+        self._peak_hour = column("peak_hour")
+        self._volatility = column("volatility")
+        self._anomaly = column("anomaly")
+        self._low = column("low")
+        self._high = column("high")
+        # AR(1) coefficient per sample and the innovation std that keeps the walk's
+        # stationary std at `volatility`
+        self._decay = np.exp(-self.interval / column("reversion"))
+        self._innovation = self._volatility * np.sqrt(1.0 - self._decay ** 2)
+
+        shape = (devices, len(self.metrics))
+        self._offset = self.rng.normal(0.0, 1.0, shape) * column("spread")
+        self._walk = self.rng.normal(0.0, 1.0, shape) * self._volatility
+        self._down = np.zeros(devices, dtype=np.int64)  # samples left in each device's dropout
+        self._utc_offset = _utc_offset()
+
+        self._blocks = deque()  # (first row, end row, values[rows, devices, metrics]), oldest first
+        self._current = [None] * devices  # per device: (samples, first row, end row) of the block it reads
+        self._next_row = 0
+        self._cursor = [0] * devices
+        self._lock = threading.Lock()
+
+        self.rows_generated = 0
+        self.dropouts = 0
+        self.anomalies = 0
+
+    # ---------- Block generation ----------
+
+    def generate_block(self, rows):
+        """Advance the model by `rows` samples for every device.
+
+        Returns a float array [rows, devices, metrics], rounded and clipped;
+        a row is NaN for a device in dropout.
+        """
+        rng = self.rng
+        k = len(self.metrics)
+        steps = np.arange(self._next_row, self._next_row + rows)
+        self._next_row += rows
+        self.rows_generated += rows
+
+        # Day/night: local hour of each sample row
+        hours = ((self.start + steps * self.interval + self._utc_offset) % 86400.0) / 3600.0
+        diurnal = np.cos(2 * math.pi * (hours[:, None] - self._peak_hour) / 24.0) * self._amplitude
+
+        # Mean-reverting walk: the recurrence runs over rows, vectorized over devices x metrics
+        noise = rng.standard_normal((rows, self.devices, k)) * self._innovation
+        walk = np.empty_like(noise)
+        x = self._walk
+        for r in range(rows):
+            x = self._decay * x + noise[r]
+            walk[r] = x
+        self._walk = x
+
+        values = self._mean + self._offset + diurnal[:, None, :] + walk
+
+        if self.anomaly_rate:
+            spikes = rng.random((rows, self.devices)) < self.anomaly_rate
+            count = int(spikes.sum())
+            if count:
+                signs = rng.choice((-1.0, 1.0), size=(count, 1))
+                values[spikes] += signs * self._anomaly
+                self.anomalies += count
+
+        np.clip(values, self._low, self._high, out=values)
+        for j, metric in enumerate(self.metrics):
+            values[..., j] = np.round(values[..., j], metric.decimals)
+
+        if self.dropout_rate:
+            starts = rng.random((rows, self.devices)) < self.dropout_rate
+            lengths = rng.geometric(1.0 / max(self.dropout_length, 1), (rows, self.devices))
+            down = self._down
+            silent = np.empty((rows, self.devices), dtype=bool)
+            for r in range(rows):
+                begin = (down == 0) & starts[r]
+                down = np.where(down > 0, down - 1, np.where(begin, lengths[r], 0))
+                silent[r] = down > 0
+                self.dropouts += int(begin.sum())
+            self._down = down
+            values[silent] = np.nan
+        return values
+
+    # ---------- Per-device consumption ----------
+
+    def next_sample(self, device):
+        """Next (temp, hum, lux) for device index `device`, or None while its sensor is down"""
+        with self._lock:
+            row = self._cursor[device]
+            self._cursor[device] = row + 1
+            current = self._current[device]
+            if current is None or not current[1] <= row < current[2]:
+                current = self._current[device] = self._load(device, row)
+                if row < current[1]:
+                    # Device stopped sampling (e.g. disconnected) while the others moved on
+                    row = current[1]
+                    self._cursor[device] = row + 1
+        sample = current[0][row - current[1]]
+        return None if sample[0] != sample[0] else sample  # NaN: sensor down
+
+    def _load(self, device, row):
+        # Slow path, once per block and device: generate blocks up to `row` and
+        # convert the device's column to Python tuples (indexing NumPy scalars
+        # per sample would cost more than generating the block)
+        while row >= self._next_row:
+            first = self._next_row
+            self._blocks.append((first, first + self.block, self.generate_block(self.block)))
+            self._drop_consumed()
+        for first, end, values in self._blocks:
+            if row < end:
+                break
+        columns = []
+        for j, metric in enumerate(self.metrics):
+            column = values[:, device, j]
+            if metric.decimals == 0:
+                column = np.nan_to_num(column, nan=-1).astype(np.int64)
+            columns.append(column.tolist())
+        return list(zip(*columns)), first, end
+
+    def channel(self, device):
+        """Callable returning the next sample of one device (VirtualDevice(signals=...))"""
+        if not 0 <= device < self.devices:
+            raise IndexError(f"device index {device} outside 0..{self.devices - 1}")
+        return lambda: self.next_sample(device)
+
+    def _drop_consumed(self):
+        # Keep every block some device still has to read (devices drift apart with
+        # jitter), up to MAX_BLOCKS
+        oldest = min(self._cursor)
+        while len(self._blocks) > 1 and (self._blocks[0][1] <= oldest or len(self._blocks) > MAX_BLOCKS):
+            self._blocks.popleft()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Store-and-Forward Sample Buffer
+Holds a device's sensor samples while it cannot reach the broker, so an
+outage delays data instead of losing it. Samples keep the timestamp they
+were taken with and are sent later as sensor/batch messages.
+
+The buffer is bounded: `capacity` samples stay in memory; with a spill
+file, older samples move to disk (up to `spill_capacity` more) instead of
+being evicted. Once both are full the oldest samples are evicted and
+counted. Samples always come out in the order they went in (disk first).
+
+The spill file starts with the count of records already drained, updated
+on every drop(), so a run that crashes (no close()) resumes after the last
+dropped batch; only a batch published but not yet dropped is sent again,
+which QoS 1 delivery allows anyway. The drained prefix is compacted away
+once it reaches half of `spill_capacity`:
+
+    buffer = SampleBuffer(capacity=1000, spill_path="/tmp/room1.spill")
+    buffer.append((ts, temp, hum, lux))
+    samples = buffer.peek(500)   # publish them, then
+    buffer.drop(len(samples))
+"""
+
+import itertools
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+DEFAULT_CAPACITY = 1000
+DEFAULT_SPILL_CAPACITY = 100_000
+
+SPILL_HEADER = struct.Struct("<Q")     # records drained from the start of the file
+SPILL_RECORD = struct.Struct("<dffi")  # ts, temp, hum, lux (-1 = none)
+
+
+def _pack(sample):
+    ts, temp, hum, lux = sample
+    return SPILL_RECORD.pack(ts, temp, hum, -1 if lux is None else lux)
+
+
+def _unpack(data):
+    # float32 on disk: round back to the 0.1 resolution the device reports
+    return [(ts, round(temp, 1), round(hum, 1), None if lux < 0 else lux)
+            for ts, temp, hum, lux in SPILL_RECORD.iter_unpack(data)]
+
+
+class SampleBuffer:
+    """Bounded FIFO of (ts, temp, hum, lux) samples, in memory with an optional disk spill"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, spill_path=None, spill_capacity=DEFAULT_SPILL_CAPACITY):
+        self.capacity = capacity
+        self.spill_path = spill_path
+        self.spill_capacity = spill_capacity if spill_path else 0
+        self._memory = deque()
+        self._lock = threading.Lock()
+        self._spill = None
+        self._spill_head = 0  # records already drained from the start of the spill file
+        self._spill_count = 0
+        if spill_path:
+            # Leftovers of an earlier run are replayed like any other backlog
+            self._spill = open(spill_path, "r+b" if os.path.exists(spill_path) else "w+b")
+            header = self._spill.read(SPILL_HEADER.size)
+            records = max(0, os.path.getsize(spill_path) - SPILL_HEADER.size) // SPILL_RECORD.size
+            if len(header) == SPILL_HEADER.size:
+                self._spill_head = min(SPILL_HEADER.unpack(header)[0], records)
+            else:
+                self._save_head()
+            self._spill_count = records - self._spill_head
+
+        # Counters
+        self.buffered = 0   # samples appended
+        self.flushed = 0    # samples dropped after a successful publish
+        self.evicted = 0    # samples lost because the buffer was full
+        self.spilled = 0    # samples moved from memory to disk
+        self.high_watermark = 0
+
+    def __len__(self):
+        return len(self._memory) + self._spill_count
+
+    def append(self, sample):
+        with self._lock:
+            self._memory.append(sample)
+            self.buffered += 1
+            if len(self._memory) > self.capacity:
+                self._overflow()
+            self.high_watermark = max(self.high_watermark, len(self))
+
+    def _overflow(self):
+        if self._spill is None:
+            self._memory.popleft()
+            self.evicted += 1
+            return
+        # Move the older half of memory to disk in one write
+        count = max(1, len(self._memory) // 2)
+        records = b"".join(_pack(self._memory.popleft()) for _ in range(count))
+        self._append_spill(records)
+        self._spill_count += count
+        self.spilled += count
+        excess = self._spill_count - self.spill_capacity
+        if excess > 0:
+            # Spill full too: forget the oldest records on disk
+            self._spill_head += excess
+            self._spill_count -= excess
+            self.evicted += excess
+            self._spill_drained()
+
+    def _append_spill(self, records):
+        # Whole records only: a partial one left by a crash is overwritten
+        self._spill.seek(SPILL_HEADER.size + (self._spill_head + self._spill_count) * SPILL_RECORD.size)
+        self._spill.write(records)
+        self._spill.truncate()
+        self._spill.flush()
+
+    def _spill_drained(self):
+        # Records at the head were dropped or evicted: compact once they make up
+        # half the spill capacity, otherwise just record the new head
+        if self._spill_head >= max(1, self.spill_capacity // 2):
+            self._compact()
+        else:
+            self._save_head()
+
+    def _save_head(self):
+        self._spill.seek(0)
+        self._spill.write(SPILL_HEADER.pack(self._spill_head))
+        self._spill.flush()
+
+    def _compact(self):
+        # Rewrite the spill file without the records already drained or evicted
+        self._spill.seek(SPILL_HEADER.size + self._spill_head * SPILL_RECORD.size)
+        rest = self._spill.read(self._spill_count * SPILL_RECORD.size)
+        self._spill.seek(0)
+        self._spill.truncate(0)
+        self._spill.write(SPILL_HEADER.pack(0))
+        self._spill.write(rest)
+        self._spill.flush()
+        self._spill_head = 0
+
+    def peek(self, n):
+        """Up to n oldest samples, without removing them"""
+        with self._lock:
+            samples = []
+            if self._spill_count:
+                count = min(n, self._spill_count)
+                self._spill.seek(SPILL_HEADER.size + self._spill_head * SPILL_RECORD.size)
+                samples = _unpack(self._spill.read(count * SPILL_RECORD.size))
+            if len(samples) < n:
+                samples.extend(itertools.islice(self._memory, n - len(samples)))
+            return samples
+
+    def drop(self, n):
+        """Remove the n oldest samples (after peek(n) was published)"""
+        with self._lock:
+            n = min(n, len(self))
+            self.flushed += n
+            from_spill = min(n, self._spill_count)
+            if from_spill:
+                self._spill_head += from_spill
+                self._spill_count -= from_spill
+                if not self._spill_count:
+                    self._spill_head = 0
+                    self._spill.truncate(SPILL_HEADER.size)
+                    self._save_head()
+                else:
+                    self._spill_drained()
+            for _ in range(n - from_spill):
+                self._memory.popleft()
+
+    def close(self):
+        """Close the spill file; an unsent backlog (memory included) is kept there for the next run"""
+        with self._lock:
+            if self._spill is None:
+                return
+            if self._spill_head and self._spill_count:
+                self._compact()
+            if self._memory:
+                self._append_spill(b"".join(_pack(sample) for sample in self._memory))
+                self._spill_count += len(self._memory)
+                self._memory.clear()
+            self._spill.close()
+            self._spill = None
+            if not self._spill_count:
+                os.remove(self.spill_path)
+
+
+class TokenBucket:
+    """Rate limit shared by every device of a fleet: `rate` tokens/second, bursts up to `burst`"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self._tokens = self.burst
+        self._at = time.monotonic()
+
+    def take(self, wanted):
+        """Take up to `wanted` tokens; returns how many were granted (0 = wait)"""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._at) * self.rate)
+        self._at = now
+        granted = int(min(wanted, self._tokens))
+        self._tokens -= granted
+        return granted
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Virtual ESP32 Device
+One simulated ESP32 with its own MQTT client, topic namespace, LWT,
+device state and command handler. Many instances can share one process.
+
+Actuators are table-driven (ACTUATORS): each one is a state key with its
+allowed values, and a command {"<name>": "<value>" | "toggle"} works for
+any of them. State publishes caused by commands can be coalesced: changes
+arriving within coalesce_window seconds are folded into one retained
+device/state, at most one every min_state_interval seconds, and nothing is
+published when the final state equals the last one published.
+
+A command may carry a correlation ID ({"light": "on", "cid": "..."}); the
+IDs of every command folded into a state publish are echoed back in its
+"cids" list (JSON/CBOR only; the v1 state frame has no room for them), so
+a controller can match answers to commands (common/controller.py).
+
+Report-by-exception: with a deadband ({"temp": 0.2, "hum": 1.0, ...}) a
+sample is published only when some metric has moved more than its band
+from the last reported value, or when max_silence seconds have passed
+since the last report; the state heartbeat is likewise skipped while a
+state younger than max_silence is on the broker. The device announces the
+policy in its JSON/CBOR state ("report") so the logger can tell an
+unchanged stretch from lost data.
+
+Store-and-forward: with a `backlog` (store_forward.SampleBuffer) samples
+taken while the broker is unreachable are buffered with their original
+timestamps; flush_backlog() later sends them as QoS 1 sensor/batch
+messages. New samples queue behind a non-empty backlog, so data always
+arrives in the order it was sampled.
+
+Sensor values come from `signals`, a callable returning (temp, hum, lux)
+or None while the sensor is down (signals.py: SignalModel.channel());
+without one, samples are uniform random around fixed means.
+"""
+
+import json
+import threading
+import time
+import random
+from typing import NamedTuple, Tuple
+import paho.mqtt.client as mqtt
+
+from common.controller import ACK_KEY, CID_KEY
+from common.payload import (ENCODING_JSON, ENCODING_STRUCT, MAX_BATCH, encode_sensor, encode_sensor_batch,
+                            encode_state, require_encoding, topic_for)
+
+
+class Actuator(NamedTuple):
+    """One controllable output; values[0] is the power-on state"""
+    name: str
+    label: str
+    icon: str
+    values: Tuple[str, ...] = ("off", "on")
+
+    def apply(self, current, command):
+        """New value for a command, or None if the command is not understood"""
+        if command == "toggle":
+            return self.values[(self.values.index(current) + 1) % len(self.values)]
+        if command in self.values:
+            return command
+        return None
+
+
+ACTUATORS = (
+    Actuator("light", "Light", "💡"),
+    Actuator("fan", "Fan", "🌀"),
+)
+
+
+def make_actuators(names):
+    """Actuators for a list of names; unknown names become plain on/off switches"""
+    known = {a.name: a for a in ACTUATORS}
+    return tuple(known.get(name) or Actuator(name, name.capitalize(), "🔌") for name in names)
+
+
+class VirtualDevice:
+    """A single simulated ESP32 bound to one MQTT client"""
+
+    def __init__(self, client, topic_ns, device_id, firmware, verbose=True, encoding=ENCODING_JSON,
+                 batch_count=0, batch_window=0.0, actuators=ACTUATORS, coalesce_window=0.0,
+                 min_state_interval=0.0, scheduler=None, deadband=None, max_silence=0.0,
+                 sample_interval=None, signals=None, backlog=None):
+        require_encoding(encoding)
+        self.client = client
+        self.topic_ns = topic_ns
+        self.device_id = device_id
+        self.firmware = firmware
+        self.verbose = verbose
+        self.encoding = encoding  # json / struct / cbor (common/payload.py)
+
+        # Micro-batching: samples are buffered and published as one sensor/batch
+        # message once batch_count samples are queued or the oldest is batch_window
+        # seconds old (both 0 = publish every sample on its own)
+        self.batch_count = batch_count
+        self.batch_window = batch_window
+        self._batch = []
+
+        # Device state: one key per actuator plus "online"
+        self.actuators = {a.name: a for a in actuators}
+        self.state = {a.name: a.values[0] for a in actuators}
+        self.state["online"] = True
+
+        # Command coalescing / state publish rate limit (both 0 = publish on every change).
+        # scheduler(delay, fn) runs fn later on the device's I/O thread (Fleet.call_later);
+        # without one a threading.Timer is used
+        self.coalesce_window = coalesce_window
+        self.min_state_interval = min_state_interval
+        self.scheduler = scheduler
+        self._state_lock = threading.RLock()
+        self._state_pending = False
+        self._last_state = None  # actuator values of the last state publish
+        self._last_state_at = float("-inf")
+        self._pending_acks = []  # correlation IDs answered by the next state publish
+
+        # Report-by-exception (deadband None/empty = report every sample)
+        self.deadband = dict(deadband or {})
+        self.max_silence = max_silence
+        self.sample_interval = sample_interval
+        self._last_report = None  # {metric: value} of the last reported sample
+        self._last_report_at = float("-inf")
+
+        # Sensor values: SignalModel channel, or None for uniform random samples
+        self.signals = signals
+
+        # Store-and-forward buffer for outages (None = samples taken offline are lost)
+        self.backlog = backlog
+        self.backlog_credit = 0  # samples queued behind the backlog while online (not catch-up load)
+
+        # Topics (binary encodings publish on a suffixed topic, e.g. sensor/state/bin)
+        self.cmd_topic = f"{topic_ns}/device/cmd"
+        self.state_topic = topic_for(f"{topic_ns}/device/state", encoding)
+        self.sensor_topic = topic_for(f"{topic_ns}/sensor/state", encoding)
+        self.batch_topic = topic_for(f"{topic_ns}/sensor/batch", encoding)
+        self.online_topic = f"{topic_ns}/sys/online"
+
+        # Counters
+        self.sensor_published = 0
+        self.samples_published = 0
+        self.state_published = 0
+        self.commands_received = 0
+        self.commands_coalesced = 0  # commands whose state change was folded into a later publish
+        self.samples_suppressed = 0  # samples inside the deadband, not published
+        self.samples_dropped = 0  # ticks with the sensor down (signal model dropout)
+        self.heartbeats_suppressed = 0
+
+        # Setup MQTT callbacks
+        client.on_connect = self.on_connect
+        client.on_message = self.on_message
+
+        # Set Last Will Testament
+        lwt_payload = json.dumps({"online": False})
+        client.will_set(self.online_topic, lwt_payload, qos=1, retain=True)
+
+    def log(self, message):
+        if self.verbose:
+            print(message)
+
+    def on_connect(self, client, userdata, flags, rc, properties=None):
+        if rc == 0:
+            self.log(f"✅ [{self.device_id}] Connected to MQTT broker")
+
+            # Subscribe to command topic
+            client.subscribe(self.cmd_topic, qos=1)
+            self.log(f"📡 Subscribed to: {self.cmd_topic}")
+
+            # Publish initial online status
+            self.publish_online_status(True)
+
+            # Publish initial device state
+            self.publish_device_state()
+
+        else:
+            print(f"❌ [{self.device_id}] Failed to connect to MQTT broker, code: {rc}")
+
+    def on_message(self, client, userdata, msg):
+        try:
+            topic = msg.topic
+            payload = msg.payload.decode('utf-8')
+            self.log(f"📥 Received [{topic}]: {payload}")
+
+            if topic == self.cmd_topic:
+                self.handle_device_command(payload)
+
+        except Exception as e:
+            print(f"❌ [{self.device_id}] Error handling message: {e}")
+
+    def handle_device_command(self, payload):
+        """Handle device control commands"""
+        try:
+            cmd = json.loads(payload)
+        except json.JSONDecodeError as e:
+            print(f"❌ [{self.device_id}] Invalid JSON command: {e}")
+            return
+
+        with self._state_lock:
+            self.commands_received += 1
+            cid = cmd.pop(CID_KEY, None)
+            if cid is not None and self.encoding != ENCODING_STRUCT:
+                self._pending_acks.append(cid)
+            state_changed = False
+            for name, command in cmd.items():
+                actuator = self.actuators.get(name)
+                if actuator is None:
+                    continue
+                value = actuator.apply(self.state[name], command)
+                if value is None:
+                    continue
+                self.state[name] = value
+                state_changed = True
+                self.log(f"{actuator.icon} {actuator.label}: {value.upper()}")
+
+            # A command with an ID is always answered, even if it changed nothing
+            if state_changed or cid is not None:
+                self.request_state_publish()
+
+    def request_state_publish(self):
+        """Publish the state now, or once the coalescing window / rate limit allows"""
+        with self._state_lock:
+            if self._state_pending:
+                self.commands_coalesced += 1
+                return
+            now = time.monotonic()
+            delay = max(self.coalesce_window, self._last_state_at + self.min_state_interval - now)
+            if delay <= 0:
+                self.publish_device_state()
+                return
+            self._state_pending = True
+        if self.scheduler is not None:
+            self.scheduler(delay, self._flush_state)
+        else:
+            timer = threading.Timer(delay, self._flush_state)
+            timer.daemon = True
+            timer.start()
+
+    def _flush_state(self):
+        with self._state_lock:
+            if not self._state_pending:
+                return  # a heartbeat published the state meanwhile
+            self._state_pending = False
+            if self._actuator_values() == self._last_state and not self._pending_acks:
+                return  # the burst cancelled itself out (e.g. toggle, toggle)
+            if self.client.is_connected():
+                self.publish_device_state()
+
+    def _actuator_values(self):
+        return tuple(self.state[name] for name in self.actuators)
+
+    @property
+    def batching(self):
+        return bool(self.batch_count or self.batch_window)
+
+    @property
+    def report_by_exception(self):
+        return bool(self.deadband)
+
+    def report_policy(self):
+        """The "report" object announced in device/state"""
+        return {"deadband": self.deadband, "max_silence": self.max_silence, "interval": self.sample_interval}
+
+    def _should_report(self, values):
+        """Deadband check; records the sample as reported when it passes"""
+        now = time.monotonic()
+        last = self._last_report
+        if (last is not None and now - self._last_report_at < (self.max_silence or float("inf"))
+                and all(abs(values[m] - last[m]) <= band for m, band in self.deadband.items() if m in values)):
+            return False
+        self._last_report = values
+        self._last_report_at = now
+        return True
+
+    def heartbeat(self):
+        """Periodic state publish; skipped while report-by-exception keeps the retained state fresh"""
+        if self.report_by_exception and time.monotonic() - self._last_state_at < (self.max_silence or float("inf")):
+            self.heartbeats_suppressed += 1
+            return
+        self.publish_device_state()
+
+    def publish_sensor_data(self):
+        """Publish simulated sensor data (or queue it when batching)"""
+        if self.signals is not None:
+            sample = self.signals()
+            if sample is None:
+                self.samples_dropped += 1
+                return
+            temp_c, hum_pct, lux = sample
+        else:
+            # Generate fake sensor readings
+            temp_c = round(20.0 + random.uniform(-3, 8), 1)  # 17-28°C
+            hum_pct = round(50.0 + random.uniform(-15, 25), 1)  # 35-75%
+            lux = random.randint(50, 300)  # 50-300 lux
+        now = time.time()
+
+        if self.report_by_exception and not self._should_report({"temp": temp_c, "hum": hum_pct, "lux": lux}):
+            self.samples_suppressed += 1
+            return
+
+        if self.backlog is not None and (self.backlog or not self.client.is_connected()):
+            self.store_samples([(now, temp_c, hum_pct, lux)])
+            return
+
+        if self.batching:
+            self._batch.append((now, temp_c, hum_pct, lux))
+            if (len(self._batch) >= min(self.batch_count or MAX_BATCH, MAX_BATCH)
+                    or (self.batch_window and now - self._batch[0][0] >= self.batch_window)):
+                self.flush_sensor_batch()
+            return
+
+        payload = encode_sensor(self.encoding, now, temp_c, hum_pct, lux)
+        result = self.client.publish(self.sensor_topic, payload, qos=0)
+
+        if result.rc == mqtt.MQTT_ERR_SUCCESS:
+            self.sensor_published += 1
+            self.samples_published += 1
+            self.log(f"🌡️  Sensor: {temp_c}°C, {hum_pct}%, {lux}lux")
+        elif self.backlog is not None:
+            self.store_samples([(now, temp_c, hum_pct, lux)])
+        else:
+            print(f"❌ [{self.device_id}] Failed to publish sensor data")
+
+    def flush_sensor_batch(self):
+        """Publish the queued samples as one batch message"""
+        if not self._batch:
+            return
+        samples, self._batch = self._batch, []
+        payload = encode_sensor_batch(self.encoding, samples)
+        result = self.client.publish(self.batch_topic, payload, qos=0)
+
+        if result.rc == mqtt.MQTT_ERR_SUCCESS:
+            self.sensor_published += 1
+            self.samples_published += len(samples)
+            self.log(f"🌡️  Sensor batch: {len(samples)} samples, {len(payload)} bytes")
+        elif self.backlog is not None:
+            self.store_samples(samples)
+        else:
+            print(f"❌ [{self.device_id}] Failed to publish sensor batch ({len(samples)} samples)")
+
+    def store_samples(self, samples):
+        """Queue samples in the store-and-forward backlog (after any half-filled batch)"""
+        if self._batch:
+            pending, self._batch = self._batch, []
+            for sample in pending:
+                self.backlog.append(sample)
+        for sample in samples:
+            self.backlog.append(sample)
+        if self.client.is_connected():
+            self.backlog_credit += len(samples)
+
+    def flush_backlog(self, max_samples):
+        """Send up to max_samples of the backlog as one QoS 1 batch; returns how many were sent"""
+        samples = self.backlog.peek(min(max_samples, MAX_BATCH))
+        if not samples:
+            return 0
+        payload = encode_sensor_batch(self.encoding, samples)
+        result = self.client.publish(self.batch_topic, payload, qos=1)
+        if result.rc != mqtt.MQTT_ERR_SUCCESS:
+            return 0
+        self.backlog.drop(len(samples))
+        self.backlog_credit = max(0, self.backlog_credit - len(samples)) if self.backlog else 0
+        self.sensor_published += 1
+        self.samples_published += len(samples)
+        self.log(f"📦 Backlog: sent {len(samples)} buffered samples, {len(self.backlog)} left")
+        return len(samples)
+
+    def publish_device_state(self):
+        """Publish device state (retained)"""
+        # Simulate WiFi RSSI
+        rssi = random.randint(-70, -40)  # -70 to -40 dBm
+
+        with self._state_lock:
+            # Take the pending work before publishing: on the loopback broker the publish
+            # may deliver another command to this device re-entrantly, which then queues
+            # its own ID and state publish
+            acks, self._pending_acks = self._pending_acks, []
+            self._state_pending = False
+            values = self._actuator_values()
+            extra = {name: self.state[name] for name in self.actuators if name not in ("light", "fan")}
+            if acks:
+                extra[ACK_KEY] = acks
+            if self.report_by_exception:
+                extra["report"] = self.report_policy()
+            payload = encode_state(self.encoding, time.time(), self.state.get("light", "off"),
+                                   self.state.get("fan", "off"), rssi, self.firmware, extra)
+            result = self.client.publish(self.state_topic, payload, qos=1, retain=True)
+            if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                self._last_state = values
+                self._last_state_at = time.monotonic()
+            else:
+                self._pending_acks = acks + self._pending_acks  # answered by the next publish
+
+        if result.rc == mqtt.MQTT_ERR_SUCCESS:
+            self.state_published += 1
+            values = ", ".join(f"{a.label}={self.state[n]}" for n, a in self.actuators.items())
+            self.log(f"📊 Device state: {values}, RSSI={rssi}dBm")
+        else:
+            print(f"❌ [{self.device_id}] Failed to publish device state")
+
+    def publish_online_status(self, online):
+        """Publish online status (retained)"""
+        self.state["online"] = online
+        data = {"online": online}
+        payload = json.dumps(data)
+        result = self.client.publish(self.online_topic, payload, qos=1, retain=True)
+
+        if result.rc == mqtt.MQTT_ERR_SUCCESS:
+            self.log(f"🟢 Online status: {online}")
+        else:
+            print(f"❌ [{self.device_id}] Failed to publish online status")
@@ -4,11 +4,17 @@ Comprehensive IoT System Test
 Tests all components and MQTT synchronization
 """
 
-import paho.mqtt.client as mqtt
+import argparse
 import json
+import os
+import sys
+import tempfile
 import time
 import threading
-import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.transport import TRANSPORT_LOOPBACK, add_transport_args, create_client  # noqa: E402
 
 # Configuration
 BROKER_HOST = "broker.hivemq.com"
@@ -18,12 +24,18 @@ WEB_DASHBOARD = "http://localhost:3000/index.html"
 FLUTTER_APP = "http://localhost:8080/index.html"
 
 class IoTSystemTester:
-    def __init__(self):
+    def __init__(self, transport=None, broker=BROKER_HOST, port=BROKER_PORT,
+                 command_wait=3, monitor_seconds=30):
+        self.transport = transport
+        self.broker = broker
+        self.port = port
+        self.command_wait = command_wait
+        self.monitor_seconds = monitor_seconds
         self.client = None
         self.received_messages = []
         self.connected = False
         
-    def on_connect(self, client, userdata, flags, rc):
+    def on_connect(self, client, userdata, flags, rc, properties=None):
         if rc == 0:
             self.connected = True
             print("✅ Test client connected to MQTT broker")
@@ -50,6 +62,7 @@ class IoTSystemTester:
     def test_web_interfaces(self):
         """Test if web interfaces are accessible"""
         print("\n🌐 Testing Web Interfaces...")
+        import requests
         
         try:
             response = requests.head(WEB_DASHBOARD, timeout=5)
@@ -73,12 +86,12 @@ class IoTSystemTester:
         """Test MQTT connection and subscription"""
         print("\n📡 Testing MQTT Connection...")
         
-        self.client = mqtt.Client(client_id=f"system_tester_{int(time.time())}")
+        self.client = create_client(f"system_tester_{int(time.time())}", self.transport)
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
         
         try:
-            self.client.connect(BROKER_HOST, BROKER_PORT, 60)
+            self.client.connect(self.broker, self.port, 60)
             self.client.loop_start()
             
             # Wait for connection
@@ -124,7 +137,7 @@ class IoTSystemTester:
             self.client.publish(topic, payload)
             
             # Wait for response
-            time.sleep(3)
+            time.sleep(self.command_wait)
             
         print(f"📊 Total messages received during test: {len(self.received_messages)}")
         
@@ -132,12 +145,12 @@ class IoTSystemTester:
         """Test data flow and state updates"""
         print("\n📊 Testing Data Flow...")
         
-        # Listen for messages for 30 seconds
-        print("🔍 Monitoring MQTT messages for 30 seconds...")
+        # Listen for messages
+        print(f"🔍 Monitoring MQTT messages for {self.monitor_seconds} seconds...")
         start_time = time.time()
         initial_count = len(self.received_messages)
         
-        while time.time() - start_time < 30:
+        while time.time() - start_time < self.monitor_seconds:
             time.sleep(1)
             current_count = len(self.received_messages)
             if current_count > initial_count:
@@ -163,7 +176,7 @@ class IoTSystemTester:
         print("="*50)
         
         print(f"🕒 Test completed at: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"📡 MQTT Broker: {BROKER_HOST}")
+        print(f"📡 MQTT Broker: {self.broker if self.transport != TRANSPORT_LOOPBACK else 'in-process loopback'}")
         print(f"🏠 Topic Namespace: {TOPIC_NAMESPACE}")
         print(f"📱 Total MQTT messages captured: {len(self.received_messages)}")
         
@@ -179,8 +192,9 @@ class IoTSystemTester:
         print("🚀 Starting Comprehensive IoT System Test...")
         print(f"⏰ Test started at: {time.strftime('%Y-%m-%d %H:%M:%S')}")
         
-        # Test web interfaces
-        self.test_web_interfaces()
+        # Test web interfaces (not served in an offline loopback run)
+        if self.transport != TRANSPORT_LOOPBACK:
+            self.test_web_interfaces()
         
         # Test MQTT connection
         if self.test_mqtt_connection():
@@ -199,5 +213,29 @@ class IoTSystemTester:
             self.client.disconnect()
 
 if __name__ == "__main__":
-    tester = IoTSystemTester()
-    tester.run_full_test()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Comprehensive IoT system test")
+    add_transport_args(parser, BROKER_HOST, BROKER_PORT)
+    parser.add_argument("--command-wait", type=float, default=3,
+                        help="seconds to wait for a response after each command")
+    parser.add_argument("--monitor-seconds", type=float, default=30,
+                        help="how long the data flow test listens")
+    args = parser.parse_args()
+
+    logger = None
+    if args.transport == TRANSPORT_LOOPBACK:
+        # Offline: run the ESP32 simulator and the logger in this process too
+        import inprocess
+        print("🧪 Loopback mode: starting in-process ESP32 simulator and MQTT logger")
+        fleet, _ = inprocess.start_devices([TOPIC_NAMESPACE])
+        log_dir = tempfile.mkdtemp(prefix="iot_test_")
+        logger, logger_thread = inprocess.start_logger(os.path.join(log_dir, "iot_log.csv"))
+
+    tester = IoTSystemTester(args.transport, args.broker, args.port,
+                             command_wait=args.command_wait,
+                             monitor_seconds=args.monitor_seconds)
+    tester.run_full_test()
+
+    if logger is not None:
+        logger.stop()
+        logger_thread.join(5)
+        fleet.stop()
\ No newline at end of file
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+In-process System Helpers
+Start the ESP32 simulator and the MQTT logger inside the current process,
+wired to the loopback broker, so the test scripts can exercise the whole
+system offline with --transport loopback.
+"""
+
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "simulators"))
+sys.path.insert(0, os.path.join(ROOT, "Data"))
+
+from common.transport import TRANSPORT_LOOPBACK, create_client  # noqa: E402
+from fleet import Fleet  # noqa: E402
+
+DEVICE_ID = "esp32_simulator"
+FIRMWARE_VERSION = "sim-1.0.0"
+
+
+def start_devices(namespaces, publish_interval=3.0, heartbeat_interval=15.0, verbose=False,
+                  encodings=("json",)):
+    """Run one virtual device per namespace on a background fleet thread
+
+    Payload encodings are assigned round-robin across the devices.
+    """
+    fleet = Fleet(None, None, publish_interval=publish_interval,
+                  heartbeat_interval=heartbeat_interval, status_interval=0,
+                  client_factory=lambda client_id: create_client(client_id, TRANSPORT_LOOPBACK))
+    for n, ns in enumerate(namespaces):
+        device_id = DEVICE_ID if len(namespaces) == 1 else f"{DEVICE_ID}_{n:04d}"
+        fleet.add_device(ns, device_id, FIRMWARE_VERSION, verbose=verbose,
+                         encoding=encodings[n % len(encodings)])
+    thread = threading.Thread(target=fleet.run, name="inprocess-fleet", daemon=True)
+    thread.start()
+
+    deadline = time.monotonic() + 5
+    while not all(d.client.is_connected() for d in fleet.devices) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return fleet, thread
+
+
+def start_logger(csv_path, extra_args=()):
+    """Run Data/server.py's logger on a background thread; stop with server.stop()"""
+    import server
+
+    argv = ["--transport", TRANSPORT_LOOPBACK, "--csv", csv_path, *extra_args]
+    thread = threading.Thread(target=server.main, args=(argv,), name="inprocess-logger", daemon=True)
+    thread.start()
+
+    deadline = time.monotonic() + 5
+    while not (server.client is not None and server.client.is_connected()) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return server, thread
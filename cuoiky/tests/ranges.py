@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Range Query Test Helpers
+Out-of-order sample streams (device batches backfilled after newer rows)
+and a check that a storage backend's time-range query returns exactly what
+filtering every sample would.
+"""
+
+import os
+import random
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "Data"))
+
+from records import Reading, parse_time  # noqa: E402
+
+BASE = parse_time("2025-10-30 20:00:00")
+
+
+def out_of_order_readings(count=600, seed=7):
+    """Live samples every second, with device batches backfilled up to 5 minutes late"""
+    rng = random.Random(seed)
+    readings = []
+    for i in range(count):
+        readings.append(Reading(BASE + i, "demo/room1", 20.0 + i % 7, 50.0))
+        if i % 97 == 96:
+            late = rng.randint(30, 300)
+            readings.extend(Reading(BASE + i - late + k, "demo/room2", 18.0, 40.0) for k in range(5))
+    return readings
+
+
+def check_ranges(query, readings, ranges=100, seed=3):
+    """Compare a range query against filtering every reading"""
+    rng = random.Random(seed)
+    stamps = sorted(r.ts for r in readings)
+    for _ in range(ranges):
+        start = rng.uniform(stamps[0] - 10, stamps[-1] + 10)
+        end = start + rng.uniform(0, 120)
+        expected = sorted(r.ts for r in readings if start <= r.ts < end)
+        got = sorted(r.ts for r in query(start, end))
+        assert got == expected, (start - BASE, end - BASE, len(got), len(expected))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Binary Log Tests
+Device table, CSV export/import and range queries of Data/binlog.py,
+runnable with pytest or directly:
+
+    python -m pytest -q tests/test_binlog.py
+    python tests/test_binlog.py
+"""
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "Data"))
+
+from binlog import BinaryLogReader, BinaryLogSink, DeviceTable, export_csv, import_csv  # noqa: E402
+from ranges import BASE, check_ranges, out_of_order_readings  # noqa: E402
+from records import CSV_HEADER, Reading, iter_csv_readings  # noqa: E402
+
+
+def test_device_table_limit():
+    # Codes are stored in a uint16: 0xFFFF is the last one handed out
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "log.bin.devices")
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(f"dev{i}\n" for i in range(0xFFFF))
+        table = DeviceTable(path)
+        assert table.code("last") == 0xFFFF
+        assert table.code("dev0") == 0
+        try:
+            table.code("one-too-many")
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("code 0x10000 does not fit the binlog record")
+        assert "one-too-many" not in DeviceTable(path).codes
+
+
+def test_binlog_export_import_round_trip():
+    readings = [Reading(BASE + i, f"demo/room{i % 3}", 20.5 + i, 50.0 - i, "on" if i % 2 else "off", "off")
+                for i in range(10)]
+    readings.append(Reading(BASE + 10, "demo/room9", None, 40.0))  # temperature not reported
+    with tempfile.TemporaryDirectory() as tmp:
+        first, exported, second = (os.path.join(tmp, name) for name in ("a.bin", "a.csv", "b.bin"))
+        with BinaryLogSink(first) as sink:
+            sink.write_readings(readings)
+        assert export_csv(first, exported) == len(readings)
+        with open(exported, encoding="utf-8") as f:
+            assert f.readline().rstrip("\r\n").split(",") == CSV_HEADER
+        assert list(iter_csv_readings(exported)) == readings
+        assert import_csv(exported, second) == len(readings)
+        with BinaryLogReader(second) as reader:
+            assert list(reader.iter_readings()) == readings
+
+
+def test_binlog_range_matches_full_scan():
+    readings = out_of_order_readings()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "iot_log.bin")
+        with BinaryLogSink(path) as sink:
+            half = len(readings) // 2
+            sink.write_readings(readings[:half])
+        with BinaryLogSink(path) as sink:  # reopened: lateness carried over from the header
+            sink.write_readings(readings[half:])
+        with BinaryLogReader(path) as reader:
+            assert reader.lateness_ms > 0
+            check_ranges(reader.iter_range, readings)
+
+
+def main():
+    tests = [(name, fn) for name, fn in sorted(globals().items()) if name.startswith("test_")]
+    for name, fn in tests:
+        fn()
+        print(f"✅ {name}")
+    print(f"🎉 {len(tests)} tests passed")
+
+
+if __name__ == "__main__":
+    main()
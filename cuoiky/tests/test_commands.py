@@ -2,42 +2,58 @@
 """
 Manual MQTT Test Client
 Send manual commands to test the IoT system
+(one persistent session for every command, each sent with QoS 1 and
+confirmed by its PUBACK; see dispatch_commands.py for bulk sends)
 """
 
+import argparse
 import json
-import paho.mqtt.client as mqtt
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.publisher import PooledPublisher  # noqa: E402
+from common.transport import TRANSPORT_LOOPBACK, add_transport_args, create_client  # noqa: E402
 
 # Configuration
 MQTT_BROKER = "broker.hivemq.com"
 MQTT_PORT = 1883
 TOPIC_NS = "demo/room1"
 
-def send_command(command_dict):
-    """Send a single command to the device"""
-    client = mqtt.Client()
-    
+def send_command(command_dict, publisher, timeout=10.0):
+    """Send a single command to the device and wait for the broker's PUBACK"""
+    payload = json.dumps(command_dict)
     try:
-        print(f"🔄 Connecting to {MQTT_BROKER}...")
-        client.connect(MQTT_BROKER, MQTT_PORT, 60)
-        
-        topic = f"{TOPIC_NS}/device/cmd"
-        payload = json.dumps(command_dict)
-        
-        result = client.publish(topic, payload, qos=1)
-        
-        if result.rc == mqtt.MQTT_ERR_SUCCESS:
+        publisher.publish(f"{TOPIC_NS}/device/cmd", payload)
+        if publisher.wait_all(timeout) and not publisher.failed:
             print(f"✅ Sent command: {payload}")
         else:
             print(f"❌ Failed to send command")
-            
-        client.disconnect()
-        
     except Exception as e:
         print(f"❌ Error: {e}")
 
 def main():
+    parser = argparse.ArgumentParser(description="Manual MQTT command tester")
+    add_transport_args(parser, MQTT_BROKER, MQTT_PORT)
+    args = parser.parse_args()
+
     print("🎛️ Manual MQTT Command Tester")
     print("=" * 40)
+
+    if args.transport == TRANSPORT_LOOPBACK:
+        # Offline: run the ESP32 simulator in this process so commands get handled
+        import inprocess
+        inprocess.start_devices([TOPIC_NS], verbose=True)
+
+    publisher = PooledPublisher(sessions=1,
+                                client_factory=lambda client_id: create_client(client_id, args.transport),
+                                client_id_prefix="test_commands")
+    try:
+        print(f"🔄 Connecting to {args.broker}...")
+        publisher.connect(args.broker, args.port)
+    except Exception as e:
+        raise SystemExit(f"❌ Error: {e}")
     
     commands = [
         {"light": "toggle"},
@@ -49,10 +65,11 @@ def main():
     
     for i, cmd in enumerate(commands, 1):
         print(f"\n{i}. Sending: {json.dumps(cmd)}")
-        send_command(cmd)
+        send_command(cmd, publisher)
         
         input("Press Enter to continue...")
     
+    publisher.close()
     print("\n✅ All test commands sent!")
 
 if __name__ == "__main__":
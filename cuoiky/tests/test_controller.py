@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Async Controller Tests
+common/controller.py's AsyncController against stub devices on a private
+loopback broker: correlation IDs, coalesced answers, the in-flight window
+and timeouts. Runnable with pytest or directly:
+
+    python -m pytest -q tests/test_controller.py
+    python tests/test_controller.py
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from common import loopback  # noqa: E402
+from common.controller import ACK_KEY, CID_KEY, AsyncController, CommandTimeout  # noqa: E402
+
+
+class StubDevices:
+    """Answers commands of the given namespaces, `coalesce` commands per device/state"""
+
+    def __init__(self, broker, namespaces, coalesce=1):
+        self.namespaces = set(namespaces)
+        self.coalesce = coalesce
+        self.pending = {}  # namespace -> [cid, ...]
+        self.light = {}
+        self.client = loopback.Client("stub-devices", broker=broker)
+        self.client.on_message = self.on_message
+        self.client.connect()
+        self.client.subscribe("+/+/device/cmd", qos=1)
+
+    def on_message(self, client, userdata, msg):
+        ns = msg.topic.rsplit("/device/cmd", 1)[0]
+        if ns not in self.namespaces:
+            return  # offline device
+        command = json.loads(msg.payload)
+        self.light[ns] = command.get("light", self.light.get(ns, "off"))
+        cids = self.pending.setdefault(ns, [])
+        cids.append(command[CID_KEY])
+        if len(cids) >= self.coalesce:
+            self.pending[ns] = []
+            state = {"light": self.light[ns], ACK_KEY: cids}
+            client.publish(f"{ns}/device/state", json.dumps(state), qos=1)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_command_returns_answering_state():
+    broker = loopback.LoopbackBroker()
+    StubDevices(broker, ["demo/room1"])
+    # A retained state from before is a snapshot, not an answer
+    broker.publish("demo/room1/device/state", json.dumps({"light": "off", ACK_KEY: ["stale"]}), 1, True)
+
+    async def scenario():
+        async with AsyncController(loopback.Client("controller", broker=broker), timeout=2) as controller:
+            await controller.connect(None, None)
+            state = await controller.command("demo/room1", {"light": "on"})
+            return state, controller
+
+    state, controller = run(scenario())
+    assert state["light"] == "on" and len(state[ACK_KEY]) == 1
+    assert (controller.sent, controller.answered, controller.timeouts, controller.in_flight) == (1, 1, 0, 0)
+
+
+def test_coalesced_answers_and_window():
+    broker = loopback.LoopbackBroker()
+    rooms = [f"fleet/room{n}" for n in range(10)]
+    StubDevices(broker, rooms, coalesce=2)  # one state answers two commands
+
+    async def scenario():
+        async with AsyncController(loopback.Client("controller", broker=broker), window=8, timeout=2) as controller:
+            await controller.connect(None, None)
+            # A device's two commands are adjacent so the window never holds only half-answered pairs
+            commands = [(ns, {"light": light}) for ns in rooms for light in ("on", "off")]
+            return await controller.command_many(commands), controller
+
+    states, controller = run(scenario())
+    assert all(isinstance(s, dict) for s in states), states
+    assert [s["light"] for s in states] == ["off"] * 20  # both answered by the state after "off"
+    assert controller.answered == 20 and controller.in_flight_high_watermark <= 8
+
+
+def test_unanswered_command_times_out():
+    broker = loopback.LoopbackBroker()
+    StubDevices(broker, ["demo/room1"])
+
+    async def scenario():
+        async with AsyncController(loopback.Client("controller", broker=broker), timeout=0.2) as controller:
+            await controller.connect(None, None)
+            results = await controller.command_many([("demo/room1", {"light": "on"}),
+                                                     ("demo/offline", {"light": "on"})])
+            return results, controller
+
+    (answered, missing), controller = run(scenario())
+    assert answered["light"] == "on"
+    assert isinstance(missing, CommandTimeout) and missing.namespace == "demo/offline"
+    assert (controller.timeouts, controller.in_flight) == (1, 0)
+
+
+def main():
+    tests = [(name, fn) for name, fn in sorted(globals().items()) if name.startswith("test_")]
+    for name, fn in tests:
+        fn()
+        print(f"✅ {name}")
+    print(f"🎉 {len(tests)} tests passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Write-Behind Sink Tests
+Error handling of Data/csv_sink.py's flusher: I/O errors keep the batch for
+a retry, rows that can never be written are dropped and counted. Runnable
+with pytest or directly:
+
+    python -m pytest -q tests/test_csv_sink.py
+    python tests/test_csv_sink.py
+"""
+
+import errno
+import os
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "Data"))
+
+from binlog import BinaryLogReader, BinaryLogSink  # noqa: E402
+from csv_sink import WriteBehindCSVSink  # noqa: E402
+from records import CSV_HEADER, Reading, iter_csv_readings, parse_time  # noqa: E402
+
+BASE = parse_time("2025-10-30 20:00:00")
+
+
+class FlakyCSVSink(WriteBehindCSVSink):
+    """CSV sink whose first `failures` batch writes fail with ENOSPC"""
+
+    def __init__(self, path, failures, **kwargs):
+        self.failures = failures
+        super().__init__(path, **kwargs)
+
+    def _write_items(self, items):
+        if self.failures:
+            self.failures -= 1
+            raise OSError(errno.ENOSPC, "No space left on device")
+        super()._write_items(items)
+
+
+def test_io_error_keeps_batch():
+    readings = [Reading(BASE + i, "demo/room1", 20.0, 50.0) for i in range(20)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "iot_log.csv")
+        sink = FlakyCSVSink(path, failures=1, header=CSV_HEADER)
+        sink.write_readings(readings[:10])
+        try:
+            sink.flush()
+        except OSError:
+            pass
+        else:
+            raise AssertionError("flush() should re-raise the I/O error")
+        assert sink.pending() == 10
+        sink.write_readings(readings[10:])
+        sink.close()
+        assert sink.write_errors == 1 and sink.rows_rejected == 0
+        assert list(iter_csv_readings(path)) == readings
+
+
+def test_unwritable_rows_are_rejected():
+    # The binlog's device table is full: rows of a new device can never be written
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "iot_log.bin")
+        with open(path + ".devices", "w", encoding="utf-8") as f:
+            f.writelines(f"dev{i}\n" for i in range(0x10000))
+        good = [Reading(BASE + i, f"dev{i}", 20.0, 50.0) for i in range(6)]
+        bad = Reading(BASE + 3.5, "one-too-many", 20.0, 50.0)
+        with BinaryLogSink(path, flush_interval=0.05) as sink:
+            sink.write_readings(good[:3] + [bad] + good[3:])
+            sink.flush()
+            sink.write_readings(good)  # later batches are not held up
+        assert sink.rows_rejected == 1 and sink.rows_written == 12
+        assert isinstance(sink.last_error, ValueError)
+        with BinaryLogReader(path) as reader:
+            assert list(reader.iter_readings()) == good + good
+
+
+def main():
+    tests = [(name, fn) for name, fn in sorted(globals().items()) if name.startswith("test_")]
+    for name, fn in tests:
+        fn()
+        print(f"✅ {name}")
+    print(f"🎉 {len(tests)} tests passed")
+
+
+if __name__ == "__main__":
+    main()
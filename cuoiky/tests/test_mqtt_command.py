@@ -4,16 +4,22 @@ Test MQTT Command Script
 Test sending commands to ESP32 simulator
 """
 
-import paho.mqtt.client as mqtt
+import argparse
 import json
+import os
+import sys
 import time
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.transport import TRANSPORT_LOOPBACK, add_transport_args, create_client  # noqa: E402
+
 # MQTT Configuration
 BROKER_HOST = "broker.hivemq.com"
 BROKER_PORT = 1883
 TOPIC_NAMESPACE = "demo/room1"
 
-def on_connect(client, userdata, flags, rc):
+def on_connect(client, userdata, flags, rc, properties=None):
     if rc == 0:
         print("✅ Connected to MQTT broker")
         # Send test command to toggle light
@@ -42,16 +48,25 @@ def on_publish(client, userdata, mid):
     print(f"✅ Command published (message ID: {mid})")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MQTT command test")
+    add_transport_args(parser, BROKER_HOST, BROKER_PORT)
+    args = parser.parse_args()
+
     print("🚀 MQTT Command Test Starting...")
+
+    if args.transport == TRANSPORT_LOOPBACK:
+        # Offline: run the ESP32 simulator in this process so commands get handled
+        import inprocess
+        inprocess.start_devices([TOPIC_NAMESPACE], verbose=True)
     
     # Create MQTT client
-    client = mqtt.Client(client_id=f"test_commander_{int(time.time())}")
+    client = create_client(f"test_commander_{int(time.time())}", args.transport)
     client.on_connect = on_connect
     client.on_publish = on_publish
     
     # Connect and run
-    print(f"🔄 Connecting to {BROKER_HOST}...")
-    client.connect(BROKER_HOST, BROKER_PORT, 60)
+    print(f"🔄 Connecting to {args.broker}...")
+    client.connect(args.broker, args.port, 60)
     client.loop_forever()
     
     print("✅ Test completed!")
\ No newline at end of file
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Partitioned Log Tests
+Per-device, per-day partitions of Data/partitions.py and their range
+queries, runnable with pytest or directly:
+
+    python -m pytest -q tests/test_partitions.py
+    python tests/test_partitions.py
+"""
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "Data"))
+
+from partitions import PartitionedSink, iter_device  # noqa: E402
+from ranges import BASE, check_ranges, out_of_order_readings  # noqa: E402
+from records import Reading  # noqa: E402
+
+
+def test_partition_range_matches_full_scan():
+    readings = [r for r in out_of_order_readings() if r.device == "demo/room1"]
+    readings += [Reading(BASE + 30, "demo/room1", 17.0, 40.0)]  # backfilled after newer samples
+    with tempfile.TemporaryDirectory() as tmp:
+        with PartitionedSink(tmp) as sink:
+            sink.write_readings(readings)
+        check_ranges(lambda s, e: iter_device(tmp, "demo/room1", s, e), readings)
+
+
+def main():
+    tests = [(name, fn) for name, fn in sorted(globals().items()) if name.startswith("test_")]
+    for name, fn in tests:
+        fn()
+        print(f"✅ {name}")
+    print(f"🎉 {len(tests)} tests passed")
+
+
+if __name__ == "__main__":
+    main()
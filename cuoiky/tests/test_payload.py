@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Payload Codec Tests
+Round trips of common/payload.py's struct frames and JSON/CBOR documents,
+both through its own decoders and through the logger's schema registry
+(Data/schemas.py). Runnable with pytest or directly:
+
+    python -m pytest -q tests/test_payload.py
+    python tests/test_payload.py
+"""
+
+import json
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "Data"))
+
+from common.payload import (BATCH_FRAME, BATCH_SAMPLE, ENCODING_CBOR, ENCODING_JSON,  # noqa: E402
+                            ENCODING_STRUCT, SENSOR_FRAME, cbor2, decode, decode_sensor_batch_frame,
+                            decode_sensor_frame, decode_state_frame, encode_sensor, encode_sensor_batch,
+                            encode_state, payload_encoding, split_topic, topic_for)
+from schemas import SchemaRegistry  # noqa: E402
+
+TS = 1761854400.0
+SAMPLES = [
+    (TS + 0.125, 23.45, 56.7, 120),
+    (TS + 3.5, -4.2, None, None),     # humidity and light not reported
+    (TS + 7.001, None, 100.0, 0),
+    (TS + 60.25, 327.67, 0.0, 65535),  # limits of the 0.01-unit fields
+]
+
+
+def _encodings():
+    return (ENCODING_JSON, ENCODING_STRUCT) + ((ENCODING_CBOR,) if cbor2 is not None else ())
+
+
+def _wire(payload):
+    """What a subscriber receives: JSON documents arrive as bytes too"""
+    return payload.encode() if isinstance(payload, str) else payload
+
+
+def test_sensor_frame_round_trip():
+    payload = encode_sensor(ENCODING_STRUCT, TS, 23.45, 56.7, 120)
+    assert len(payload) == SENSOR_FRAME.size and payload_encoding(payload) == ENCODING_STRUCT
+    assert decode_sensor_frame(payload) == (int(TS), 23.45, 56.7, 120)
+    assert decode_sensor_frame(encode_sensor(ENCODING_STRUCT, TS, None, 40.0)) == (int(TS), None, 40.0, None)
+    # Out-of-range values are clipped to the field, not wrapped
+    assert decode_sensor_frame(encode_sensor(ENCODING_STRUCT, TS, 400.0, -5.0, 70000)) == (int(TS), 327.67, 0.0, 65535)
+
+
+def test_batch_frame_round_trip():
+    payload = encode_sensor_batch(ENCODING_STRUCT, SAMPLES)
+    assert len(payload) == BATCH_FRAME.size + len(SAMPLES) * BATCH_SAMPLE.size
+    assert decode_sensor_batch_frame(payload) == SAMPLES  # millisecond timestamps survive
+    assert decode_sensor_batch_frame(encode_sensor_batch(ENCODING_STRUCT, [])) == []
+    try:
+        decode_sensor_batch_frame(payload[:-1])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("a truncated batch frame must be rejected")
+
+
+def test_state_frame_round_trip():
+    payload = encode_state(ENCODING_STRUCT, TS, "on", "off", -67, "sim-1.0.0")
+    assert decode_state_frame(payload) == (int(TS), "on", "off", -67, "sim-1.0.0")
+    assert decode(payload) == {"ts": int(TS), "light": "on", "fan": "off", "rssi": -67, "fw": "sim-1.0.0"}
+
+
+def test_documents_round_trip():
+    for encoding in _encodings():
+        single = _wire(encode_sensor(encoding, TS, 23.45, 56.7, 120))
+        assert payload_encoding(single) == encoding
+        assert decode(single) == {"ts": int(TS), "temp_c": 23.45, "hum_pct": 56.7, "lux": 120}
+        batch = decode(_wire(encode_sensor_batch(encoding, SAMPLES)))
+        assert [(s["ts"], s["temp_c"], s["hum_pct"], s["lux"]) for s in batch] == SAMPLES
+
+
+def test_topic_suffixes():
+    for encoding in _encodings():
+        assert split_topic(topic_for("demo/room1/sensor/state", encoding)) == ("demo/room1/sensor/state", encoding)
+
+
+def test_logger_decodes_every_encoding():
+    # The logger's path: single samples take the receive time, batch samples their own ts
+    registry = SchemaRegistry()
+    received = TS + 100
+    for encoding in _encodings():
+        single = _wire(encode_sensor(encoding, TS, 23.45, 56.7, 120))
+        topic = topic_for("demo/room1/sensor/state", encoding)
+        (reading,) = registry.decode_many(topic, single, received, "demo/room1")
+        assert (reading.ts, reading.device, reading.temp, reading.hum) == (received, "demo/room1", 23.45, 56.7)
+
+        batch = _wire(encode_sensor_batch(encoding, SAMPLES))
+        readings = registry.decode_many(topic_for("demo/room1/sensor/batch", encoding), batch, received,
+                                        "demo/room1", {"fan": "on", "light": "off"})
+        assert [(r.ts, r.temp, r.hum) for r in readings] == [(ts, temp, hum) for ts, temp, hum, _ in SAMPLES]
+        assert all((r.device, r.fan, r.light) == ("demo/room1", "on", "off") for r in readings)
+
+
+def test_json_batch_without_ts_uses_receive_time():
+    registry = SchemaRegistry()
+    payload = json.dumps([{"temp_c": 21.0, "hum_pct": 50.0}]).encode()
+    (reading,) = registry.decode_many("demo/room1/sensor/batch", payload, TS, "demo/room1")
+    assert reading.ts == TS and reading.temp == 21.0
+
+
+def main():
+    tests = [(name, fn) for name, fn in sorted(globals().items()) if name.startswith("test_")]
+    for name, fn in tests:
+        fn()
+        print(f"✅ {name}")
+    print(f"🎉 {len(tests)} tests passed")
+
+
+if __name__ == "__main__":
+    main()
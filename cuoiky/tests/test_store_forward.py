@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Store-and-Forward Buffer Tests
+Memory/spill ordering, eviction, compaction and crash resume of
+simulators/store_forward.py's SampleBuffer, runnable with pytest or directly:
+
+    python -m pytest -q tests/test_store_forward.py
+    python tests/test_store_forward.py
+"""
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "simulators"))
+
+from store_forward import SPILL_HEADER, SPILL_RECORD, SampleBuffer  # noqa: E402
+
+
+def sample(n):
+    # Values a device reports (0.1 resolution) survive the float32 spill records
+    return (1761854400.0 + n, round(20 + n % 50 / 10, 1), 55.5, n if n % 3 else None)
+
+
+def drain(buffer, batch=7):
+    out = []
+    while len(buffer):
+        samples = buffer.peek(batch)
+        out.extend(samples)
+        buffer.drop(len(samples))
+    return out
+
+
+def test_memory_only_evicts_oldest():
+    buffer = SampleBuffer(capacity=10)
+    for n in range(25):
+        buffer.append(sample(n))
+    assert len(buffer) == 10 and buffer.evicted == 15
+    assert drain(buffer) == [sample(n) for n in range(15, 25)]
+
+
+def test_spill_keeps_order():
+    with tempfile.TemporaryDirectory() as tmp:
+        buffer = SampleBuffer(capacity=10, spill_path=os.path.join(tmp, "room1.spill"), spill_capacity=1000)
+        for n in range(200):
+            buffer.append(sample(n))
+        assert buffer.spilled > 0 and buffer.evicted == 0
+        assert drain(buffer) == [sample(n) for n in range(200)]
+        buffer.close()
+        assert not os.path.exists(buffer.spill_path)
+
+
+def test_full_spill_evicts_oldest_and_compacts():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "room1.spill")
+        buffer = SampleBuffer(capacity=10, spill_path=path, spill_capacity=100)
+        for n in range(500):
+            buffer.append(sample(n))
+        assert len(buffer) <= 110 and buffer.evicted == 500 - len(buffer)
+        # The drained head never grows past half the spill capacity
+        assert os.path.getsize(path) <= SPILL_HEADER.size + 150 * SPILL_RECORD.size
+        assert drain(buffer) == [sample(n) for n in range(500 - buffer.flushed, 500)]
+        buffer.close()
+
+
+def test_resume_after_close():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "room1.spill")
+        buffer = SampleBuffer(capacity=10, spill_path=path)
+        for n in range(50):
+            buffer.append(sample(n))
+        buffer.drop(len(buffer.peek(12)))
+        buffer.close()  # memory is written to the spill as well
+        resumed = SampleBuffer(capacity=10, spill_path=path)
+        assert drain(resumed) == [sample(n) for n in range(12, 50)]
+        resumed.close()
+
+
+def test_resume_after_crash():
+    # No close(): only what reached the spill file survives, minus the dropped batches
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "room1.spill")
+        buffer = SampleBuffer(capacity=10, spill_path=path, spill_capacity=1000)
+        for n in range(100):
+            buffer.append(sample(n))
+        on_disk = len(buffer) - len(buffer._memory)
+        buffer.drop(len(buffer.peek(30)))
+        resumed = SampleBuffer(capacity=10, spill_path=path, spill_capacity=1000)
+        assert drain(resumed) == [sample(n) for n in range(30, on_disk)]
+        resumed.close()
+
+
+def test_resume_ignores_torn_record():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "room1.spill")
+        buffer = SampleBuffer(capacity=4, spill_path=path)
+        for n in range(10):
+            buffer.append(sample(n))
+        buffer.close()
+        with open(path, "ab") as f:
+            f.write(b"\x00" * (SPILL_RECORD.size // 2))  # crash in the middle of a write
+        resumed = SampleBuffer(capacity=4, spill_path=path)
+        for n in range(10, 20):  # spills again, over the torn bytes
+            resumed.append(sample(n))
+        assert drain(resumed) == [sample(n) for n in range(20)]
+        resumed.close()
+
+
+def main():
+    tests = [(name, fn) for name, fn in sorted(globals().items()) if name.startswith("test_")]
+    for name, fn in tests:
+        fn()
+        print(f"✅ {name}")
+    print(f"🎉 {len(tests)} tests passed")
+
+
+if __name__ == "__main__":
+    main()